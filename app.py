@@ -1,4 +1,5 @@
 import base64
+import io
 import json
 import math
 from datetime import datetime
@@ -9,6 +10,7 @@ from cubecana_server.pixelborn_manager import pixelborn_manager
 from cubecana_server import lcc_error
 from cubecana_server import card_evaluations
 from cubecana_server import card_list_helper
+from cubecana_server import id_helper
 from cubecana_server.settings import Settings
 from cubecana_server.cube_manager import CubecanaCube
 from cubecana_server.cube_manager import cube_manager
@@ -21,13 +23,60 @@ from cubecana_server.lorcast_api import lorcast_api as lorcana_api
 from cubecana_server.draft_manager import draft_manager
 from cubecana_server.card_evaluations import card_evaluations_manager, CardEvaluationsManager
 import traceback
-from cubecana_server import cubealytics # This is imported so it will init + generate startup report(s)
+from cubecana_server.cubealytics import cubealytics
+from cubecana_server.startup import startup
+from cubecana_server import server_timing
+
+# how long a request waits for the background startup (card data, retail sets) before giving up with a 503
+STARTUP_WAIT_TIMEOUT_SECONDS = 60
+STARTUP_EXEMPT_ENDPOINTS = ['static', 'get_readiness', 'get_stats']
 
 app = Flask(__name__)
 
 # Configure Flask to handle UTF-8 properly
 app.config['JSON_AS_ASCII'] = False
 
+# the heavy loads run on a thread pool so the worker can accept connections right away
+startup.start()
+
+@app.before_request
+def start_server_timing():
+  server_timing.start_request()
+
+@app.after_request
+def add_server_timing_header(response):
+  # parse / resolve / db breakdown of the request, for the endpoints that record any
+  server_timing_header = server_timing.header_value()
+  if server_timing_header:
+    response.headers['Server-Timing'] = server_timing_header
+  return response
+
+@app.before_request
+def wait_for_startup():
+  if request.endpoint in STARTUP_EXEMPT_ENDPOINTS or startup.is_ready():
+    return
+  # only wait while components are still starting, a failed startup answers right away
+  if not startup.has_failed() and startup.wait_until_ready(STARTUP_WAIT_TIMEOUT_SECONDS):
+    return
+  if startup.has_failed():
+    raise lcc_error.ServiceUnavailableError("The server failed to start up, please try again later")
+  raise lcc_error.ServiceUnavailableError("The server is still starting up, please try again in a moment")
+
+@app.route('/api/ready', methods=['GET'])
+def get_readiness():
+  return jsonify(startup.get_status()), 200 if startup.is_ready() else 503
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+  # hit / miss counters of the in-process caches, per worker
+  return jsonify({
+    'caches': {
+      'cubes': cube_manager.get_cache_stats(),
+      'cubeDraftmancerFiles': draftmancer.cube_draftmancer_cache.get_cache_stats(),
+      'formatAnalyses': format_analysis_manager.get_cache_stats(),
+    }
+  })
+
 # USER FACING PAGES
 
 @app.route('/')
@@ -219,12 +268,22 @@ def handle_draftmancer_draft_log(draft_id:str):
     raise lcc_error.LccError("Failed to end draft", 500)
   return Response(status=200)
 
+def get_pagination_arg(name: str, default: int) -> int:
+  value = request.args.get(name, default)
+  try:
+    return int(value)
+  except ValueError:
+    raise lcc_error.InvalidPaginationError(f"{name} must be a whole number, got: {value}")
+
+def get_pagination_args() -> tuple[int, int]:
+  # page starts at 1 and per_page is at most 100, a page below 1 would be a negative offset
+  return max(1, get_pagination_arg('page', 1)), min(max(1, get_pagination_arg('per_page', 10)), 100)
+
 # RETAIL API ENDPOINTS
 
 @app.route('/api/retail_sets', methods=['POST'])
 def get_retail_sets_post():
-  page = int(request.args.get('page', 1))
-  per_page = min(int(request.args.get('per_page', 10)), 100)
+  page, per_page = get_pagination_args()
   order = request.args.get('order', api.OrderType.DESC)
   paginated_retail_set_entries = retail_manager.get_sets(page, per_page, order)
   response = {'sets': paginated_retail_set_entries, 'totalSets': retail_manager.get_set_count()}
@@ -232,8 +291,7 @@ def get_retail_sets_post():
 
 @app.route('/api/retail_sets', methods=['GET'])
 def get_retail_sets():
-  page = int(request.args.get('page', 1))
-  per_page = min(int(request.args.get('per_page', 10)), 100)
+  page, per_page = get_pagination_args()
   order = request.args.get('order', api.OrderType.DESC)
   paginated_retail_set_entries = retail_manager.get_sets(page, per_page, order)
   response = {'sets': paginated_retail_set_entries, 'totalSets': retail_manager.get_set_count()}
@@ -274,14 +332,10 @@ def retail_draft_started(set_id:str):
 
 @app.route('/api/retail_sets/<string:set_id>/analysis', methods=['GET'])
 def get_retail_set_analysis(set_id:str):
-  set: api.RetailSet = retail_manager.get_set(set_id)
-  if not set:
-    return lcc_error.RetailSetNotFoundError("Retail set not found")
-  
-  # Parse the draftmancer file to get real data
+  # parsed once when the retail sets are loaded, raises RetailSetNotFoundError for unknown ids
+  draftmancer_file: draftmancer.DraftmancerFile = retail_manager.get_draftmancer_file(set_id)
   try:
-    draftmancer_file: draftmancer.DraftmancerFile = draftmancer.read_draftmancer_file_as_string(set.draftmancerFile)
-    format_analysis = format_analysis_manager.analyze(draftmancer_file=draftmancer_file, 
+    format_analysis = format_analysis_manager.analyze(slot_model=draftmancer_file.slot_model, 
                                                       boosters_per_player=request.args.get('boostersPerPlayer', 
                                                                                            4, 
                                                                                            type=int), 
@@ -357,6 +411,45 @@ def create_format_analysis_response(set_id: str, analysis_data: dict) -> api.For
     settings=settings
   )
 
+# CARD SET API ENDPOINTS
+
+@app.route('/api/sets/<string:set_code>/cards', methods=['GET'])
+def get_set_cards(set_code:str):
+  card_set = lorcana_api.get_card_set(set_code)
+  if card_set is None:
+    raise lcc_error.CardSetNotFoundError(f"Set with code {set_code} not found")
+  set_cards = [api.SetCard(
+    fullName=api_card.full_name,
+    setCode=printing.set_code,
+    collectorId=printing.collector_id,
+    rarity=printing.rarity,
+    imageUris=printing.image_uris,
+    cost=api_card.cost,
+    inks=api_card.inks or [api_card.color],
+    types=api_card.types,
+  ) for api_card, printing in card_set.printings]
+  return jsonify(api.CardSetCards(
+    code=card_set.code,
+    name=card_set.name,
+    releasedAt=card_set.released_at,
+    releaseOrder=card_set.release_order,
+    numCards=card_set.num_cards,
+    numPrintings=card_set.num_printings,
+    cards=set_cards,
+  ))
+
+# REPORT API ENDPOINTS
+
+@app.route('/api/reports/card_popularity', methods=['GET'])
+def get_card_popularity_report():
+  return jsonify(cubealytics.get_power_max_card_popularity_report())
+
+@app.route('/api/reports/card_popularity.csv', methods=['GET'])
+def get_card_popularity_report_csv():
+  csvfile = io.StringIO()
+  cubealytics.get_power_max_card_popularity_report().write_csv(csvfile)
+  return Response(csvfile.getvalue(), mimetype='text/csv', headers={'Content-Disposition': 'attachment; filename=power_max_card_popularity_report.csv'})
+
 # CUBE API ENDPOINTS
 
 @app.route('/api/cube/count', methods=['GET'])
@@ -365,24 +458,31 @@ def get_cube_count():
 
 @app.route('/api/cube', methods=['GET'])
 def get_cubes():
-  page = int(request.args.get('page', 1))
-  per_page = min(int(request.args.get('per_page', 10)), 100)
+  page, per_page = get_pagination_args()
   sort = request.args.get('sort', api.SortType.TRENDING)
   order = request.args.get('order', api.OrderType.DESC)
   tags = None
   if 'tags' in request.args and len(request.args.getlist('tags')) > 0 and request.args.getlist('tags')[0] != "":
     tags = request.args.getlist('tags')
-  paginated_cube_list_entries = cube_manager.get_cubes(page, per_page, sort, order, tags)
-  response = {'cubes': paginated_cube_list_entries, 'totalCubes': cube_manager.get_cube_count()}
+  cursor = request.args.get('cursor')
+  paginated_cube_list_entries, next_cursor = cube_manager.get_cubes(page, per_page, sort, order, tags, cursor)
+  response = {'cubes': paginated_cube_list_entries, 'totalCubes': cube_manager.get_cube_count(), 'nextCursor': next_cursor}
   return jsonify(response)
 
+@app.route('/api/cards/<string:card>/cubes', methods=['GET'])
+def get_cubes_containing_card(card:str):
+  # card is a card id or a full name, ordered by popularity
+  page, per_page = get_pagination_args()
+  cube_list_entries = cube_manager.get_cubes_containing_card(id_helper.to_id(card), page, per_page)
+  return jsonify({'cubes': cube_list_entries})
+
 @app.route('/api/cube', methods=['POST'])
 def add_cube():
   if len(request.json['cardListText']) == 0:
     return Response(status=400)
   if len(request.json['cardListText']) > MAX_CARD_LIST_LENGTH:
     return Response(status=413)
-  card_list_helper.validate_card_list(request.json['cardListText'])
+  card_list_parse_result = card_list_helper.validate_card_list(request.json['cardListText'])
   api_create_cube = api.CreateCubeRequest(
     name=request.json['name'],
     cardListText=request.json['cardListText'],
@@ -393,7 +493,7 @@ def add_cube():
     cubeDescription=request.json.get('cubeDescription', ''),
     cubeSettings=api.CubeSettings(**request.json['cubeSettings'])
   )
-  cubecana_cube = cube_manager.create_cube(api_create_cube)
+  cubecana_cube = cube_manager.create_cube(api_create_cube, card_list_parse_result)
   response = {'id': cubecana_cube.id,'editCubeLink': f'/edit-cube/{cubecana_cube.id}?editSecret={cubecana_cube.edit_secret}'}
   return jsonify(response)
 
@@ -402,7 +502,7 @@ def get_cube_draftmancer_file(cube_id):
   cube: CubecanaCube = cube_manager.get_cube(cube_id)
   if not cube:
     return Response(status=404)
-  draftmancer_file: str = draftmancer.generate_draftmancer_file_from_cube(cube)
+  draftmancer_file: str = draftmancer.cube_draftmancer_cache.get(cube)
 
   response = {
     'draftmancerFile': draftmancer_file, 
@@ -448,6 +548,7 @@ def update_cube(cube_id):
     return Response(status=413)
   if request.args.get('editSecret') != cube.edit_secret:
     return Response(status=401)
+  card_list_parse_result = card_list_helper.validate_card_list(request.json['cardListText'])
   api_edit_cube = api.EditCubeRequest(
     id=request.json['id'],
     name=request.json['name'],
@@ -459,7 +560,7 @@ def update_cube(cube_id):
     featuredCardPrintingId=request.json.get('featuredCardPrintingId', ''),
     cubeSettings=api.CubeSettings(**request.json['cubeSettings'])
   )
-  updated_cube: CubecanaCube = cube_manager.update_cube(api_edit_cube)
+  updated_cube: CubecanaCube = cube_manager.update_cube(api_edit_cube, card_list_parse_result)
   response = {'id': updated_cube.id,'editCubeLink': f'/edit-cube/{updated_cube.id}?editSecret={updated_cube.edit_secret}'}
   return jsonify(response)
 
@@ -480,11 +581,10 @@ def handle_cube_analysis(cube_id:str):
   cube = cube_manager.get_cube(cube_id)
   if not cube:
     return Response(status=404)
-  draftmancer_file_str = draftmancer.generate_draftmancer_file_from_cube(cube)
-  draftmancer_file = draftmancer.read_draftmancer_file_as_string(draftmancer_file_str)
+  slot_model = draftmancer.slot_model_from_cube(cube)
   max_players = math.floor( cube.card_count() / (cube.settings.boosters_per_player * cube.settings.cards_per_booster) )
   card_evaluations_file = card_evaluations_manager.determine_card_evaluations_file(cube)
-  format_analysis = format_analysis_manager.analyze(draftmancer_file, cube.settings.boosters_per_player, max_players, card_evaluations_file)
+  format_analysis = format_analysis_manager.analyze(slot_model, cube.settings.boosters_per_player, max_players, card_evaluations_file)
   return jsonify(format_analysis)
 
 @app.errorhandler(lcc_error.UnauthorizedError)
@@ -0,0 +1,227 @@
+import argparse
+import contextlib
+import io
+import json
+import re
+import tempfile
+import time
+from pathlib import Path
+from cubecana_server import draftmancer
+from cubecana_server import card_evaluations
+from cubecana_server import card_list_helper
+from cubecana_server import card_snapshot
+from cubecana_server.cube_dao import MAX_CARD_LIST_LENGTH
+from cubecana_server import id_helper
+from cubecana_server import lorcast_api as lorcast_api_module
+from cubecana_server.dreamborn_manager import ALL_DREAMBORN_NAMES_FILE_PATH
+from cubecana_server.lorcast_api import lorcast_api as lorcana_api
+from cubecana_server.format_analysis_manager import format_analysis_manager, AnalysisContext
+from cubecana_server.startup import startup
+from cubecana_server.cubecana_cube import CubecanaCube
+from cubecana_server.settings import Settings
+
+LARGEST_RETAIL_SET_PATH = 'inputs/retail_sets/9.draftmancer.txt'
+LARGEST_RETAIL_SET_CODE = '9'
+RETAIL_SETS_DIR_PATH = 'inputs/retail_sets'
+
+parser = argparse.ArgumentParser(
+                    prog='benchmark',
+                    description='micro-benchmarks for the hot paths of the cubecana server, run from the repo root')
+
+parser.add_argument('verb', help="verb is one of: ( format_analysis | format_analysis_batch | draftmancer_parse | card_data_load | id_normalization | card_list_resolve | cube_analysis )")
+parser.add_argument('--iterations', default=200, type=int)
+parser.add_argument('--batch_size', default=1000, type=int, help="number of formats analyzed by format_analysis_batch")
+
+def time_per_call_ms(fn, iterations: int) -> float:
+    # analysis prints warnings for cards with missing stats, keep them out of the timings
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        elapsed = time.perf_counter() - start
+    return elapsed / iterations * 1000
+
+def print_comparison(name: str, baseline_ms: float, improved_ms: float):
+    print(f"{name}: baseline {baseline_ms:.3f} ms, improved {improved_ms:.3f} ms, speedup x{baseline_ms / improved_ms:.1f}")
+
+def benchmark_format_analysis(iterations: int):
+    slot_model = draftmancer.read_draftmancer_file(LARGEST_RETAIL_SET_PATH).slot_model
+    total_cards_by_slot_name = format_analysis_manager.generate_total_cards_by_slot_name(slot_model)
+    count_at_table_by_card_id = format_analysis_manager.generate_count_at_table_by_card_id(slot_model, 4 * 8, total_cards_by_slot_name)
+    context = AnalysisContext(card_evaluations_file=card_evaluations.DEFAULT_RETAIL_CARD_EVALUATIONS_FILE, retail_set_code=LARGEST_RETAIL_SET_CODE)
+    print(f"{LARGEST_RETAIL_SET_PATH}: {len(count_at_table_by_card_id)} distinct cards at the table")
+
+    # the accumulators are built once so only the walks over the cards are timed, not the evaluations csv read
+    accumulators = [factory(context) for factory in format_analysis_manager.accumulator_factories.values()]
+
+    # one walk + card lookup per distribution, the way analyze used to work
+    def multi_pass():
+        for accumulator in accumulators:
+            for card_id, count_at_table in count_at_table_by_card_id.items():
+                accumulator.accumulate(card_id, lorcana_api.get_api_card(card_id), count_at_table)
+
+    def fused_pass():
+        for card_id, count_at_table in count_at_table_by_card_id.items():
+            api_card = lorcana_api.get_api_card(card_id)
+            for accumulator in accumulators:
+                accumulator.accumulate(card_id, api_card, count_at_table)
+
+    print_comparison("distribution walks (multi pass vs fused pass)", time_per_call_ms(multi_pass, iterations), time_per_call_ms(fused_pass, iterations))
+    print(f"full generate_format_analysis: {time_per_call_ms(lambda: format_analysis_manager.generate_format_analysis(slot_model, 4, 8, context.card_evaluations_file, context.retail_set_code), iterations):.3f} ms")
+
+def benchmark_format_analysis_batch(batch_size: int):
+    retail_slot_models = [draftmancer.read_draftmancer_file(file).slot_model for file in sorted(Path(RETAIL_SETS_DIR_PATH).glob('*.draftmancer.txt'))]
+    slot_models = [retail_slot_models[i % len(retail_slot_models)] for i in range(batch_size)]
+    card_evaluations_file = card_evaluations.DEFAULT_RETAIL_CARD_EVALUATIONS_FILE
+
+    def one_at_a_time():
+        for slot_model in slot_models:
+            format_analysis_manager.generate_format_analysis(slot_model, 4, 8, card_evaluations_file)
+
+    def batched():
+        format_analysis_manager.analyze_batch(slot_models, 4, 8, card_evaluations_file)
+
+    print_comparison(f"{batch_size} formats (one at a time vs analyze_batch)", time_per_call_ms(one_at_a_time, 1), time_per_call_ms(batched, 1))
+
+def get_slot_lines(contents: str) -> list[str]:
+    slot_lines = []
+    in_slot = False
+    for line in contents.split('\n'):
+        if line.startswith('['):
+            in_slot = line not in ('[CustomCards]', '[Settings]') and line.endswith(')]')
+        elif in_slot and line.strip():
+            slot_lines.append(line)
+    return slot_lines
+
+def benchmark_draftmancer_parse(iterations: int):
+    retail_file_contents = [file.read_text(encoding='utf8') for file in sorted(Path(RETAIL_SETS_DIR_PATH).glob('*.draftmancer.txt'))]
+    # only the slots of the all cards cube parse, its custom cards predate the set / collector_number fields
+    all_cards_cube_contents = Path(draftmancer.ALL_CARDS_CUBE_PATH).read_text(encoding='utf8')
+    slot_lines = [line for contents in retail_file_contents + [all_cards_cube_contents] for line in get_slot_lines(contents)]
+    print(f"{len(retail_file_contents)} retail sets + {draftmancer.ALL_CARDS_CUBE_PATH}, {len(slot_lines)} slot lines")
+
+    print_comparison("slot lines (card list tokenizer vs slot line fast path)",
+                     time_per_call_ms(lambda: [card_list_helper.printing_id_and_count_from_card_list_line(line) for line in slot_lines], iterations),
+                     time_per_call_ms(lambda: [draftmancer.printing_id_and_count_from_slot_line(line) for line in slot_lines], iterations))
+    print_comparison("retail sets (all sections vs slots only)",
+                     time_per_call_ms(lambda: [draftmancer.read_draftmancer_file_as_string(contents) for contents in retail_file_contents], iterations),
+                     time_per_call_ms(lambda: [draftmancer.read_draftmancer_file_as_string(contents, draftmancer.SLOTS_ONLY) for contents in retail_file_contents], iterations))
+    print(f"{draftmancer.ALL_CARDS_CUBE_PATH} slots only: {time_per_call_ms(lambda: draftmancer.read_draftmancer_file_as_string(all_cards_cube_contents, draftmancer.SLOTS_ONLY), iterations):.3f} ms")
+
+def benchmark_card_data_load(iterations: int):
+    cached_api_data_file = Path(lorcast_api_module.CACHED_API_DATA_FILEPATH)
+    source_files = [cached_api_data_file, Path(ALL_DREAMBORN_NAMES_FILE_PATH)]
+
+    def from_json():
+        with cached_api_data_file.open(mode='r') as file_to_read:
+            return lorcana_api.generate_id_to_api_card(json.load(file_to_read))
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        snapshot_file = Path(temp_dir) / 'cards.snapshot'
+        card_snapshot.write_snapshot(snapshot_file, from_json(), source_files)
+        print(f"{cached_api_data_file}: {cached_api_data_file.stat().st_size / 1e6:.1f} MB json, {snapshot_file.stat().st_size / 1e6:.1f} MB snapshot, {len(lorcana_api.id_to_api_card)} cards")
+        print_comparison("card data load (json + generate_id_to_api_card vs snapshot)",
+                         time_per_call_ms(from_json, iterations),
+                         time_per_call_ms(lambda: card_snapshot.read_snapshot(snapshot_file, source_files), iterations))
+
+LEGACY_ID_PATTERN = re.compile(r"[\W_]+", re.ASCII)
+def legacy_to_id(string):
+    string = string.replace('ā', 'a')
+    string = string.replace('é','e')
+    return re.sub(LEGACY_ID_PATTERN, '', string).lower()
+
+def benchmark_id_normalization(iterations: int):
+    with open(ALL_DREAMBORN_NAMES_FILE_PATH, encoding='utf8') as f:
+        names = [line.strip() for line in f]
+    print(f"{ALL_DREAMBORN_NAMES_FILE_PATH}: {len(names)} names")
+
+    def cold_to_id():
+        id_helper.to_id.cache_clear()
+        return [id_helper.to_id(name) for name in names]
+
+    legacy_ms = time_per_call_ms(lambda: [legacy_to_id(name) for name in names], iterations)
+    print_comparison("names (legacy to_id vs translate, memo cleared)", legacy_ms, time_per_call_ms(cold_to_id, iterations))
+    print_comparison("names (legacy to_id vs translate, memoized)", legacy_ms, time_per_call_ms(lambda: [id_helper.to_id(name) for name in names], iterations))
+    print_comparison("names (legacy to_id vs to_ids batch)", legacy_ms, time_per_call_ms(lambda: id_helper.to_ids(names), iterations))
+
+    retail_file_contents = [file.read_text(encoding='utf8') for file in sorted(Path(RETAIL_SETS_DIR_PATH).glob('*.draftmancer.txt'))]
+    parse_retail_sets = lambda: [draftmancer.read_draftmancer_file_as_string(contents) for contents in retail_file_contents]
+    to_id = id_helper.to_id
+    id_helper.to_id = legacy_to_id
+    try:
+        legacy_parse_ms = time_per_call_ms(parse_retail_sets, iterations)
+    finally:
+        id_helper.to_id = to_id
+    print_comparison(f"{len(retail_file_contents)} retail sets parse (legacy to_id vs translate + memo)", legacy_parse_ms, time_per_call_ms(parse_retail_sets, iterations))
+
+def generate_card_list_lines(max_length: int) -> list[str]:
+    # every printing by name / set / collector number, then every card by name only, up to the size of the largest cube
+    lines = [f"1 {api_card.full_name} ({printing.set_code}) {printing.collector_id}" for api_card in lorcana_api.id_to_api_card.values() for printing in api_card.card_printings]
+    lines += [f"2 {api_card.full_name}" for api_card in lorcana_api.id_to_api_card.values()]
+    card_list_lines = []
+    length = 0
+    for line in lines:
+        if length + len(line) + 1 > max_length:
+            break
+        card_list_lines.append(line)
+        length += len(line) + 1
+    return card_list_lines
+
+def benchmark_card_list_resolve(iterations: int):
+    card_list_lines = generate_card_list_lines(MAX_CARD_LIST_LENGTH)
+    print(f"{len(card_list_lines)} lines, {sum(len(line) + 1 for line in card_list_lines)} characters")
+    print(f"resolver compile: {time_per_call_ms(lambda: card_list_helper.CardListResolver(lorcana_api.card_data, card_list_helper.generate_spellings(lorcana_api.card_data)), iterations):.3f} ms")
+
+    def tokenizer():
+        for line in card_list_lines:
+            card_list_helper.printing_id_and_count_from_card_list_line(line)
+
+    print_comparison("card list (tokenizer per line vs printing_id_to_count_from with the resolver)",
+                     time_per_call_ms(tokenizer, iterations),
+                     time_per_call_ms(lambda: card_list_helper.printing_id_to_count_from(card_list_lines), iterations))
+
+def benchmark_cube_analysis(iterations: int):
+    # the largest cube a card list can describe, analyzed uncached the way /api/cube/<id>/analysis does
+    printing_id_to_count = card_list_helper.printing_id_to_count_from(generate_card_list_lines(MAX_CARD_LIST_LENGTH))
+    cube = CubecanaCube(name='benchmark', printing_id_to_count=printing_id_to_count, tags=[], link='', author='benchmark', last_updated_epoch_seconds=0,
+                        id='benchmark', edit_secret='', featured_card_printing_id=None, cube_description='', settings=Settings(card_list_name='benchmark'))
+    card_evaluations_file = card_evaluations.card_evaluations_manager.determine_card_evaluations_file(cube)
+    print(f"{len(printing_id_to_count)} printings, {cube.card_count()} cards")
+
+    def text_round_trip():
+        draftmancer_file_string = draftmancer.generate_draftmancer_file_from_cube(cube)
+        slot_model = draftmancer.read_draftmancer_file_as_string(draftmancer_file_string, draftmancer.SLOTS_ONLY).slot_model
+        format_analysis_manager.generate_format_analysis(slot_model, 4, 8, card_evaluations_file)
+        return slot_model.digest
+
+    def slot_model_from_cube():
+        slot_model = draftmancer.slot_model_from_cube(cube)
+        format_analysis_manager.generate_format_analysis(slot_model, 4, 8, card_evaluations_file)
+        return slot_model.digest
+
+    print_comparison("cube analysis (generate + parse the draftmancer file vs slot model from the cube)",
+                     time_per_call_ms(text_round_trip, iterations),
+                     time_per_call_ms(slot_model_from_cube, iterations))
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    startup.run(['lorcast_api', 'dreamborn_names', 'pixelborn_names'])
+
+    match args.verb:
+        case "format_analysis":
+            benchmark_format_analysis(args.iterations)
+        case "format_analysis_batch":
+            benchmark_format_analysis_batch(args.batch_size)
+        case "draftmancer_parse":
+            benchmark_draftmancer_parse(args.iterations)
+        case "card_data_load":
+            benchmark_card_data_load(args.iterations)
+        case "id_normalization":
+            benchmark_id_normalization(args.iterations)
+        case "card_list_resolve":
+            benchmark_card_list_resolve(args.iterations)
+        case "cube_analysis":
+            benchmark_cube_analysis(args.iterations)
+        case _:
+            raise SystemExit(1, f"no verb '{args.verb}' found, exiting")
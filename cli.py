@@ -5,8 +5,11 @@ from cubecana_server import draftmancer
 from cubecana_server import tabletop_simulator
 from cubecana_server import generate_retail
 from cubecana_server import card_evaluations
-from cubecana_server.settings import Settings, POWER_BAND_RETAIL
+from cubecana_server.settings import Settings, POWER_BAND_RETAIL, POWER_BAND_OVERPOWERED, POWER_BAND_MAX
 from cubecana_server.draft_manager import draft_manager, DraftManager, cli_is_real_draft
+from cubecana_server.cube_manager import cube_manager
+from cubecana_server.cubealytics import cubealytics
+from cubecana_server.startup import startup
 
 
 parser = argparse.ArgumentParser(
@@ -14,7 +17,7 @@ parser = argparse.ArgumentParser(
                     description='given a dreamborn \"deck\" of a cube / set / card list, exported in Tabletop Simulator format, create a draftmancer custom card list that can be uploaded and drafted on draftmancer.com',
                     epilog='Text at the bottom of help')
 
-parser.add_argument('verb', help="verb is one of: ( generate_retail_draftmancer | tts_to_draftmancer | draftmancer_to_tts | analyze_draft_logs )")
+parser.add_argument('verb', help="verb is one of: ( generate_retail_draftmancer | tts_to_draftmancer | draftmancer_to_tts | analyze_draft_logs | backfill_cube_cards_and_tags | generate_card_popularity_report )")
 parser.add_argument('--dreamborn_export_for_tabletop_sim', help="file path to a .deck export in Tabletop Sim format from dreamborn.ink deck of the cube e.g. example-cube.json or C:\\Users\\dru\\Desktop\\deck.json")
 parser.add_argument('--card_evaluations_file', default=card_evaluations.DEFAULT_CUBE_CARD_EVALUATIONS_FILE, help="relative path to a .csv file containing card name -> 0-5 card rating (power in a vacuum). default: \"DraftBots\\\\FrankKarstenEvaluations-HighPower.csv\"")
 parser.add_argument('--boosters_per_player', default=4)
@@ -25,6 +28,9 @@ parser.add_argument('--color_balance_packs', default=False, help="WARNING** this
 parser.add_argument('--franchise_to_color', default=False, help="sets colors based on franchise to enable a double-feature cube")
 parser.add_argument('--set_card_types', default=False, help="WARNING** This sets card types... it may affect bots... but I don't know")
 parser.add_argument('--set_code', default=None, help="This is required to generate a true retail draft set, but could be left blank to generate retail-like sets")
+parser.add_argument('--tags', default=None, help="comma separated tags a cube needs all of to be included in the card popularity report")
+parser.add_argument('--power_bands', default=f"{POWER_BAND_OVERPOWERED},{POWER_BAND_MAX}", help="comma separated power bands of the cubes included in the card popularity report")
+parser.add_argument('--report_file', default="static/reports/power_max_card_popularity_report.csv", help="where generate_card_popularity_report writes its .csv")
 parser.add_argument('--draft_log', help="file path to a .json draft_log from draftmancer or a folder of same e.g. draft_log.json or C:\\Users\\dru\\Desktop\\draft_logs\\")
 
 def generate_retail_draftmancer(card_evaluations_file, set_code:str, settings:Settings):
@@ -68,6 +74,7 @@ def analyze_draft_logs(draft_log_file_path: str):
 
 if __name__ == '__main__':
     args = parser.parse_args()
+    startup.run()
 
     settings = Settings(
         boosters_per_player=args.boosters_per_player,
@@ -87,5 +94,10 @@ if __name__ == '__main__':
             tts_to_draftmancer(args.dreamborn_export_for_tabletop_sim, args.card_evaluations_file, settings)
         case "analyze_draft_logs":
             analyze_draft_logs(args.draft_log)
+        case "backfill_cube_cards_and_tags":
+            cube_manager.backfill_cube_cards_and_tags()
+        case "generate_card_popularity_report":
+            tags = args.tags.split(',') if args.tags else None
+            cubealytics.generate_card_popularity_report(tags, args.power_bands.split(',')).write_to_csv(args.report_file)
         case _:
             raise SystemExit(1, f"no verb '{args.verb}' found, exiting")
\ No newline at end of file
@@ -213,4 +213,39 @@ class FormatAnalysisResponse:
             self,
             default=lambda o: o.__dict__,
             sort_keys=True,
-            indent=4)
\ No newline at end of file
+            indent=4)
+
+@dataclass(frozen=True)
+class SetCard:
+    fullName: str
+    setCode: str
+    collectorId: str
+    rarity: str
+    imageUris: dict[str, str]
+    cost: int
+    inks: List[str]
+    types: List[str]
+
+    def toJSON(self):
+        return json.dumps(
+            self,
+            default=lambda o: o.__dict__,
+            sort_keys=True,
+            indent=4)
+
+@dataclass(frozen=True)
+class CardSetCards:
+    code: str
+    name: str
+    releasedAt: str
+    releaseOrder: int
+    numCards: int
+    numPrintings: int
+    cards: List[SetCard]
+
+    def toJSON(self):
+        return json.dumps(
+            self,
+            default=lambda o: o.__dict__,
+            sort_keys=True,
+            indent=4)
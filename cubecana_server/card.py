@@ -53,13 +53,25 @@ class CardPrinting:
     set_code: str
     rarity: str
     image_uris: dict[str, str]
+    set_name: str = None
+    released_at: str = None
 
     def printing_id(self) -> PrintingId:
-        return PrintingId(
-            card_id=id_helper.to_id(self.full_name),
-            set_code=self.set_code,
-            collector_id=self.collector_id
-        )
+        # memoized, it's needed for every card of every cube render and draftmancer file
+        printing_id = self.__dict__.get('_printing_id')
+        if printing_id is None:
+            printing_id = PrintingId(
+                card_id=id_helper.to_id(self.full_name),
+                set_code=self.set_code,
+                collector_id=self.collector_id
+            )
+            object.__setattr__(self, '_printing_id', printing_id)
+        return printing_id
+
+    def with_printing_id(self, card_id: str) -> 'CardPrinting':
+        # for loaders that already know the card id, saves printing_id() the to_id of the full name
+        object.__setattr__(self, '_printing_id', PrintingId(card_id=card_id, set_code=self.set_code, collector_id=self.collector_id))
+        return self
 
     def toJSON(self):
         return json.dumps(
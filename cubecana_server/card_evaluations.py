@@ -1,13 +1,19 @@
 import csv
+import os
 from . import id_helper
 from .cubecana_cube import CubecanaCube
 from . import tags
+from .lru_cache import LruCache
 
 DEFAULT_CARD_EVALUATIONS_FOLDER = "DraftBots/"
 DEFAULT_CUBE_CARD_EVALUATIONS_FILE = "DraftBots/FrankKarsten-normalInk-maxPower-Evaluations.csv"
 DEFAULT_RETAIL_CARD_EVALUATIONS_FILE = "DraftBots/FrankKarsten-normalInk-retailPower-Evaluations.csv"
 
+EVALUATIONS_CACHE_MAX_SIZE = 64
+
 class CardEvaluationsManager:
+    def __init__(self):
+        self.id_to_letter_rating_cache: LruCache = LruCache(EVALUATIONS_CACHE_MAX_SIZE)
 
     def read_id_to_draftmancer_rating(self, card_evaluations_file:str, preferred_set_num:str=None) -> dict[str, int]:
         id_to_rating = {}
@@ -25,6 +31,15 @@ class CardEvaluationsManager:
         return id_to_rating
     
     def read_id_to_letter_rating(self, card_evaluations_file:str, preferred_set_num=None) -> dict[str, str]:
+        # read on every format analysis, so keep the parsed csv around until the file changes
+        key = (card_evaluations_file, self.evaluations_version(card_evaluations_file), preferred_set_num)
+        id_to_rating = self.id_to_letter_rating_cache.get(key)
+        if id_to_rating is None:
+            id_to_rating = self._read_id_to_letter_rating(card_evaluations_file, preferred_set_num)
+            self.id_to_letter_rating_cache.put(key, id_to_rating)
+        return id_to_rating
+
+    def _read_id_to_letter_rating(self, card_evaluations_file:str, preferred_set_num=None) -> dict[str, str]:
         id_to_rating = {}
         with open(file=card_evaluations_file, newline='', encoding='utf8') as csvfile:
             dialect = csv.Sniffer().sniff(csvfile.read(1024))
@@ -39,6 +54,11 @@ class CardEvaluationsManager:
                 id_to_rating[card_id] = card_rating
         return id_to_rating
 
+    def evaluations_version(self, card_evaluations_file:str) -> tuple[int, int]:
+        # changes whenever the evaluations csv is edited or redeployed
+        stat = os.stat(card_evaluations_file)
+        return (stat.st_mtime_ns, stat.st_size)
+
     def determine_card_evaluations_file(self, cube:CubecanaCube):
         if tags.TAG_LOW_INK in cube.tags:
             ink_level = "low"
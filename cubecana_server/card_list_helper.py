@@ -1,8 +1,19 @@
+import heapq
+import threading
 from collections import defaultdict
+from dataclasses import dataclass
+from functools import cached_property
 from . import id_helper
+from . import server_timing
 from .card import CardPrinting, PrintingId, ApiCard
 from .lcc_error import LccError, UnidentifiedCardError, UnidentifiedPrintingError, UnidentifiedPrinting, UnidentifiedPrintingsError, UnidentifiedCardsError
-from .lorcast_api import lorcast_api as lorcana_api
+from .lorcast_api import lorcast_api as lorcana_api, CardData
+from .dreamborn_manager import dreamborn_manager
+from .pixelborn_manager import pixelborn_manager
+
+CARD_NAME_SUGGESTION_LIMIT = 3
+# Dice coefficient of the trigrams, below it a name is too far off to be what the user meant
+CARD_NAME_SUGGESTION_MIN_SIMILARITY = 0.4
 
 def get_mainboard_lines(all_lines):
   try: 
@@ -94,6 +105,9 @@ def matches_input_printing(printing:CardPrinting, input_set_code: str, input_col
 def get_matching_printing(input_set_code: str, input_collector_id: str, api_card: ApiCard) -> CardPrinting:
     if not input_set_code and not input_collector_id:
         return api_card.default_printing
+    if input_set_code and input_collector_id:
+        # every printing of a card shares its card id, so the exact printing is a single index lookup
+        return lorcana_api.find_card_printing(PrintingId(card_id=api_card.default_printing.printing_id().card_id, set_code=input_set_code, collector_id=input_collector_id))
     return next(filter(lambda printing: matches_input_printing(printing, input_set_code, input_collector_id), api_card.card_printings), None)
 
 def calculate_token_types(tokens: list[str]) -> list[str]:
@@ -118,10 +132,11 @@ def printing_id_to_count_from_id_to_count(id_to_count: dict[str, int]) -> dict[P
         printing_id_to_count[printing_id] = count
     return printing_id_to_count
 
-def validate_card_list(card_list_input):
-    card_list_lines = card_list_input.split('\n')
-    printing_id_to_count_from(card_list_lines)
-    # this will raise errors if cards are not recognized wholesale
+def validate_card_list(card_list_input) -> 'CardListParseResult':
+    # this will raise errors if cards are not recognized wholesale, the result can be handed on so the list isn't parsed again
+    card_list_parse_result = parse_card_list(card_list_input)
+    card_list_parse_result.raise_if_invalid()
+    return card_list_parse_result
 
 def id_to_count_from_printing_id_to_count(printing_id_to_count: dict[PrintingId, int]) -> dict[str, int]:
     id_to_count = dict[str, int]()
@@ -140,7 +155,7 @@ def printing_id_from_human_readable_string(human_readable: str) -> PrintingId:
     card_id = id_helper.to_id(card_name)
     api_card = lorcana_api.get_api_card(card_id)
     if api_card is None:
-        raise UnidentifiedCardError(human_readable)
+        raise UnidentifiedCardError(human_readable, get_card_list_resolver().card_name_suggester.suggest(card_name))
 
     input_set_code = None
     input_collector_id = None
@@ -173,29 +188,164 @@ def printing_id_and_count_from_card_list_line(line: str) -> tuple[PrintingId, in
     except ValueError:
         raise LccError("Missing count or name in line:\n " + line + "\nShould look like:\n1 Elsa - Snow Queen", 400)
 
-def printing_id_to_count_from(card_list_lines):
+def trigrams(card_id: str) -> set[str]:
+    padded = f"$${card_id}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class CardNameSuggester:
+    """
+    Trigram index over the normalized name of every card, suggests the closest card names for a name
+    that didn't resolve so users can fix a typo without another round trip per guess.
+    """
+    def __init__(self, id_to_api_card: dict[str, ApiCard]):
+        self.full_names: list[str] = []
+        self.trigram_counts: list[int] = []
+        self.trigram_to_name_indexes: dict[str, list[int]] = defaultdict(list)
+        for card_id, api_card in id_to_api_card.items():
+            card_trigrams = trigrams(card_id)
+            for trigram in card_trigrams:
+                self.trigram_to_name_indexes[trigram].append(len(self.full_names))
+            self.full_names.append(api_card.full_name)
+            self.trigram_counts.append(len(card_trigrams))
+
+    def suggest(self, name: str, limit: int = CARD_NAME_SUGGESTION_LIMIT) -> list[str]:
+        query_trigrams = trigrams(id_helper.to_id(name))
+        shared_trigram_counts: dict[int, int] = defaultdict(int)
+        for trigram in query_trigrams:
+            for name_index in self.trigram_to_name_indexes.get(trigram, ()):
+                shared_trigram_counts[name_index] += 1
+        scored = ((2 * shared / (len(query_trigrams) + self.trigram_counts[name_index]), name_index) for name_index, shared in shared_trigram_counts.items())
+        return [self.full_names[name_index] for similarity, name_index in heapq.nlargest(limit, scored) if similarity >= CARD_NAME_SUGGESTION_MIN_SIMILARITY]
+
+class CardListResolver:
+    """
+    Resolves card list lines against one version of the card data. Every known spelling of a card (canonical,
+    dreamborn and pixelborn names) is compiled into a single dict, so an exactly spelled name skips normalization,
+    and each card's printings are indexed by (set code, collector id). Lines it can't resolve cleanly (unknown card or
+    printing, unusual formatting) return None and go through the tokenizer above, which reports the error.
+    """
+    def __init__(self, card_data: CardData, spellings: list[str]):
+        self.version = card_data.version
+        # card id -> (card, its printings by (set code, collector id))
+        self.card_id_to_entry: dict[str, tuple[ApiCard, dict[tuple[str, str], CardPrinting]]] = {}
+        for card_id, api_card in card_data.id_to_api_card.items():
+            set_and_collector_to_printing: dict[tuple[str, str], CardPrinting] = {}
+            for printing in api_card.card_printings:
+                set_and_collector_to_printing.setdefault((printing.set_code, printing.collector_id), printing)
+            self.card_id_to_entry[card_id] = (api_card, set_and_collector_to_printing)
+        self.name_to_card_id: dict[str, str] = {}
+        for spelling in spellings:
+            card_id = id_helper.to_id(spelling)
+            if card_id in self.card_id_to_entry:
+                self.name_to_card_id.setdefault(spelling, card_id)
+
+    @cached_property
+    def card_name_suggester(self) -> CardNameSuggester:
+        # only needed once a line fails to resolve
+        return CardNameSuggester({card_id: api_card for card_id, (api_card, _) in self.card_id_to_entry.items()})
+
+    def card_entry(self, name: str) -> tuple[ApiCard, dict[tuple[str, str], CardPrinting]] | None:
+        card_id = self.name_to_card_id.get(name)
+        if card_id is None:
+            card_id = id_helper.to_id(name)
+        return self.card_id_to_entry.get(card_id)
+
+    def resolve_line(self, line: str) -> tuple[PrintingId, int] | None:
+        # splits the line the way the tokenizer does: "<count> <name>" or "<count> <name> (<set code>) <collector id>"
+        string_count, separator, name = line.rstrip().partition(' ')
+        if not separator or not string_count.isascii() or not string_count.isdigit():
+            return None
+        set_code = collector_id = None
+        head, separator, last_token = name.rpartition(' ')
+        # most lines end in a word of the name, only a token int() could parse is worth the exception raising check
+        first_char = last_token[:1]
+        if separator and (first_char.isdigit() or first_char.isspace() or first_char in ('+', '-')) and is_collector_number_format(last_token):
+            name_part, separator, set_token = head.rpartition(' ')
+            if set_token[:1] == '(' and set_token[-1:] == ')':
+                if not separator or len(set_token) == 2:
+                    return None
+                name, set_code, collector_id = name_part, set_token[1:-1], last_token
+            elif not set_token:
+                return None
+        entry = self.card_entry(name)
+        if entry is None:
+            return None
+        api_card, set_and_collector_to_printing = entry
+        if set_code is None:
+            return api_card.default_printing.printing_id(), int(string_count)
+        card_printing = set_and_collector_to_printing.get((set_code, collector_id))
+        if card_printing is None:
+            return None
+        return card_printing.printing_id(), int(string_count)
+
+def generate_spellings(card_data: CardData) -> list[str]:
+    spellings = [api_card.full_name for api_card in card_data.id_to_api_card.values()]
+    spellings.extend(dreamborn_manager.id_to_dreamborn_name.values())
+    spellings.extend(pixelborn_manager.id_to_pixelborn_name.values())
+    return spellings
+
+card_list_resolver: CardListResolver | None = None
+card_list_resolver_lock = threading.Lock()
+
+def get_card_list_resolver() -> CardListResolver:
+    # compiled on first use after each card data swap
+    global card_list_resolver
+    card_data = lorcana_api.card_data
+    resolver = card_list_resolver
+    if resolver is not None and resolver.version == card_data.version:
+        return resolver
+    with card_list_resolver_lock:
+        if card_list_resolver is None or card_list_resolver.version != card_data.version:
+            card_list_resolver = CardListResolver(card_data, generate_spellings(card_data))
+        return card_list_resolver
+
+@dataclass(frozen=True)
+class CardListParseResult:
+    printing_id_to_count: dict[PrintingId, int]
+    unidentified_card_errors: list[UnidentifiedCardError]
+    unidentified_printing_errors: list[UnidentifiedPrintingError]
+
+    def raise_if_invalid(self):
+        error_message = ""
+        unidentified_cards_error:UnidentifiedCardError = None
+        if self.unidentified_card_errors:
+            unidentified_cards_error = UnidentifiedCardsError(self.unidentified_card_errors)
+            error_message += f"{unidentified_cards_error.user_facing_message}"
+        unidentified_printings_error: UnidentifiedPrintingsError = None
+        if self.unidentified_printing_errors:
+            unidentified_printings_error = UnidentifiedPrintingsError(self.unidentified_printing_errors)
+            error_message += f"\n{unidentified_printings_error.user_facing_message}"
+        if unidentified_printings_error or unidentified_cards_error:
+            raise LccError(error_message, 404)
+
+def parse_card_list(card_list_input: str) -> CardListParseResult:
+    with server_timing.timed('parse'):
+        card_list_lines = card_list_input.split('\n')
+    return parse_card_list_lines(card_list_lines)
+
+def parse_card_list_lines(card_list_lines) -> CardListParseResult:
     printing_id_to_count = defaultdict(int)
     unidentified_card_errors = list[UnidentifiedCardError]()
     unidentified_printing_errors = list[UnidentifiedPrintingError]()
-    for line in card_list_lines:
-        try:
-            printing_id, count = printing_id_and_count_from_card_list_line(line)
-            printing_id_to_count[printing_id] += count
-        except UnidentifiedCardError as e:
-            unidentified_card_errors.append(e)
-        except UnidentifiedPrintingError as e:
-            unidentified_printing_errors.append(e)
-    
-    error_message = ""
-    unidentified_cards_error:UnidentifiedCardError = None
-    if unidentified_card_errors:
-        unidentified_cards_error = UnidentifiedCardsError(unidentified_card_errors)
-        error_message += f"{unidentified_cards_error.user_facing_message}"
-    unidentified_printings_error: UnidentifiedPrintingsError = None
-    if unidentified_printing_errors:
-        unidentified_printings_error = UnidentifiedPrintingsError(unidentified_printing_errors)
-        error_message += f"\n{unidentified_printings_error.user_facing_message}"
-    if unidentified_printings_error or unidentified_cards_error:
-        raise LccError(error_message, 404)
-
-    return printing_id_to_count
\ No newline at end of file
+    with server_timing.timed('parse'):
+        resolver = get_card_list_resolver()
+    with server_timing.timed('resolve'):
+        for line in card_list_lines:
+            resolved = resolver.resolve_line(line)
+            if resolved is not None:
+                printing_id, count = resolved
+                printing_id_to_count[printing_id] += count
+                continue
+            try:
+                printing_id, count = printing_id_and_count_from_card_list_line(line)
+                printing_id_to_count[printing_id] += count
+            except UnidentifiedCardError as e:
+                unidentified_card_errors.append(e)
+            except UnidentifiedPrintingError as e:
+                unidentified_printing_errors.append(e)
+    return CardListParseResult(printing_id_to_count, unidentified_card_errors, unidentified_printing_errors)
+
+def printing_id_to_count_from(card_list_lines):
+    card_list_parse_result = parse_card_list_lines(card_list_lines)
+    card_list_parse_result.raise_if_invalid()
+    return card_list_parse_result.printing_id_to_count
@@ -0,0 +1,97 @@
+import marshal
+import os
+import struct
+import sys
+from pathlib import Path
+from .card import ApiCard, CardPrinting
+
+SNAPSHOT_MAGIC = b"CUBECANA-CARDS"
+SNAPSHOT_FORMAT_VERSION = 3
+HEADER_LENGTH_FORMAT = "<I"
+
+# A preprocessed copy of the card data: only the fields cubecana uses, already keyed by card id, with canonical names
+# and image uris resolved. It's written with marshal (plain builtins only, nothing executable like pickle) behind a
+# header naming the source files it was built from, so a stale or foreign snapshot is ignored and rebuilt.
+
+def source_fingerprint(source_files: list[Path]) -> tuple:
+    fingerprint = []
+    for source_file in source_files:
+        stat = Path(source_file).stat()
+        fingerprint.append((str(source_file), stat.st_mtime_ns, stat.st_size))
+    return tuple(fingerprint)
+
+def snapshot_header(source_files: list[Path]) -> tuple:
+    return (SNAPSHOT_FORMAT_VERSION, sys.implementation.cache_tag, marshal.version, source_fingerprint(source_files))
+
+def printing_to_record(printing: CardPrinting) -> tuple:
+    return (printing.printing_id().card_id, printing.full_name, printing.collector_id, printing.set_code, printing.rarity, printing.image_uris, printing.set_name, printing.released_at)
+
+def api_card_to_record(card_id: str, api_card: ApiCard) -> tuple:
+    return (
+        card_id,
+        api_card.full_name,
+        api_card.cost,
+        api_card.color,
+        api_card.inks,
+        api_card.types,
+        api_card.classifications,
+        api_card.strength,
+        api_card.willpower,
+        api_card.lore,
+        api_card.inkable,
+        api_card.keywords,
+        api_card.card_printings.index(api_card.default_printing),
+        [printing_to_record(printing) for printing in api_card.card_printings],
+    )
+
+def api_card_from_record(record: tuple) -> tuple[str, ApiCard]:
+    card_id, full_name, cost, color, inks, types, classifications, strength, willpower, lore, inkable, keywords, default_printing_index, printing_records = record
+    card_printings = [CardPrinting(*printing_record[1:]).with_printing_id(printing_record[0]) for printing_record in printing_records]
+    return card_id, ApiCard(
+        full_name=full_name,
+        cost=cost,
+        color=color,
+        inks=inks,
+        types=types,
+        card_printings=card_printings,
+        default_printing=card_printings[default_printing_index],
+        classifications=classifications,
+        strength=strength,
+        willpower=willpower,
+        lore=lore,
+        inkable=inkable,
+        keywords=keywords,
+    )
+
+def write_snapshot(snapshot_file: Path, id_to_api_card: dict[str, ApiCard], source_files: list[Path]):
+    snapshot_file = Path(snapshot_file)
+    snapshot_file.parent.mkdir(parents=True, exist_ok=True)
+    records = [api_card_to_record(card_id, api_card) for card_id, api_card in id_to_api_card.items()]
+    temp_file = snapshot_file.with_name(snapshot_file.name + '.tmp')
+    header = marshal.dumps(snapshot_header(source_files))
+    with temp_file.open(mode='wb') as file_to_write:
+        file_to_write.write(SNAPSHOT_MAGIC)
+        file_to_write.write(struct.pack(HEADER_LENGTH_FORMAT, len(header)))
+        file_to_write.write(header)
+        file_to_write.write(marshal.dumps(records))
+    # swapped in whole so a concurrent reader never sees a partial snapshot
+    os.replace(temp_file, snapshot_file)
+
+def read_snapshot(snapshot_file: Path, source_files: list[Path]) -> dict[str, ApiCard] | None:
+    snapshot_file = Path(snapshot_file)
+    if not snapshot_file.is_file():
+        return None
+    try:
+        # read whole, marshal.load on a file object reads it in tiny chunks
+        contents = memoryview(snapshot_file.read_bytes())
+        if contents[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            return None
+        header_start = len(SNAPSHOT_MAGIC) + struct.calcsize(HEADER_LENGTH_FORMAT)
+        (header_length,) = struct.unpack_from(HEADER_LENGTH_FORMAT, contents, len(SNAPSHOT_MAGIC))
+        if marshal.loads(contents[header_start:header_start + header_length]) != snapshot_header(source_files):
+            return None
+        records = marshal.loads(contents[header_start + header_length:])
+    except (EOFError, ValueError, TypeError, OSError, struct.error) as e:
+        print(f"Ignoring unreadable card snapshot at {snapshot_file}: {e}")
+        return None
+    return dict(api_card_from_record(record) for record in records)
@@ -0,0 +1,147 @@
+import numpy as np
+from .card import ApiCard
+
+# the lorcast api has null strength for these characters, they are actually 0
+CARD_IDS_WITH_ZERO_STRENGTH = [
+    "herculesspectraldemigod",
+    "squeakscozycaterpillar",
+    "thomaswide-eyedrecruit",
+    "flitreflectivehummingbird",
+    'rapunzelgiftedartist'
+]
+
+MISSING_STAT = -1
+OUTER_KEY_ONLY = object() # marks a bucket that only creates the outer key of a nested distribution
+
+def expects_no_lore(api_card):
+    if 'Reckless' in api_card.keywords:
+        return True
+    if api_card.full_name == "Mulan - Resourceful Recruit":
+        return True
+    return False
+
+def to_column(values: list, dtype) -> np.ndarray:
+    return np.array([MISSING_STAT if value is None else value for value in values], dtype=dtype)
+
+def from_column_value(value: int) -> int | None:
+    return None if value == MISSING_STAT else int(value)
+
+def to_bitmask_column(values_per_card: list[list[str]], bit_names: list[str]) -> np.ndarray:
+    bit_by_name = {name: 1 << bit for bit, name in enumerate(bit_names)}
+    return np.array([sum(bit_by_name[value] for value in set(values)) for values in values_per_card], dtype=np.uint32)
+
+def ordered_unique(values_per_card: list[list[str]]) -> list[str]:
+    return list(dict.fromkeys(value for values in values_per_card for value in values))
+
+class Grouping:
+    """
+    Maps cards onto the buckets of one distribution as parallel (card index, bucket) arrays, a card can land
+    in several buckets (e.g. one per classification). Buckets are the distinct rows of key_codes, decoded
+    back to (outer, inner) keys for nested distributions or a single key otherwise.
+    """
+    def __init__(self, pair_card_index: np.ndarray, key_codes: np.ndarray, decode_key, nested: bool = True):
+        self.nested = nested
+        unique_key_codes, pair_bucket = np.unique(key_codes, axis=0, return_inverse=True)
+        pair_bucket = pair_bucket.reshape(-1)
+        self.keys: list[object] = [decode_key(*key_code) for key_code in unique_key_codes]
+        # pairs sorted by bucket so each bucket is one contiguous run that add.reduceat can sum
+        order = np.argsort(pair_bucket, kind='stable')
+        self.sorted_card_index = pair_card_index[order]
+        self.bucket_starts = np.searchsorted(pair_bucket[order], np.arange(len(self.keys)))
+
+    def totals(self, weights: np.ndarray) -> np.ndarray:
+        # weights is (num_formats, num_cards), the result is (num_formats, num_buckets)
+        if len(self.keys) == 0:
+            return np.zeros((weights.shape[0], 0))
+        return np.add.reduceat(weights[:, self.sorted_card_index], self.bucket_starts, axis=1)
+
+    def to_distribution(self, totals: np.ndarray, presence: np.ndarray) -> dict:
+        distribution = {}
+        for bucket in np.flatnonzero(presence):
+            key = self.keys[bucket]
+            if not self.nested:
+                distribution[key] = float(totals[bucket])
+                continue
+            outer_key, inner_key = key
+            inner_distribution = distribution.setdefault(outer_key, {})
+            if inner_key is not OUTER_KEY_ONLY:
+                inner_distribution[inner_key] = float(totals[bucket])
+        return distribution
+
+    def distributions(self, weights: np.ndarray) -> list[dict]:
+        weights_2d = np.atleast_2d(weights)
+        totals = self.totals(weights_2d)
+        presence = self.totals((weights_2d > 0).astype(np.float64))
+        return [self.to_distribution(totals[row], presence[row]) for row in range(weights_2d.shape[0])]
+
+class CardTable:
+    """
+    Column oriented, NumPy backed view of every ApiCard, built once per load of the card data. Analytics
+    turn a format into a per-card weight vector and compute distributions with add.reduceat instead
+    of dereferencing ApiCards one attribute at a time, which also lets batch jobs analyze many formats at once.
+    """
+    def __init__(self, id_to_api_card: dict[str, ApiCard]):
+        api_cards: list[ApiCard] = list(id_to_api_card.values())
+        self.card_ids: list[str] = list(id_to_api_card.keys())
+        self.card_index: dict[str, int] = {card_id: index for index, card_id in enumerate(self.card_ids)}
+        self.index = np.arange(len(api_cards), dtype=np.int32)
+        self.cost = to_column([api_card.cost for api_card in api_cards], np.int16)
+        self.strength = to_column([api_card.strength for api_card in api_cards], np.int16)
+        self.willpower = to_column([api_card.willpower for api_card in api_cards], np.int16)
+        self.lore = to_column([api_card.lore for api_card in api_cards], np.int16)
+        self.inkable = to_column([api_card.inkable for api_card in api_cards], np.int8)
+        self.card_types: list[str] = ordered_unique([api_card.types for api_card in api_cards])
+        self.type_mask = to_bitmask_column([api_card.types for api_card in api_cards], self.card_types)
+        self.inks: list[str] = ordered_unique([api_card.inks or [api_card.color] for api_card in api_cards])
+        self.ink_mask = to_bitmask_column([api_card.inks or [api_card.color] for api_card in api_cards], self.inks)
+        # there are more classifications than fit in a 64 bit mask, so classification membership is a boolean matrix
+        self.classifications: list[str] = ordered_unique([api_card.classifications for api_card in api_cards])
+        self.classification_membership = np.zeros((len(api_cards), len(self.classifications)), dtype=bool)
+        classification_index = {classification: index for index, classification in enumerate(self.classifications)}
+        for index, api_card in enumerate(api_cards):
+            for classification in api_card.classifications:
+                self.classification_membership[index, classification_index[classification]] = True
+
+        self.groupings: dict[str, Grouping] = self.generate_groupings(api_cards)
+
+    def generate_groupings(self, api_cards: list[ApiCard]) -> dict[str, Grouping]:
+        cost_keys = lambda cost, value: (from_column_value(cost), from_column_value(value))
+        characters = np.flatnonzero(self.type_mask & (1 << self.card_types.index('Character'))) if 'Character' in self.card_types else np.array([], dtype=np.int64)
+        strength = np.where(self.strength == MISSING_STAT, 0, self.strength)
+        lore = np.array([0 if api_card.lore is None and expects_no_lore(api_card) else MISSING_STAT for api_card in api_cards], dtype=np.int16)
+        lore = np.where(self.lore == MISSING_STAT, lore, self.lore)
+        type_cards, type_bits = np.nonzero((self.type_mask[:, None] >> np.arange(len(self.card_types))) & 1)
+        classification_cards, classification_codes = np.nonzero(self.classification_membership)
+        return {
+            'countAtTableByCardType': Grouping(type_cards, type_bits[:, None], lambda bit: self.card_types[bit], nested=False),
+            'strengthDistributionByCost': Grouping(characters, np.stack([self.cost[characters], strength[characters]], axis=1), cost_keys),
+            'willpowerDistributionByCost': Grouping(characters, np.stack([self.cost[characters], self.willpower[characters]], axis=1), cost_keys),
+            'loreDistributionByCost': Grouping(characters, np.stack([self.cost[characters], lore[characters]], axis=1), cost_keys),
+            'costDistributionByClassification': Grouping(classification_cards, np.stack([classification_codes, self.cost[classification_cards]], axis=1), lambda code, cost: (self.classifications[code], from_column_value(cost))),
+            'inkabilityByCost': Grouping(self.index, np.stack([self.cost, self.inkable], axis=1), lambda cost, inkable: (from_column_value(cost), None if inkable == MISSING_STAT else bool(inkable))),
+        }
+
+    def __len__(self) -> int:
+        return len(self.card_ids)
+
+    def weights_for(self, count_at_table_by_card_id_list: list[dict[str, float]]) -> np.ndarray:
+        weights = np.zeros((len(count_at_table_by_card_id_list), len(self.card_ids)))
+        for row, count_at_table_by_card_id in enumerate(count_at_table_by_card_id_list):
+            for card_id, count_at_table in count_at_table_by_card_id.items():
+                card_index = self.card_index.get(card_id)
+                if card_index is not None:
+                    weights[row, card_index] += count_at_table
+        return weights
+
+    def rating_grouping(self, id_to_letter_rating: dict[str, str]) -> Grouping:
+        # cards without a rating still create their cost's (empty) entry, like the single format analysis does
+        ratings = list(dict.fromkeys(id_to_letter_rating.values()))
+        rating_code = {rating: code for code, rating in enumerate(ratings)}
+        rating_codes = np.array([rating_code.get(id_to_letter_rating.get(card_id), MISSING_STAT) for card_id in self.card_ids], dtype=np.int32)
+        return Grouping(self.index, np.stack([self.cost.astype(np.int32), rating_codes], axis=1), lambda cost, code: (from_column_value(cost), OUTER_KEY_ONLY if code == MISSING_STAT else ratings[code]))
+
+    def distributions(self, weights: np.ndarray, id_to_letter_rating: dict[str, str]) -> list[dict[str, dict]]:
+        groupings = dict(self.groupings)
+        groupings['ratingDistributionByCost'] = self.rating_grouping(id_to_letter_rating)
+        distributions_by_field = {response_field: grouping.distributions(weights) for response_field, grouping in groupings.items()}
+        return [{response_field: distributions[row] for response_field, distributions in distributions_by_field.items()} for row in range(np.atleast_2d(weights).shape[0])]
@@ -0,0 +1,57 @@
+import atexit
+import threading
+from collections import defaultdict
+from .cube_dao import cube_dao
+from .startup import startup
+
+COUNTER_FLUSH_INTERVAL_SECONDS = 10.0
+PAGE_VIEWS = 'page_views'
+CARD_LIST_VIEWS = 'card_list_views'
+DRAFTS = 'drafts'
+
+class CubeCounterBuffer:
+    """
+    Accumulates view / draft counter increments per cube in memory and writes them to the database
+    in one batched UPDATE every COUNTER_FLUSH_INTERVAL_SECONDS, keeping counter writes off the request path.
+    """
+    def __init__(self, flush_interval_seconds: float = COUNTER_FLUSH_INTERVAL_SECONDS):
+        self.flush_interval_seconds = flush_interval_seconds
+        self.cube_id_to_counter_deltas: dict[bytes, dict[str, int]] = {}
+        self.lock = threading.Lock()
+        self.timer: threading.Timer = None
+
+    def increment(self, cube_id: bytes, counter: str, delta: int = 1):
+        with self.lock:
+            counter_deltas = self.cube_id_to_counter_deltas.setdefault(cube_id, defaultdict(int))
+            counter_deltas[counter] += delta
+
+    def flush(self) -> int:
+        with self.lock:
+            cube_id_to_counter_deltas = self.cube_id_to_counter_deltas
+            self.cube_id_to_counter_deltas = {}
+        if not cube_id_to_counter_deltas:
+            return 0
+        try:
+            cube_dao.apply_counter_deltas(cube_id_to_counter_deltas)
+        except Exception as e:
+            print(f"Failed to flush counters for {len(cube_id_to_counter_deltas)} cubes, will retry: {e}")
+            # put them back so the next flush retries them along with anything new
+            for cube_id, counter_deltas in cube_id_to_counter_deltas.items():
+                for counter, delta in counter_deltas.items():
+                    self.increment(cube_id, counter, delta)
+            return 0
+        return len(cube_id_to_counter_deltas)
+
+    def _handle_timer(self):
+        self.flush()
+
+        self.timer = threading.Timer(self.flush_interval_seconds, self._handle_timer)
+        self.timer.daemon = True  # Dies when main thread dies, atexit flushes whatever is left
+        self.timer.start()
+
+    def init(self):
+        atexit.register(self.flush)
+        self._handle_timer()
+
+cube_counter_buffer: CubeCounterBuffer = CubeCounterBuffer()
+startup.register('cube_counter_buffer', cube_counter_buffer.init)
@@ -1,9 +1,8 @@
 import uuid
-import json
 from pathlib import Path
-from typing import List, Optional
-from sqlalchemy.orm import column_property
-from sqlalchemy import Column, String, Integer, JSON, func, exc
+from typing import Iterator, List, Optional
+from sqlalchemy import Column, String, Integer, Double, JSON, ForeignKey, Row, select, func, exc, update, bindparam, or_, and_
+from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.mysql import BINARY, VARCHAR, TEXT
 from . import api
 from .database import Base, db_connection
@@ -13,6 +12,25 @@ PAGE_VIEW_COEFFICIENT = 1
 LIST_VIEW_COEFFICIENT = 1
 DRAFT_COEFFICIENT = 5 
 OPERATIONAL_ERROR_RETRIES = 1
+# stored trendiness within this of the recomputed value is left alone by recompute_trendiness
+TRENDINESS_TOLERANCE = 1e-9
+
+class DbCubecanaCubeCard(Base):
+    # normalized copy of card_id_to_count, one row per printing, so card-centric queries are index lookups
+    __tablename__ = 'cubecana_cube_cards'
+    pk = Column(Integer, primary_key=True)
+    cube_pk = Column(Integer, ForeignKey('cubecana_cubes.pk', ondelete='CASCADE'), nullable=False, index=True)
+    card_id = Column(VARCHAR(255), nullable=False, index=True)
+    set_code = Column(VARCHAR(32))
+    collector_id = Column(VARCHAR(32))
+    count = Column(Integer, nullable=False)
+
+class DbCubecanaCubeTag(Base):
+    # normalized copy of tags, so tag filters are index lookups instead of json_contains over every cube
+    __tablename__ = 'cubecana_cube_tags'
+    pk = Column(Integer, primary_key=True)
+    cube_pk = Column(Integer, ForeignKey('cubecana_cubes.pk', ondelete='CASCADE'), nullable=False, index=True)
+    tag = Column(VARCHAR(255, charset='utf8mb4', collation='utf8mb4_unicode_ci'), nullable=False, index=True)
 
 class DbCubecanaCube(Base):
     __tablename__ = 'cubecana_cubes'
@@ -37,7 +55,14 @@ class DbCubecanaCube(Base):
     drafts = Column(Integer, default=0)
     featured_card_printing = Column(VARCHAR(256, charset='utf8mb4', collation='utf8mb4_unicode_ci'))      
     cube_description = Column(VARCHAR(4096, charset='utf8mb4', collation='utf8mb4_unicode_ci'))      
-    trendiness = column_property(popularity / (func.datediff(func.now(), func.from_unixtime(last_updated_epoch_seconds)) + 1)) # popularity / num days since last update 
+    trendiness = Column(Double, default=0) # popularity / num days since last update, see trendiness_of
+    # written along with card_id_to_count / tags, only loaded when accessed
+    cards = relationship(DbCubecanaCubeCard, cascade='all, delete-orphan', passive_deletes=True)
+    cube_tags = relationship(DbCubecanaCubeTag, cascade='all, delete-orphan', passive_deletes=True)
+
+def trendiness_of(popularity, last_updated_epoch_seconds):
+    # stored + indexed so the directory's default sort is an index scan, kept fresh by the counter flushes + recompute_trendiness
+    return popularity / (func.datediff(func.now(), func.from_unixtime(last_updated_epoch_seconds)) + 1)
 
 API_SORT_TYPE_TO_COLUMN = {
     api.SortType.RANK: DbCubecanaCube.popularity,
@@ -45,6 +70,35 @@ API_SORT_TYPE_TO_COLUMN = {
     api.SortType.TRENDING: DbCubecanaCube.trendiness,
 }
 
+# python types a cursor's sort value can have per sort, None is allowed too where the column is nullable
+API_SORT_TYPE_TO_CURSOR_VALUE_TYPES = {
+    api.SortType.RANK: (int, float),
+    api.SortType.DATE: (int,),
+    api.SortType.TRENDING: (int, float),
+}
+
+def after_cursor(sort_column, order: api.OrderType, sort_value, pk: int):
+    # rows strictly after (sort_value, pk) in the (sort_column, pk) order, MySQL sorts NULLs first ascending / last descending
+    if order == api.OrderType.DESC:
+        if sort_value is None:
+            return and_(sort_column.is_(None), DbCubecanaCube.pk < pk)
+        return or_(sort_column < sort_value, sort_column.is_(None), and_(sort_column == sort_value, DbCubecanaCube.pk < pk))
+    if sort_value is None:
+        return or_(sort_column.isnot(None), and_(sort_column.is_(None), DbCubecanaCube.pk > pk))
+    return or_(sort_column > sort_value, and_(sort_column == sort_value, DbCubecanaCube.pk > pk))
+
+def filter_cubes(query, tags: Optional[List[str]], power_bands: Optional[List[str]]):
+    if tags is not None and len(tags) > 0 and tags[0] != "":
+        # every tag has to match, like json_contains on the tags column did
+        for tag in tags:
+            query = query.filter(DbCubecanaCube.pk.in_(select(DbCubecanaCubeTag.cube_pk).where(DbCubecanaCubeTag.tag == tag)))
+    if power_bands is not None and len(power_bands) > 0 and power_bands[0] != "":
+        query = query.filter(DbCubecanaCube.power_band.isnot(None)).filter(DbCubecanaCube.power_band.in_(power_bands))
+    return query
+
+def cursor_values(db_cube: DbCubecanaCube, sort: api.SortType) -> tuple[object, int]:
+    return getattr(db_cube, API_SORT_TYPE_TO_COLUMN[sort].key), db_cube.pk
+
 class CubeDao:
     def __init__(self):
         # Use the shared database connection
@@ -75,47 +129,59 @@ class CubeDao:
             if session:
                 session.close()
 
-    def increment_card_list_views(self, cube_id: bytes) -> None:
-        def operation(session, cube_id):
-            cube = session.query(DbCubecanaCube).filter(DbCubecanaCube.id == cube_id).first()
-            if cube:
-                cube.card_list_views += 1
-                cube.popularity = (
-                    cube.drafts * DRAFT_COEFFICIENT +
-                    cube.card_list_views * LIST_VIEW_COEFFICIENT +
-                    cube.page_views * PAGE_VIEW_COEFFICIENT
-                )
-                session.commit()
+    def apply_counter_deltas(self, cube_id_to_counter_deltas: dict[bytes, dict[str, int]]) -> None:
+        # one executemany UPDATE for every buffered cube, counters and popularity are computed in SQL so
+        # concurrent writers never lose increments. MySQL evaluates SET clauses left to right against already
+        # updated columns, so popularity + trendiness (old values + deltas) are set before the counters.
+        table = DbCubecanaCube.__table__
+        page_views = table.c.page_views + bindparam('page_views_delta')
+        card_list_views = table.c.card_list_views + bindparam('card_list_views_delta')
+        drafts = table.c.drafts + bindparam('drafts_delta')
+        popularity = drafts * DRAFT_COEFFICIENT + card_list_views * LIST_VIEW_COEFFICIENT + page_views * PAGE_VIEW_COEFFICIENT
+        statement = (
+            update(table)
+            .where(table.c.id == bindparam('cube_id'))
+            .ordered_values(
+                (table.c.popularity, popularity),
+                (table.c.trendiness, trendiness_of(popularity, table.c.last_updated_epoch_seconds)),
+                (table.c.page_views, page_views),
+                (table.c.card_list_views, card_list_views),
+                (table.c.drafts, drafts),
+            )
+        )
+        parameters = [
+            {
+                'cube_id': cube_id,
+                'page_views_delta': counter_deltas.get('page_views', 0),
+                'card_list_views_delta': counter_deltas.get('card_list_views', 0),
+                'drafts_delta': counter_deltas.get('drafts', 0),
+            }
+            for cube_id, counter_deltas in cube_id_to_counter_deltas.items()
+        ]
 
-        self.execute(operation, cube_id=cube_id)
+        def operation(session, parameters):
+            session.execute(statement, parameters)
+            session.commit()
 
-    def increment_page_views(self, cube_id: bytes) -> None:
-        def operation(session, cube_id):
-            cube = session.query(DbCubecanaCube).filter(DbCubecanaCube.id == cube_id).first()
-            if cube:
-                cube.page_views += 1
-                cube.popularity = (
-                    cube.drafts * DRAFT_COEFFICIENT +
-                    cube.card_list_views * LIST_VIEW_COEFFICIENT +
-                    cube.page_views * PAGE_VIEW_COEFFICIENT
-                )
-                session.commit()
+        self.execute(operation, parameters=parameters)
 
-        self.execute(operation, cube_id=cube_id)
+    def recompute_trendiness(self) -> int:
+        # trendiness decays as days pass without any writes to the cube, unpopular cubes stay at 0.
+        # only rows whose day bucket moved are written, the rest already hold the same value
+        trendiness = trendiness_of(DbCubecanaCube.popularity, DbCubecanaCube.last_updated_epoch_seconds)
+        statement = (
+            update(DbCubecanaCube.__table__)
+            .where(DbCubecanaCube.popularity > 0)
+            .where(or_(DbCubecanaCube.trendiness.is_(None), func.abs(DbCubecanaCube.trendiness - trendiness) > TRENDINESS_TOLERANCE))
+            .values(trendiness=trendiness)
+        )
 
-    def increment_drafts(self, cube_id: bytes) -> None:
-        def operation(session, cube_id):
-            cube = session.query(DbCubecanaCube).filter(DbCubecanaCube.id == cube_id).first()
-            if cube:
-                cube.drafts += 1
-                cube.popularity = (
-                    cube.drafts * DRAFT_COEFFICIENT +
-                    cube.card_list_views * LIST_VIEW_COEFFICIENT +
-                    cube.page_views * PAGE_VIEW_COEFFICIENT
-                )
-                session.commit()
+        def operation(session):
+            result = session.execute(statement)
+            session.commit()
+            return result.rowcount
 
-        self.execute(operation, cube_id=cube_id)
+        return self.execute(operation)
 
     def create_cubecana_cube(self, cube: DbCubecanaCube) -> None:
         def operation(session, cube: DbCubecanaCube):
@@ -131,9 +197,12 @@ class CubeDao:
                 cube.name = updated_cube.name
                 cube.card_id_to_count = updated_cube.card_id_to_count
                 cube.tags = updated_cube.tags
+                cube.cards = updated_cube.cards
+                cube.cube_tags = updated_cube.cube_tags
                 cube.link = updated_cube.link
                 cube.author = updated_cube.author
                 cube.last_updated_epoch_seconds = updated_cube.last_updated_epoch_seconds
+                cube.trendiness = cube.popularity or 0 # just updated, so 0 days since the last update
                 cube.edit_secret = updated_cube.edit_secret
                 cube.boosters_per_player = updated_cube.boosters_per_player
                 cube.cards_per_booster = updated_cube.cards_per_booster
@@ -141,9 +210,6 @@ class CubeDao:
                 cube.color_balance_packs = updated_cube.color_balance_packs
                 cube.with_replacement = updated_cube.with_replacement
                 cube.power_band = updated_cube.power_band
-                cube.card_list_views = updated_cube.card_list_views
-                cube.page_views = updated_cube.page_views          
-                cube.drafts = updated_cube.drafts
                 cube.featured_card_printing = updated_cube.featured_card_printing 
                 cube.cube_description = updated_cube.cube_description
                 session.commit()
@@ -166,21 +232,57 @@ class CubeDao:
 
         return self.execute(operation, cube_id=cube_id)
 
-    def get_cubecana_cubes(self, page: int, per_page: int, sort: api.SortType, order: api.OrderType, tags: Optional[List[str]] = None, power_bands: Optional[List[str]] = None) -> List[DbCubecanaCube]:
-        def operation(session, page, per_page, sort, order, tags, power_bands   ):
+    def get_cubecana_cubes(self, page: int, per_page: int, sort: api.SortType, order: api.OrderType, tags: Optional[List[str]] = None, power_bands: Optional[List[str]] = None, after: Optional[tuple[object, int]] = None) -> List[DbCubecanaCube]:
+        # after is the cursor_values of the last cube of the previous page, seeks past it instead of offsetting by page
+        def operation(session, page, per_page, sort, order, tags, power_bands, after):
             sort_column = API_SORT_TYPE_TO_COLUMN[sort]
-            query = session.query(DbCubecanaCube)
-            if tags is not None and len(tags) > 0 and tags[0] != "":
-                query = query.filter(DbCubecanaCube.tags.isnot(None)).filter(func.json_contains(DbCubecanaCube.tags, json.dumps(tags)))
-            if power_bands is not None and len(power_bands) > 0 and power_bands[0] != "":
-                query = query.filter(DbCubecanaCube.power_band.isnot(None)).filter(DbCubecanaCube.power_band.in_(power_bands))
+            query = filter_cubes(session.query(DbCubecanaCube), tags, power_bands)
+            # pk breaks ties so pages are stable, the sort indexes include it
             if order == api.OrderType.DESC:
-                query = query.order_by(sort_column.desc())
+                query = query.order_by(sort_column.desc(), DbCubecanaCube.pk.desc())
             else:
-                query = query.order_by(sort_column.asc())
+                query = query.order_by(sort_column.asc(), DbCubecanaCube.pk.asc())
+            if after is not None:
+                return query.filter(after_cursor(sort_column, order, *after)).limit(per_page).all()
             return query.offset((page - 1) * per_page).limit(per_page).all()
 
-        return self.execute(operation, page=page, per_page=per_page, sort=sort, order=order, tags=tags, power_bands=power_bands)
+        return self.execute(operation, page=page, per_page=per_page, sort=sort, order=order, tags=tags, power_bands=power_bands, after=after)
+
+    def iter_cube_list_rows(self, chunk_size: int, tags: Optional[List[str]] = None, power_bands: Optional[List[str]] = None) -> Iterator[Row]:
+        # streams (pk, id, card_id_to_count, tags, power_band, last_updated_epoch_seconds) rows in pk order, one keyset chunk / session at a time,
+        # so full table jobs hold a single chunk in memory instead of every ORM row
+        def operation(session, after_pk):
+            query = session.query(DbCubecanaCube.pk, DbCubecanaCube.id, DbCubecanaCube.card_id_to_count, DbCubecanaCube.tags, DbCubecanaCube.power_band, DbCubecanaCube.last_updated_epoch_seconds)
+            query = filter_cubes(query, tags, power_bands).filter(DbCubecanaCube.pk > after_pk)
+            return query.order_by(DbCubecanaCube.pk.asc()).limit(chunk_size).all()
+
+        after_pk = 0
+        while True:
+            rows = self.execute(operation, after_pk=after_pk)
+            yield from rows
+            if len(rows) < chunk_size:
+                return
+            after_pk = rows[-1].pk
+
+    def get_cubecana_cubes_containing_card(self, card_id: str, page: int, per_page: int) -> List[DbCubecanaCube]:
+        def operation(session, card_id, page, per_page):
+            cube_pks = select(DbCubecanaCubeCard.cube_pk).where(DbCubecanaCubeCard.card_id == card_id)
+            query = session.query(DbCubecanaCube).filter(DbCubecanaCube.pk.in_(cube_pks))
+            query = query.order_by(DbCubecanaCube.popularity.desc(), DbCubecanaCube.pk.desc())
+            return query.offset((page - 1) * per_page).limit(per_page).all()
+
+        return self.execute(operation, card_id=card_id, page=page, per_page=per_page)
+
+    def replace_cube_cards_and_tags(self, cube_id: bytes, cards: List[DbCubecanaCubeCard], cube_tags: List[DbCubecanaCubeTag]) -> None:
+        # rewrites a cube's normalized tables from its JSON columns, see CubeManager.backfill_cube_cards_and_tags
+        def operation(session, cube_id, cards, cube_tags):
+            cube = session.query(DbCubecanaCube).filter(DbCubecanaCube.id == cube_id).first()
+            if cube:
+                cube.cards = cards
+                cube.cube_tags = cube_tags
+                session.commit()
+
+        self.execute(operation, cube_id=cube_id, cards=cards, cube_tags=cube_tags)
 
     def get_cubecana_cube_count(self) -> int:
         def operation(session):
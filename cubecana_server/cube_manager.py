@@ -1,19 +1,91 @@
+import base64
+import binascii
 import json
+import math
 import uuid
 import time
-from dataclasses import dataclass
-from typing import List
+import threading
+from dataclasses import dataclass, replace
+from typing import Callable, Iterator, List
 from . import api
 import uuid
 from .settings import Settings
 from . import card_list_helper
-from .cube_dao import cube_dao, DbCubecanaCube
+from . import server_timing
+from .cube_dao import cube_dao, DbCubecanaCube, DbCubecanaCubeCard, DbCubecanaCubeTag, cursor_values, API_SORT_TYPE_TO_COLUMN, API_SORT_TYPE_TO_CURSOR_VALUE_TYPES
+from .lcc_error import InvalidCursorError
 from .cubecana_cube import CubecanaCube
 from .card import PrintingId, toPrintingId
-from .lorcast_api import lorcast_api as lorcana_api
+from .lorcast_api import lorcast_api as lorcana_api, CardDataChange
 from .dreamborn_manager import dreamborn_manager
+from .lru_cache import LruCache
+from .cube_counter_buffer import cube_counter_buffer, PAGE_VIEWS, CARD_LIST_VIEWS, DRAFTS
+from .startup import startup
+
+CUBE_CACHE_MAX_SIZE = 512
+# view / draft counters of a cube are only bumped locally, bound how stale other processes' bumps can get
+CUBE_CACHE_TTL_SECONDS = 300
+TRENDINESS_RECOMPUTE_INTERVAL_SECONDS = 3600
+# the directory shows the total on every page, it doesn't need to be exact to the second
+CUBE_COUNT_TTL_SECONDS = 60
+CUBE_COUNT_CACHE_KEY = 'count'
+CUBE_EXPORT_CHUNK_SIZE = 500
+
+@dataclass(frozen=True)
+class CubeListRecord:
+    cube_id: str
+    printing_id_to_count: dict[PrintingId, int]
+    tags: List[str]
+    power_band: str
+    last_updated_epoch_seconds: int
 
 class CubeManager:
+    def __init__(self):
+        self.cache = LruCache(CUBE_CACHE_MAX_SIZE, CUBE_CACHE_TTL_SECONDS)
+        self.trendiness_timer: threading.Timer = None
+        self.count_cache = LruCache(1, CUBE_COUNT_TTL_SECONDS)
+        self.cube_change_listeners: list[Callable[[CubecanaCube | None, CubecanaCube | None], None]] = []
+
+    def add_cube_change_listener(self, listener: Callable[[CubecanaCube | None, CubecanaCube | None], None]):
+        # called with (old cube, new cube) after every create (old is None), update and delete (new is None)
+        self.cube_change_listeners.append(listener)
+
+    def notify_cube_change(self, old_cube: CubecanaCube | None, new_cube: CubecanaCube | None):
+        for listener in self.cube_change_listeners:
+            try:
+                listener(old_cube, new_cube)
+            except Exception as e:
+                print(f"Cube change listener failed: {e}")
+
+    def init(self):
+        lorcana_api.add_card_data_listener(self.on_card_data_change)
+        # the first run waits an interval too, starting up shouldn't hit the database
+        self.schedule_trendiness_recompute()
+
+    def on_card_data_change(self, card_data_change: CardDataChange):
+        # hydration resolves bare legacy card ids to their default printing and drops the ones the card data
+        # doesn't know, a cached cube keeps no trace of either, so every swap drops the cached cubes
+        self.cache.clear()
+
+    def _handle_trendiness_timer(self):
+        try:
+            print(f"Recomputed trendiness of {cube_dao.recompute_trendiness()} cubes")
+        except Exception as e:
+            print(f"Failed to recompute trendiness: {e}")
+        self.schedule_trendiness_recompute()
+
+    def schedule_trendiness_recompute(self):
+        self.trendiness_timer = threading.Timer(TRENDINESS_RECOMPUTE_INTERVAL_SECONDS, self._handle_trendiness_timer)
+        self.trendiness_timer.daemon = True  # Dies when main thread dies
+        self.trendiness_timer.start()
+
+    def cache_key(self, id: str) -> str:
+        # normalizes the id, and raises ValueError for invalid ids like uuid.UUID always did
+        return str(uuid.UUID(id))
+
+    def get_cache_stats(self) -> dict[str, int | float]:
+        return self.cache.stats()
+
     def determine_printing_id(self, maybe_printing_id_str:str) -> PrintingId:
         tokens = maybe_printing_id_str.split("-")
         if len(tokens) == 3:
@@ -89,10 +161,45 @@ class CubeManager:
             featured_card_printing=featured_card_printing_str,
             cube_description=cc_cube.cube_description,
             popularity=0,
+            cards=self.to_db_cubecana_cube_cards(cc_cube.printing_id_to_count),
+            cube_tags=self.to_db_cubecana_cube_tags(cc_cube.tags),
         )
 
+    def to_db_cubecana_cube_cards(self, printing_id_to_count: dict[PrintingId, int]) -> List[DbCubecanaCubeCard]:
+        return [DbCubecanaCubeCard(card_id=printing_id.card_id, set_code=printing_id.set_code, collector_id=printing_id.collector_id, count=count) for printing_id, count in printing_id_to_count.items()]
+
+    def to_db_cubecana_cube_tags(self, tags: List[str]) -> List[DbCubecanaCubeTag]:
+        return [DbCubecanaCubeTag(tag=tag) for tag in dict.fromkeys(tags or [])]
+
     def get_cube_count(self):
-       return cube_dao.get_cubecana_cube_count()
+        count = self.count_cache.get(CUBE_COUNT_CACHE_KEY)
+        if count is None:
+            count = cube_dao.get_cubecana_cube_count()
+            self.count_cache.put(CUBE_COUNT_CACHE_KEY, count)
+        return count
+
+    def encode_cursor(self, sort: api.SortType, values: tuple[object, int]) -> str:
+        # opaque to clients, the sort is included so a cursor can't be replayed against another sort
+        return base64.urlsafe_b64encode(json.dumps([sort, *values]).encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, cursor: str, sort: api.SortType) -> tuple[object, int]:
+        try:
+            cursor_sort, sort_value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        except (ValueError, TypeError, binascii.Error):
+            raise InvalidCursorError(f"Invalid cursor: {cursor}")
+        if cursor_sort != sort or sort not in API_SORT_TYPE_TO_CURSOR_VALUE_TYPES:
+            raise InvalidCursorError(f"Cursor {cursor} does not belong to sort {sort}")
+        if not self.is_valid_cursor_value(sort, sort_value) or isinstance(pk, bool) or not isinstance(pk, int):
+            raise InvalidCursorError(f"Invalid cursor: {cursor}")
+        return sort_value, pk
+
+    def is_valid_cursor_value(self, sort: api.SortType, sort_value) -> bool:
+        # the values end up bound in the keyset filter, anything else than the column's type would fail in the db
+        if sort_value is None:
+            return API_SORT_TYPE_TO_COLUMN[sort].nullable
+        if isinstance(sort_value, bool) or not isinstance(sort_value, API_SORT_TYPE_TO_CURSOR_VALUE_TYPES[sort]):
+            return False
+        return not isinstance(sort_value, float) or math.isfinite(sort_value)
     
     def to_cube_list_entry(self, cube:CubecanaCube) -> api.CubeListEntry:
         expanded_tags = []
@@ -122,19 +229,28 @@ class CubeManager:
             featuredCardImageLink=featured_image_link
         )
 
-    def get_cubes(self, page: int = 1, per_page: int = 25, sort = api.SortType.TRENDING, order = api.OrderType.DESC, tags: List[str] = None) -> List[api.CubeListEntry]:
-        paginated_db_cubecana_cubes: List[DbCubecanaCube] = cube_dao.get_cubecana_cubes(page, per_page, sort, order, tags)
+    def get_cubes(self, page: int = 1, per_page: int = 25, sort = api.SortType.TRENDING, order = api.OrderType.DESC, tags: List[str] = None, cursor: str = None) -> tuple[List[api.CubeListEntry], str]:
+        # a cursor (the nextCursor of the previous page) takes precedence over page, returns the entries + the next cursor
+        after = self.decode_cursor(cursor, sort) if cursor else None
+        paginated_db_cubecana_cubes: List[DbCubecanaCube] = cube_dao.get_cubecana_cubes(page, per_page, sort, order, tags, after=after)
         paginated_cubes = [self.from_db_cubecana_cube(dbcube) for dbcube in paginated_db_cubecana_cubes]
         paginated_cube_list_entries: api.CubeListEntry = [self.to_cube_list_entry(cube) for cube in paginated_cubes]
-        return paginated_cube_list_entries
+        next_cursor = None
+        if len(paginated_db_cubecana_cubes) == per_page:
+            next_cursor = self.encode_cursor(sort, cursor_values(paginated_db_cubecana_cubes[-1], sort))
+        return paginated_cube_list_entries, next_cursor
 
-    def create_cube(self, api_create_cube: api.CreateCubeRequest):
+    def create_cube(self, api_create_cube: api.CreateCubeRequest, card_list_parse_result: card_list_helper.CardListParseResult = None):
         new_id = str(uuid.uuid4())
         edit_secret = str(uuid.uuid4())
-        printing_id_to_count = card_list_helper.printing_id_to_count_from(api_create_cube.cardListText.split('\n'))
+        # the result of validating the same card list text, when the caller already did
+        if card_list_parse_result is None:
+            card_list_parse_result = card_list_helper.validate_card_list(api_create_cube.cardListText)
+        printing_id_to_count = card_list_parse_result.printing_id_to_count
         featured_card_printing_id = None
         if api_create_cube.featuredCardPrintingId:
-            featured_card_printing_id: PrintingId = card_list_helper.printing_id_from_human_readable_string(api_create_cube.featuredCardPrintingId)
+            with server_timing.timed('resolve'):
+                featured_card_printing_id: PrintingId = card_list_helper.printing_id_from_human_readable_string(api_create_cube.featuredCardPrintingId)
         new_cube = CubecanaCube(
             name=api_create_cube.name,
             printing_id_to_count=printing_id_to_count,
@@ -155,14 +271,24 @@ class CubeManager:
             ),
         )
         db_cubecana_cube = self.to_db_cubecana_cube(new_cube)
-        cube_dao.create_cubecana_cube(db_cubecana_cube)
+        with server_timing.timed('db'):
+            cube_dao.create_cubecana_cube(db_cubecana_cube)
+        self.count_cache.clear()
+        self.notify_cube_change(None, new_cube)
         return new_cube
 
     def get_cube(self, id: str) -> CubecanaCube:
+        key = self.cache_key(id)
+        cube = self.cache.get(key)
+        if cube is not None:
+            return cube
+        # an update / delete that lands while the row is read invalidates the key, the old row isn't cached then
+        read_generation = self.cache.generation()
         db_cube = cube_dao.get_cubecana_cube_by_id(uuid.UUID(id).bytes)
         if not db_cube:
            return None
         cube = self.from_db_cubecana_cube(db_cube)
+        self.cache.put(key, cube, read_generation)
         return cube
 
     def delete_cube(self, id: str, edit_secret: str):
@@ -171,35 +297,51 @@ class CubeManager:
         if cube.edit_secret != edit_secret:
             return False
         cube_dao.delete_cubecana_cube(uuid.UUID(id).bytes)
+        self.cache.invalidate(self.cache_key(id))
+        self.count_cache.clear()
+        if self.cube_change_listeners:
+            self.notify_cube_change(self.from_db_cubecana_cube(cube), None)
         return True
 
+    def increment_counter(self, cube: CubecanaCube, counter: str):
+        # keeps the cached cube in step with the database without reloading it. Only bumps the entry that is
+        # still cached, so a view racing an update / delete can't write the old cube back or extend its ttl
+        self.cache.update(self.cache_key(cube.id), lambda cached_cube: replace(cached_cube, **{counter: getattr(cached_cube, counter) + 1}))
+
     def increment_drafts(self, id: str):
-        cube = cube_dao.get_cubecana_cube_by_id(uuid.UUID(id).bytes)
+        cube = self.get_cube(id)
         if not cube:
             return False
-        cube_dao.increment_drafts(uuid.UUID(id).bytes)
+        cube_counter_buffer.increment(uuid.UUID(id).bytes, DRAFTS)
+        self.increment_counter(cube, DRAFTS)
         return True
 
     def increment_page_views(self, id: str):
-        cube = cube_dao.get_cubecana_cube_by_id(uuid.UUID(id).bytes)
+        cube = self.get_cube(id)
         if not cube:
             return False
-        cube_dao.increment_page_views(uuid.UUID(id).bytes)
+        cube_counter_buffer.increment(uuid.UUID(id).bytes, PAGE_VIEWS)
+        self.increment_counter(cube, PAGE_VIEWS)
         return True
 
     def increment_card_list_views(self, id: str):
-        cube = cube_dao.get_cubecana_cube_by_id(uuid.UUID(id).bytes)
+        cube = self.get_cube(id)
         if not cube:
             return False
-        cube_dao.increment_card_list_views(uuid.UUID(id).bytes)
+        cube_counter_buffer.increment(uuid.UUID(id).bytes, CARD_LIST_VIEWS)
+        self.increment_counter(cube, CARD_LIST_VIEWS)
         return True
 
-    def update_cube(self, api_edit_cube: api.EditCubeRequest):
-        old_cube = cube_dao.get_cubecana_cube_by_id(uuid.UUID(api_edit_cube.id).bytes)
-        printing_id_to_count = card_list_helper.printing_id_to_count_from(api_edit_cube.cardListText.split('\n'))
+    def update_cube(self, api_edit_cube: api.EditCubeRequest, card_list_parse_result: card_list_helper.CardListParseResult = None):
+        with server_timing.timed('db'):
+            old_cube = cube_dao.get_cubecana_cube_by_id(uuid.UUID(api_edit_cube.id).bytes)
+        if card_list_parse_result is None:
+            card_list_parse_result = card_list_helper.validate_card_list(api_edit_cube.cardListText)
+        printing_id_to_count = card_list_parse_result.printing_id_to_count
         featured_card_printing_id: PrintingId = None
         if api_edit_cube.featuredCardPrintingId:
-            featured_card_printing_id = card_list_helper.printing_id_from_human_readable_string(api_edit_cube.featuredCardPrintingId)
+            with server_timing.timed('resolve'):
+                featured_card_printing_id = card_list_helper.printing_id_from_human_readable_string(api_edit_cube.featuredCardPrintingId)
         updated_cube = CubecanaCube(
             name=api_edit_cube.name,
             printing_id_to_count=printing_id_to_count,
@@ -224,14 +366,41 @@ class CubeManager:
         )
         db_cubecana_cube = self.to_db_cubecana_cube(updated_cube)
         id_bytes = uuid.UUID(updated_cube.id).bytes
-        cube_dao.update_cubecana_cube(cube_id=id_bytes, updated_cube=db_cubecana_cube)
+        with server_timing.timed('db'):
+            cube_dao.update_cubecana_cube(cube_id=id_bytes, updated_cube=db_cubecana_cube)
+        self.cache.invalidate(self.cache_key(updated_cube.id))
+        if self.cube_change_listeners:
+            self.notify_cube_change(self.from_db_cubecana_cube(old_cube), updated_cube)
         return updated_cube    
     
-    # big perf hit, do only on startup or when not under load
+    def get_cubes_containing_card(self, card_id: str, page: int = 1, per_page: int = 25) -> List[api.CubeListEntry]:
+        db_cubes: List[DbCubecanaCube] = cube_dao.get_cubecana_cubes_containing_card(card_id, page, per_page)
+        return [self.to_cube_list_entry(self.from_db_cubecana_cube(db_cube)) for db_cube in db_cubes]
+
+    # re-syncs cubecana_cube_cards / cubecana_cube_tags from the JSON columns, create_cubecana_cubes_8.sql already fills them for existing cubes
+    def backfill_cube_cards_and_tags(self):
+        num_cubes = 0
+        for cube_list_record in self.iter_cube_list_records():
+            cards = self.to_db_cubecana_cube_cards(cube_list_record.printing_id_to_count)
+            cube_tags = self.to_db_cubecana_cube_tags(cube_list_record.tags)
+            cube_dao.replace_cube_cards_and_tags(uuid.UUID(cube_list_record.cube_id).bytes, cards, cube_tags)
+            num_cubes += 1
+        print(f"Backfilled cards and tags of {num_cubes} cubes")
+
+    def iter_cube_list_records(self, tags: list[str] = None, power_bands: list[str] = None, chunk_size: int = CUBE_EXPORT_CHUNK_SIZE) -> Iterator[CubeListRecord]:
+        # constant memory export of every cube's contents for analytics jobs, in pk order
+        for row in cube_dao.iter_cube_list_rows(chunk_size, tags, power_bands):
+            yield CubeListRecord(
+                cube_id=str(uuid.UUID(bytes=row.id)),
+                printing_id_to_count=self.generate_printing_id_to_count(json.loads(row.card_id_to_count)),
+                tags=row.tags,
+                power_band=row.power_band,
+                last_updated_epoch_seconds=row.last_updated_epoch_seconds,
+            )
+
+    # still holds every list in memory, prefer iter_cube_list_records
     def get_all_cube_lists(self, tags: list[str] = None, power_bands: list[str] = None) -> List[dict[PrintingId, int]]:
-        count = self.get_cube_count()
-        db_cubes: list[DbCubecanaCube] = cube_dao.get_cubecana_cubes(page=1, per_page=count, sort=api.SortType.TRENDING, order=api.OrderType.DESC, tags=tags, power_bands=power_bands)
-        cube_lists = [self.from_db_cubecana_cube(db_cube).printing_id_to_count for db_cube in db_cubes]
-        return cube_lists
+        return [cube_list_record.printing_id_to_count for cube_list_record in self.iter_cube_list_records(tags, power_bands)]
         
-cube_manager: CubeManager = CubeManager()
\ No newline at end of file
+cube_manager: CubeManager = CubeManager()
+startup.register('cube_manager', cube_manager.init)
\ No newline at end of file
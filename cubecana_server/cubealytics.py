@@ -1,11 +1,15 @@
 import json
+import threading
 from dataclasses import dataclass
+from typing import TextIO
 from .cube_manager import CubeManager, cube_manager
+from .cubecana_cube import CubecanaCube
 from .settings import POWER_BAND_MAX, POWER_BAND_OVERPOWERED
 from .lorcast_api import lorcast_api as lorcana_api
 import csv
 from pathlib import Path
 from .card import PrintingId
+from .startup import startup
 
 @dataclass(frozen=True)
 class CardPopularityReport: 
@@ -18,31 +22,136 @@ class CardPopularityReport:
     def write_to_csv(self, filename: str):
         Path(filename).parent.mkdir(parents=True, exist_ok=True)
         with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(['Card Name','Set Number', 'Num Copies', 'Num Cubes Containing', 'Ratio Cubes Included'])
-            for card_id in self.id_to_num_copies_in_cubes:
-                api_card = lorcana_api.get_api_card(card_id)
-                if api_card is None:
-                    # print(f"Card ID {card_id} not found in API data while generating CardPopularityReport, skipping.")
-                    continue
-                full_name = api_card.full_name
-                set_code = api_card.default_printing.set_code
-                writer.writerow([
-                    full_name,
-                    set_code,
-                    self.id_to_num_copies_in_cubes[card_id],
-                    self.id_to_num_cubes_containing[card_id],
-                    self.id_to_ratio_cubes_included[card_id],
-                ])
+            self.write_csv(csvfile)
         print(f"CSV file created at {filename}")
 
+    def write_csv(self, csvfile: TextIO):
+        writer = csv.writer(csvfile)
+        writer.writerow(['Card Name','Set Number', 'Num Copies', 'Num Cubes Containing', 'Ratio Cubes Included'])
+        for card_id in self.id_to_num_copies_in_cubes:
+            api_card = lorcana_api.get_api_card(card_id)
+            if api_card is None:
+                # print(f"Card ID {card_id} not found in API data while generating CardPopularityReport, skipping.")
+                continue
+            full_name = api_card.full_name
+            set_code = api_card.default_printing.set_code
+            writer.writerow([
+                full_name,
+                set_code,
+                self.id_to_num_copies_in_cubes[card_id],
+                self.id_to_num_cubes_containing[card_id],
+                self.id_to_ratio_cubes_included[card_id],
+            ])
+
+class CardPopularityStore:
+    """
+    Card popularity across the cubes in included_power_bands. Seeded from the database the first time a report
+    is asked for, then kept current by applying each created / updated / deleted cube as a delta.
+    """
+    def __init__(self, included_power_bands: list[str]):
+        self.included_power_bands = included_power_bands
+        self.id_to_num_copies_in_cubes: dict[str, int] = {}
+        self.id_to_num_cubes_containing: dict[str, int] = {}
+        self.num_cubes = 0
+        self.seeded = False
+        # (old cube, new cube) changes that arrived while the seed was reading, None when not seeding
+        self.changes_during_seed: list[tuple[CubecanaCube | None, CubecanaCube | None]] | None = None
+        self.lock = threading.Lock()
+        # one seed at a time, the report waits on it without blocking cube changes on self.lock
+        self.seed_lock = threading.Lock()
+
+    def includes(self, cube: CubecanaCube) -> bool:
+        return cube is not None and cube.settings.power_band in self.included_power_bands
+
+    def counted_version(self, cube: CubecanaCube | None) -> int | None:
+        # the version of a cube the counts hold, None when they hold nothing of it
+        return cube.last_updated_epoch_seconds if self.includes(cube) else None
+
+    def apply(self, printing_id_to_count: dict[PrintingId, int], sign: int):
+        # counts every printing of a card in a cube as a cube containing it, like generate_card_popularity_report
+        for printing_id, count in printing_id_to_count.items():
+            card_id = printing_id.card_id
+            self.id_to_num_copies_in_cubes[card_id] = self.id_to_num_copies_in_cubes.get(card_id, 0) + sign * count
+            self.id_to_num_cubes_containing[card_id] = self.id_to_num_cubes_containing.get(card_id, 0) + sign
+            if self.id_to_num_cubes_containing[card_id] <= 0:
+                del self.id_to_num_copies_in_cubes[card_id]
+                del self.id_to_num_cubes_containing[card_id]
+        self.num_cubes += sign
+
+    def apply_change(self, old_cube: CubecanaCube | None, new_cube: CubecanaCube | None):
+        if self.includes(old_cube):
+            self.apply(old_cube.printing_id_to_count, -1)
+        if self.includes(new_cube):
+            self.apply(new_cube.printing_id_to_count, 1)
+
+    def handle_cube_change(self, old_cube: CubecanaCube, new_cube: CubecanaCube):
+        with self.lock:
+            if self.changes_during_seed is not None:
+                self.changes_during_seed.append((old_cube, new_cube))
+                return # reconciled with what the seed read once it's done
+            if not self.seeded:
+                return # the seed reads the database after this change
+            self.apply_change(old_cube, new_cube)
+
+    def seed_if_needed(self):
+        with self.seed_lock:
+            with self.lock:
+                if self.seeded:
+                    return
+                self.changes_during_seed = []
+            cube_id_to_counted_version: dict[str, int] = {}
+            for cube_list_record in cube_manager.iter_cube_list_records(None, self.included_power_bands):
+                with self.lock:
+                    self.apply(cube_list_record.printing_id_to_count, 1)
+                cube_id_to_counted_version[cube_list_record.cube_id] = cube_list_record.last_updated_epoch_seconds
+            with self.lock:
+                self.reconcile_changes_during_seed(cube_id_to_counted_version)
+                self.changes_during_seed = None
+                self.seeded = True
+            print(f"Card popularity store seeded from {self.num_cubes} cubes, power bands: {self.included_power_bands}")
+
+    def reconcile_changes_during_seed(self, cube_id_to_counted_version: dict[str, int]):
+        # the seed may have read a changed cube before or after its change was committed. A change only
+        # applies if the counts still hold the version it changed from, otherwise the seed already saw it
+        for old_cube, new_cube in self.changes_during_seed:
+            cube_id = (new_cube or old_cube).id
+            if cube_id_to_counted_version.get(cube_id) != self.counted_version(old_cube):
+                continue
+            self.apply_change(old_cube, new_cube)
+            cube_id_to_counted_version[cube_id] = self.counted_version(new_cube)
+
+    def generate_card_popularity_report(self) -> CardPopularityReport:
+        self.seed_if_needed()
+        with self.lock:
+            id_to_num_copies_in_cubes = dict(self.id_to_num_copies_in_cubes)
+            id_to_num_cubes_containing = dict(self.id_to_num_cubes_containing)
+            num_cubes = self.num_cubes
+        return CardPopularityReport(
+            id_to_num_copies_in_cubes=id_to_num_copies_in_cubes,
+            id_to_num_cubes_containing=id_to_num_cubes_containing,
+            id_to_ratio_cubes_included={card_id: num_cubes_containing / num_cubes for card_id, num_cubes_containing in id_to_num_cubes_containing.items()},
+            included_tags=None,
+            included_power_bands=self.included_power_bands,
+        )
+
 class Cubealytics:
+    def __init__(self):
+        self.power_max_card_popularity_store = CardPopularityStore([POWER_BAND_OVERPOWERED, POWER_BAND_MAX])
+
+    def init(self):
+        cube_manager.add_cube_change_listener(self.power_max_card_popularity_store.handle_cube_change)
+
+    def get_power_max_card_popularity_report(self) -> CardPopularityReport:
+        return self.power_max_card_popularity_store.generate_card_popularity_report()
+
+    # full scan for arbitrary filters, the power max report is served from power_max_card_popularity_store
     def generate_card_popularity_report(self, included_tags: list[str] = None, included_power_bands: str = None) -> CardPopularityReport:
-        all_cube_lists: list[dict[PrintingId, int]] = cube_manager.get_all_cube_lists(included_tags, included_power_bands)
         id_to_num_copies_in_cubes:dict[str, int] = dict[str, int]()
         id_to_num_cubes_containing: dict[str, int] = dict()
-        for cube_list in all_cube_lists:
-            for printing_id, count in cube_list.items():
+        num_cubes = 0
+        for cube_list_record in cube_manager.iter_cube_list_records(included_tags, included_power_bands):
+            num_cubes += 1
+            for printing_id, count in cube_list_record.printing_id_to_count.items():
                 card_id = printing_id.card_id
                 if card_id not in id_to_num_copies_in_cubes:
                     id_to_num_copies_in_cubes[card_id] = 0
@@ -52,7 +161,7 @@ class Cubealytics:
 
         id_to_ratio_cubes_included: dict[str, float] = dict[str, float]()
         for card_id in id_to_num_cubes_containing:
-            id_to_ratio_cubes_included[card_id] = id_to_num_cubes_containing[card_id] / all_cube_lists.__len__()
+            id_to_ratio_cubes_included[card_id] = id_to_num_cubes_containing[card_id] / num_cubes
 
         card_popularity_report = CardPopularityReport(
             id_to_num_copies_in_cubes=id_to_num_copies_in_cubes,
@@ -61,9 +170,8 @@ class Cubealytics:
             included_tags=included_tags,
             included_power_bands=included_power_bands,
         )
-        card_popularity_report.write_to_csv("static/reports/power_max_card_popularity_report.csv")
-        print(f"Cube report generated for tags: {included_tags}, power bands: {included_power_bands} analyzed {len(all_cube_lists)} cubes.")
+        print(f"Cube report generated for tags: {included_tags}, power bands: {included_power_bands} analyzed {num_cubes} cubes.")
         return card_popularity_report
 
 cubealytics:Cubealytics = Cubealytics()
-cubealytics.generate_card_popularity_report(included_tags=None, included_power_bands=[POWER_BAND_OVERPOWERED, POWER_BAND_MAX])
\ No newline at end of file
+startup.register('cubealytics', cubealytics.init)
\ No newline at end of file
@@ -3,6 +3,7 @@ from . import api
 from typing import List
 from .settings import Settings
 from .card import PrintingId, ApiCard
+from .lorcast_api import lorcast_api as lorcana_api
 
 @dataclass(frozen=True)
 class CubecanaCube:
@@ -46,7 +47,7 @@ class CubecanaCube:
         if api_card:
             featured_card_printing_id_str = f"{api_card.full_name} ({featured_card_printing_id.set_code}) {featured_card_printing_id.collector_id}"
             
-            featured_card_printing = next((printing for printing in api_card.card_printings if printing.printing_id() == featured_card_printing_id), None)
+            featured_card_printing = lorcana_api.find_card_printing(featured_card_printing_id)
             if featured_card_printing == None:
                 featured_card_printing = api_card.default_printing
 
@@ -1,21 +1,26 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, asdict
+from functools import cached_property
+import hashlib
 from io import TextIOWrapper
 import json
 from pathlib import Path
 from .lcc_error import UnidentifiedCardError, LccError
 from .settings import Settings
 from .card import ApiCard, CardPrinting, PrintingId
-from .lorcast_api import lorcast_api as lorcana_api
+from .lorcast_api import lorcast_api as lorcana_api, CardDataChange
 from . import id_helper
 from . import franchise
-from .cube_manager import CubecanaCube
+from .cube_manager import CubecanaCube, cube_manager
 from . import card_list_helper
 from .card_evaluations import card_evaluations_manager
 from . import tabletop_simulator
 from .dreamborn_manager import dreamborn_manager
 from .lorcana import ALT_ART_RARITIES
+from .lru_cache import LruCache
 
 ALL_CARDS_CUBE_PATH = 'inputs/all_cards_cube.draftmancer.txt'
+CUBE_DRAFTMANCER_CACHE_MAX_SIZE = 128
+MAIN_SLOT_NAME = 'MainSlot'
 GENERATED_CUBES_DIR = 'generated_cubes'
 
 class SlotCard:
@@ -29,6 +34,23 @@ class Slot:
         self.num_cards: int = num_cards
         self.slot_cards: list[SlotCard] = slot_cards
 
+class SlotModel:
+    """
+    The slots of a format, all the format analysis reads. Built straight from a cube's printing counts or from the
+    slots of an already parsed file, so analyzing a cube doesn't generate its draftmancer file and read it back.
+    """
+    def __init__(self, slots_by_name: dict[str, Slot]):
+        self.slots_by_name = slots_by_name
+
+    @cached_property
+    def digest(self) -> str:
+        # only what the analysis depends on: slot sizes and copies per card, not which printings or the other sections
+        lines = []
+        for slot in self.slots_by_name.values():
+            lines.append(f"[{slot.name}({slot.num_cards})]")
+            lines.extend(f"{slot_card.num_copies} {slot_card.printing_id.card_id}" for slot_card in slot.slot_cards)
+        return hashlib.sha256('\n'.join(lines).encode('utf-8')).hexdigest()
+
 @dataclass(frozen=True)
 class DraftmancerSettings:
   boostersPerPlayer: int = 4
@@ -45,12 +67,27 @@ class DraftmancerSettings:
         sort_keys=True,
         indent=4)
 
+  def to_draftmancer_settings(self) -> dict:
+    draftmancer_settings = asdict(self)
+    # only written by the files that need it
+    if not self.ratingsMissing:
+      del draftmancer_settings['ratingsMissing']
+    return draftmancer_settings
+
 @dataclass(frozen=True)
 class DraftmancerFile:
   draftmancer_settings: DraftmancerSettings
   printing_id_to_custom_card: dict[PrintingId, dict]
   slots_by_name: dict[str, Slot]
-  text_contents: str
+
+  # serialized on first use and kept, most consumers only need the parsed structure
+  @cached_property
+  def text_contents(self) -> str:
+    return draftmancer_file_to_string(self)
+
+  @cached_property
+  def slot_model(self) -> SlotModel:
+    return SlotModel(self.slots_by_name)
 
 lorcana_color_to_draftmancer_color =  {
     "Amber": "W",
@@ -205,21 +242,41 @@ def generate_draftmancer_file(included_printing_ids_to_count:dict[PrintingId, in
             ),
         ]
     if slot_name_to_slot==None:
-        lines.append(f'[MainSlot({settings.cards_per_booster})]')
+        lines.append(f'[{MAIN_SLOT_NAME}({settings.cards_per_booster})]')
         for printing_id in included_printing_ids_to_count:
             api_card = lorcana_api.get_api_card(printing_id.card_id)
             human_readable_printing = printing_id.to_human_readable(api_card.full_name)
             line_str = f"{included_printing_ids_to_count[printing_id]} {human_readable_printing}"
             lines.append(line_str)
     else:
-        for slot_name in slot_name_to_slot:
-            slot = slot_name_to_slot[slot_name]
-            lines.append(f'[{slot_name}({slot.num_cards})]')
-            for slot_card in slot.slot_cards:
-                api_card = lorcana_api.get_api_card(slot_card.printing_id.card_id)
-                human_readable_printing = slot_card.printing_id.to_human_readable(api_card.full_name)
-                line_str = f"{slot_card.num_copies} {human_readable_printing}"
-                lines.append(line_str)
+        lines.extend(generate_slot_lines(slot_name_to_slot))
+    return '\n'.join(lines)
+
+def generate_slot_lines(slot_name_to_slot: dict[str, Slot], printing_id_to_custom_card: dict[PrintingId, dict] = None) -> list[str]:
+    # a slot line names its card the way the file's custom card does, so Draftmancer can match the two up
+    printing_id_to_custom_card = printing_id_to_custom_card or {}
+    lines = []
+    for slot_name in slot_name_to_slot:
+        slot = slot_name_to_slot[slot_name]
+        lines.append(f'[{slot_name}({slot.num_cards})]')
+        for slot_card in slot.slot_cards:
+            custom_card = printing_id_to_custom_card.get(slot_card.printing_id)
+            full_name = custom_card['name'] if custom_card else lorcana_api.get_api_card(slot_card.printing_id.card_id).full_name
+            human_readable_printing = slot_card.printing_id.to_human_readable(full_name)
+            line_str = f"{slot_card.num_copies} {human_readable_printing}"
+            lines.append(line_str)
+    return lines
+
+def draftmancer_file_to_string(draftmancer_file: DraftmancerFile) -> str:
+    lines = [
+            '[CustomCards]',
+            json.dumps(list(draftmancer_file.printing_id_to_custom_card.values()), indent=4),
+        ]
+    # files read without their settings section serialize without it
+    if draftmancer_file.draftmancer_settings is not None:
+        lines.append('[Settings]')
+        lines.append(json.dumps(draftmancer_file.draftmancer_settings.to_draftmancer_settings(), indent=4))
+    lines.extend(generate_slot_lines(draftmancer_file.slots_by_name, draftmancer_file.printing_id_to_custom_card))
     return '\n'.join(lines)
 
 def read_draftmancer_custom_cardlist(file_path=ALL_CARDS_CUBE_PATH):
@@ -231,72 +288,85 @@ def read_draftmancer_custom_cardlist(file_path=ALL_CARDS_CUBE_PATH):
 READING_MODE_SETTINGS = "settings"
 READING_MODE_CUSTOM_CARDS = "custom_cards" 
 READING_MODE_SLOTS = "slots"
+# callers that only need part of a file (e.g. slots for analysis) can skip decoding the rest
+ALL_SECTIONS = frozenset([READING_MODE_SETTINGS, READING_MODE_CUSTOM_CARDS, READING_MODE_SLOTS])
+SLOTS_ONLY = frozenset([READING_MODE_SLOTS])
 
-def read_draftmancer_file_as_string(draftmancer_file_as_string: str) -> DraftmancerFile:
+def read_draftmancer_file_as_string(draftmancer_file_as_string: str, sections: frozenset[str] = ALL_SECTIONS) -> DraftmancerFile:
     lines = draftmancer_file_as_string.split('\n')
-    return read_draftmancer_file_as_lines(lines)
+    return read_draftmancer_file_as_lines(lines, sections)
 
-def read_draftmancer_file_as_lines(lines: TextIOWrapper|list[str]) -> DraftmancerFile:
+def read_draftmancer_file_as_lines(lines: TextIOWrapper|list[str], sections: frozenset[str] = ALL_SECTIONS) -> DraftmancerFile:
     reading_mode = ""
-    custom_card_string = ""
-    settings_string = ""
-    text_contents = ""
+    section_lines: dict[str, list[str]] = {READING_MODE_CUSTOM_CARDS: [], READING_MODE_SETTINGS: []}
     current_slot_name = ""
     slots_by_name = dict[str, Slot]()
-    open_braces = 0
-    draftmancer_settings: DraftmancerSettings = None
+    # slot lines repeat across slots (e.g. a common is also in the foil slot), resolve each once
+    slot_line_to_printing_id_and_count: dict[str, tuple[PrintingId, int]] = {}
     for line in lines:
-        text_contents += line
+        stripped_line = line.strip()
         if "[CustomCards]" in line:
             reading_mode = READING_MODE_CUSTOM_CARDS
             continue
         if "[Settings]" in line:
             reading_mode = READING_MODE_SETTINGS
             continue
-        if line.strip().startswith("[") and line.strip().endswith("]"):
-            slot_innards = line.strip().lstrip("[").rstrip("]")
+        if stripped_line.startswith("[") and stripped_line.endswith("]"):
+            slot_innards = stripped_line.lstrip("[").rstrip("]")
             if "(" in slot_innards:
                 num_cards = int(slot_innards.split("(")[1].split(")")[0])
                 current_slot_name = slot_innards.split("(")[0]
             else:
                 current_slot_name = slot_innards
                 num_cards = -1
-            slots_by_name[current_slot_name] = Slot(current_slot_name, num_cards, [])
+            if READING_MODE_SLOTS in sections:
+                slots_by_name[current_slot_name] = Slot(current_slot_name, num_cards, [])
             reading_mode = READING_MODE_SLOTS
             continue
 
-        if reading_mode == READING_MODE_CUSTOM_CARDS:
-            custom_card_string += line.strip()
-        if reading_mode == READING_MODE_SETTINGS:
-            settings_string += line.strip()
-            # try to decode, if it's done, it'll decode, otherwise it'll fail and we continue
-            if "{" in line:
-                open_braces += 1
-            if "}" in line:
-                open_braces -= 1
-                if open_braces <= 0:
-                    try:
-                        # Get the set of allowed keys from the dataclass fields
-                        allowed_keys = set(DraftmancerSettings.__dataclass_fields__.keys())
-
-                        # Parse the JSON string into a dictionary
-                        settings_dict = json.loads(settings_string)
-
-                        # Filter the dictionary to only include allowed keys
-                        filtered_settings = {k: v for k, v in settings_dict.items() if k in allowed_keys}
-
-                        # Now safely instantiate the dataclass
-                        draftmancer_settings = DraftmancerSettings(**filtered_settings)
-                        reading_mode = ""
-                    except json.JSONDecodeError:
-                        continue
+        if reading_mode not in sections:
+            continue
         if reading_mode == READING_MODE_SLOTS:
-            if line.strip() == "":
+            if stripped_line == "":
                 continue
-            printing_id, count = card_list_helper.printing_id_and_count_from_card_list_line(line)
+            printing_id_and_count = slot_line_to_printing_id_and_count.get(line)
+            if printing_id_and_count is None:
+                printing_id_and_count = printing_id_and_count_from_slot_line(line)
+                slot_line_to_printing_id_and_count[line] = printing_id_and_count
+            printing_id, count = printing_id_and_count
             slots_by_name[current_slot_name].slot_cards.append(SlotCard(printing_id, count))
             continue
-    
+        if reading_mode in section_lines:
+            section_lines[reading_mode].append(stripped_line)
+
+    draftmancer_settings: DraftmancerSettings = None
+    if READING_MODE_SETTINGS in sections:
+        draftmancer_settings = read_draftmancer_settings(''.join(section_lines[READING_MODE_SETTINGS]))
+    printing_id_to_custom_card: dict[PrintingId, dict] = {}
+    if READING_MODE_CUSTOM_CARDS in sections:
+        printing_id_to_custom_card = read_printing_id_to_custom_card(''.join(section_lines[READING_MODE_CUSTOM_CARDS]))
+    draftmancer_file = DraftmancerFile(draftmancer_settings, printing_id_to_custom_card, slots_by_name)
+    return draftmancer_file
+
+def printing_id_and_count_from_slot_line(line: str) -> tuple[PrintingId, int]:
+    resolved = card_list_helper.get_card_list_resolver().resolve_line(line)
+    if resolved is not None:
+        return resolved
+    # anything else (unknown card or printing, unusual formatting, ...) goes through the full card list tokenizer
+    return card_list_helper.printing_id_and_count_from_card_list_line(line)
+
+def read_draftmancer_settings(settings_string: str) -> DraftmancerSettings:
+    try:
+        # only the first JSON value counts, anything after it in the section is ignored
+        settings_dict, _ = json.JSONDecoder().raw_decode(settings_string)
+    except json.JSONDecodeError:
+        return None
+    # Filter the dictionary to only include allowed keys
+    allowed_keys = set(DraftmancerSettings.__dataclass_fields__.keys())
+    filtered_settings = {k: v for k, v in settings_dict.items() if k in allowed_keys}
+    return DraftmancerSettings(**filtered_settings)
+
+def read_printing_id_to_custom_card(custom_card_string: str) -> dict[PrintingId, dict]:
     custom_cards_json = json.loads(custom_card_string)
     printing_id_to_custom_card: dict[PrintingId, dict] = {}
     for custom_card in custom_cards_json:
@@ -306,12 +376,10 @@ def read_draftmancer_file_as_lines(lines: TextIOWrapper|list[str]) -> Draftmance
             input_collector_id = custom_card['collector_number']
             id = id_helper.to_id(input_name)
             printing_id = PrintingId(card_id=id, set_code=input_set, collector_id=input_collector_id)
-            lorcana_api.get_card_printing(printing_id)
             printing_id_to_custom_card[printing_id] = custom_card
         except KeyError:
             raise UnidentifiedCardError(f"Unable to identify card from custom card entry:\n{json.dumps(custom_card)}")
-    draftmancer_file = DraftmancerFile(draftmancer_settings, printing_id_to_custom_card, slots_by_name, text_contents)
-    return draftmancer_file
+    return printing_id_to_custom_card
 
 def read_draftmancer_file(file_path: str) -> DraftmancerFile:
     with open(file_path, encoding='utf8') as f:
@@ -328,6 +396,52 @@ def generate_draftmancer_file_from_cube(cube: CubecanaCube):
     card_evaluations_filename = card_evaluations_manager.determine_card_evaluations_file(cube)
     return generate_draftmancer_file(cube.printing_id_to_count, card_evaluations_filename, cube.settings)
 
+def slot_model_from_cube(cube: CubecanaCube) -> SlotModel:
+    # the single slot generate_draftmancer_file writes for a cube
+    slot_cards = [SlotCard(printing_id, count) for printing_id, count in cube.printing_id_to_count.items()]
+    return SlotModel({MAIN_SLOT_NAME: Slot(MAIN_SLOT_NAME, cube.settings.cards_per_booster, slot_cards)})
+
+class CubeDraftmancerCache:
+    """
+    Draftmancer files generated from cubes, keyed by everything they're generated from: the cube and when it was last
+    saved, its evaluations file and the card data. Popular cubes get their file requested over and over.
+    """
+    def __init__(self):
+        self.cache: LruCache = LruCache(CUBE_DRAFTMANCER_CACHE_MAX_SIZE)
+        lorcana_api.add_card_data_listener(self.on_card_data_change)
+        cube_manager.add_cube_change_listener(self.on_cube_change)
+
+    def cache_key(self, cube: CubecanaCube) -> tuple:
+        card_evaluations_file = card_evaluations_manager.determine_card_evaluations_file(cube)
+        return (
+            cube.id,
+            cube.last_updated_epoch_seconds,
+            card_evaluations_file,
+            card_evaluations_manager.evaluations_version(card_evaluations_file),
+            lorcana_api.data_version,
+        )
+
+    def get(self, cube: CubecanaCube) -> str:
+        key = self.cache_key(cube)
+        draftmancer_file_string = self.cache.get(key)
+        if draftmancer_file_string is None:
+            draftmancer_file_string = generate_draftmancer_file_from_cube(cube)
+            self.cache.put(key, draftmancer_file_string)
+        return draftmancer_file_string
+
+    def on_card_data_change(self, card_data_change: CardDataChange):
+        # entries of older card data can't be hit anymore, no need to wait for them to be evicted
+        self.cache.invalidate_where(lambda key, draftmancer_file_string: key[-1] != card_data_change.version)
+
+    def on_cube_change(self, old_cube: CubecanaCube | None, new_cube: CubecanaCube | None):
+        if old_cube is not None:
+            self.cache.invalidate_where(lambda key, draftmancer_file_string: key[0] == old_cube.id)
+
+    def get_cache_stats(self) -> dict[str, int | float]:
+        return self.cache.stats()
+
+cube_draftmancer_cache: CubeDraftmancerCache = CubeDraftmancerCache()
+
 def dreamborn_tts_to_draftmancer_from_file(dreamborn_export_for_tabletop_sim, card_evaluations_file, settings):
     id_to_tts_card = tabletop_simulator.read_id_to_tts_card_from_filesystem(dreamborn_export_for_tabletop_sim)
     return dreamborn_tts_to_draftmancer(id_to_tts_card, card_evaluations_file, settings)
@@ -1,22 +1,20 @@
+from functools import cached_property
 from pathlib import Path
 from . import id_helper
 from .card import PrintingId
+from .startup import startup
 
 ALL_DREAMBORN_NAMES_FILE_PATH = 'inputs/all_dreamborn_names.txt'
 
 class DreambornManager:
-    def __init__(self):
-        self.id_to_dreamborn_name = self._read_id_to_dreamborn_name()
-
-    def _read_id_to_dreamborn_name(self):
+    # read on first use (or by startup), not when the module is imported
+    @cached_property
+    def id_to_dreamborn_name(self) -> dict[str, str]:
         Path(ALL_DREAMBORN_NAMES_FILE_PATH).parent.mkdir(parents=True, exist_ok=True)
         with open(ALL_DREAMBORN_NAMES_FILE_PATH, encoding='utf8') as f:
             lines = f.readlines()
-        id_to_dreamborn_name = {}
-        for l in lines:
-            name = l.strip()
-            id_to_dreamborn_name[id_helper.to_id(name)] = name
-        return id_to_dreamborn_name
+        names = [l.strip() for l in lines]
+        return dict(zip(id_helper.to_ids(names), names))
 
     def get_id_to_dreamborn_name(self, id: str) -> str | None:
         return self.id_to_dreamborn_name.get(id)
@@ -56,4 +54,5 @@ class DreambornManager:
             print(f"Image URIs for non-legacy set code on dreamborn not avail. for image uri: {printing_id.set_code}")
             return ""
         
-dreamborn_manager:DreambornManager = DreambornManager()
\ No newline at end of file
+dreamborn_manager:DreambornManager = DreambornManager()
+startup.register('dreamborn_names', lambda: dreamborn_manager.id_to_dreamborn_name)
\ No newline at end of file
@@ -1,169 +1,229 @@
-import json
-from cubecana_server.card import PrintingId
-from .draftmancer import DraftmancerFile
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Callable
+from cubecana_server.card import ApiCard, PrintingId
+from .draftmancer import SlotModel
 from .api import FormatAnalysisResponse
-from . import id_helper
-from .lorcast_api import lorcast_api as lorcana_api
-from .card_evaluations import card_evaluations_manager, CardEvaluationsManager, DEFAULT_CUBE_CARD_EVALUATIONS_FILE
+from .lorcast_api import lorcast_api as lorcana_api, CardDataChange
+from .card_evaluations import card_evaluations_manager
+from .lru_cache import LruCache
+from .card_table import CardTable, CARD_IDS_WITH_ZERO_STRENGTH, expects_no_lore
 
-def expects_no_lore(api_card):
-    if 'Reckless' in api_card.keywords:
-        return True
-    if api_card.full_name == "Mulan - Resourceful Recruit":
-        return True
-    return False
+FORMAT_ANALYSIS_CACHE_MAX_SIZE = 256
+
+@dataclass(frozen=True)
+class CachedFormatAnalysis:
+    format_analysis_response: FormatAnalysisResponse
+    card_ids: frozenset[str] # cards the analysis read, a change to any of them invalidates it
+
+@dataclass(frozen=True)
+class AnalysisContext:
+    card_evaluations_file: str
+    retail_set_code: str = None
+
+class DistributionAccumulator(ABC):
+    """One distribution fed by the single pass over count_at_table_by_card_id, see FormatAnalysisManager.register_distribution"""
+    @abstractmethod
+    def accumulate(self, card_id: str, api_card: ApiCard, count_at_table: float) -> None:
+        pass
+
+    @abstractmethod
+    def result(self):
+        pass
+
+class CountByCardTypeAccumulator(DistributionAccumulator):
+    def __init__(self, context: AnalysisContext):
+        self.count_at_table_by_card_type: dict[str, float] = {}
+
+    def accumulate(self, card_id, api_card, count_at_table):
+        for card_type in api_card.types:
+            self.count_at_table_by_card_type[card_type] = self.count_at_table_by_card_type.get(card_type, 0) + count_at_table
+
+    def result(self) -> dict[str, float]:
+        return self.count_at_table_by_card_type
+
+class CharacterStatByCostAccumulator(DistributionAccumulator):
+    def __init__(self, context: AnalysisContext):
+        self.count_at_table_by_stat: dict[int, dict[int, float]] = {}
+
+    @abstractmethod
+    def stat_value(self, card_id: str, api_card: ApiCard) -> int:
+        pass
+
+    def accumulate(self, card_id, api_card, count_at_table):
+        if 'Character' not in api_card.types:
+            return
+        if api_card.cost not in self.count_at_table_by_stat:
+            self.count_at_table_by_stat[api_card.cost] = {}
+        stat = self.stat_value(card_id, api_card)
+        if stat not in self.count_at_table_by_stat[api_card.cost]:
+            self.count_at_table_by_stat[api_card.cost][stat] = 0
+        self.count_at_table_by_stat[api_card.cost][stat] += count_at_table
+
+    def result(self) -> dict[int, dict[int, float]]:
+        return self.count_at_table_by_stat
+
+class StrengthByCostAccumulator(CharacterStatByCostAccumulator):
+    def stat_value(self, card_id, api_card):
+        strength = api_card.strength
+        if strength == None:
+            if card_id in CARD_IDS_WITH_ZERO_STRENGTH:
+                strength = 0 # Rapunzel, Gifted Artist has null strength in the API but actually 0
+            else:
+                print(f"Warning: Card {api_card.full_name} is a Character but has no strength value.")
+                print(api_card.toJSON())
+                strength = 0
+        return strength
+
+class WillpowerByCostAccumulator(CharacterStatByCostAccumulator):
+    def stat_value(self, card_id, api_card):
+        willpower = api_card.willpower
+        if willpower == None:
+            print(f"Warning: Card {api_card.full_name} is a Character but has no willpower value.")
+        return willpower
+
+class LoreByCostAccumulator(CharacterStatByCostAccumulator):
+    def stat_value(self, card_id, api_card):
+        lore = api_card.lore
+        if lore == None and expects_no_lore(api_card):
+            lore = 0
+        elif lore == None:
+            print(f"Warning: Card {api_card.full_name} is a Character but has no lore value.")
+        return lore
+
+class RatingByCostAccumulator(DistributionAccumulator):
+    def __init__(self, context: AnalysisContext):
+        self.count_at_table_by_rating: dict[int, dict[str, float]] = {}
+        self.id_to_letter_rating: dict[str, str] = card_evaluations_manager.read_id_to_letter_rating(context.card_evaluations_file, preferred_set_num=context.retail_set_code)
+
+    def accumulate(self, card_id, api_card, count_at_table):
+        if api_card.cost not in self.count_at_table_by_rating:
+            self.count_at_table_by_rating[api_card.cost] = {}
+        try:
+            letter_rating = self.id_to_letter_rating[card_id]
+            if letter_rating not in self.count_at_table_by_rating[api_card.cost]:
+                self.count_at_table_by_rating[api_card.cost][letter_rating] = 0
+            self.count_at_table_by_rating[api_card.cost][letter_rating] += count_at_table
+        except Exception as e:
+            print(e)
+
+    def result(self) -> dict[int, dict[str, float]]:
+        return self.count_at_table_by_rating
+
+class CostByClassificationAccumulator(DistributionAccumulator):
+    def __init__(self, context: AnalysisContext):
+        self.count_at_table_by_classification: dict[str, dict[int, float]] = {}
+
+    def accumulate(self, card_id, api_card, count_at_table):
+        for classification in api_card.classifications:
+            if classification not in self.count_at_table_by_classification:
+                self.count_at_table_by_classification[classification] = {}
+            if api_card.cost not in self.count_at_table_by_classification[classification]:
+                self.count_at_table_by_classification[classification][api_card.cost] = 0
+            self.count_at_table_by_classification[classification][api_card.cost] += count_at_table
+
+    def result(self) -> dict[str, dict[int, float]]:
+        return self.count_at_table_by_classification
+
+class InkabilityByCostAccumulator(DistributionAccumulator):
+    def __init__(self, context: AnalysisContext):
+        self.count_at_table_by_inkability: dict[int, dict[bool, float]] = {}
+
+    def accumulate(self, card_id, api_card, count_at_table):
+        if api_card.cost not in self.count_at_table_by_inkability:
+            self.count_at_table_by_inkability[api_card.cost] = {}
+        if api_card.inkable not in self.count_at_table_by_inkability[api_card.cost]:
+            self.count_at_table_by_inkability[api_card.cost][api_card.inkable] = 0
+        self.count_at_table_by_inkability[api_card.cost][api_card.inkable] += count_at_table
+
+    def result(self) -> dict[int, dict[bool, float]]:
+        return self.count_at_table_by_inkability
 
 class FormatAnalysisManager:
     def __init__(self):
-        self.cache: dict[str, FormatAnalysisResponse] = {}
+        self.cache: LruCache = LruCache(FORMAT_ANALYSIS_CACHE_MAX_SIZE)
+        lorcana_api.add_card_data_listener(self.on_card_data_change)
+        # FormatAnalysisResponse field -> accumulator factory, all fed by the same pass over the cards at the table
+        self.accumulator_factories: dict[str, Callable[[AnalysisContext], DistributionAccumulator]] = {}
+        self.register_distribution('countAtTableByCardType', CountByCardTypeAccumulator)
+        self.register_distribution('strengthDistributionByCost', StrengthByCostAccumulator)
+        self.register_distribution('willpowerDistributionByCost', WillpowerByCostAccumulator)
+        self.register_distribution('loreDistributionByCost', LoreByCostAccumulator)
+        self.register_distribution('ratingDistributionByCost', RatingByCostAccumulator)
+        self.register_distribution('costDistributionByClassification', CostByClassificationAccumulator)
+        self.register_distribution('inkabilityByCost', InkabilityByCostAccumulator)
 
-    def analyze(self, draftmancer_file:DraftmancerFile, boosters_per_player:int, num_players:int, card_evaluations_file: str, retail_set_code: str = None) -> FormatAnalysisResponse:
-        boosters_at_table = boosters_per_player * num_players
+    def register_distribution(self, response_field: str, accumulator_factory: Callable[[AnalysisContext], DistributionAccumulator]):
+        self.accumulator_factories[response_field] = accumulator_factory
 
-        # think about this and how/if we need to deal with boosters / player etc.
-        # if retail_set_code in self.cache:
-        #     return self.cache[retail_set_code]
-        
-        total_cards_by_slot_name = self.generate_total_cards_by_slot_name(draftmancer_file)
-        count_at_table_by_card_id = self.generate_count_at_table_by_card_id(draftmancer_file, boosters_at_table, total_cards_by_slot_name)
-        count_at_table_by_card_type = self.generate_count_at_table_by_card_type(count_at_table_by_card_id)
-        count_at_table_by_ink_cost = self.generate_cost_distribution(count_at_table_by_card_id)
-        strength_distribution_by_cost = self.generate_strength_distribution_by_cost(count_at_table_by_card_id)
-        willpower_distribution_by_cost = self.generate_willpower_distribution_by_cost(count_at_table_by_card_id)
-        lore_distribution_by_cost = self.generate_lore_distribution_by_cost(count_at_table_by_card_id)
-        rating_distribution_by_cost = self.generate_rating_distribution_by_cost(count_at_table_by_card_id, card_evaluations_file, retail_set_code)
-        cost_distribution_by_classification = self.generate_cost_distribution_by_classification(count_at_table_by_card_id)
-        inkability_by_cost = self.generate_inkability_by_cost(count_at_table_by_card_id)
-
-        format_analysis_response: FormatAnalysisResponse = FormatAnalysisResponse(
-            # countAtTableByCardId = count_at_table_by_card_id, # for debugging purposes
-            # countAtTableByInkCost = count_at_table_by_ink_cost, # for debugging purposes
-            countAtTableByCardType = count_at_table_by_card_type,
-            strengthDistributionByCost = strength_distribution_by_cost,
-            willpowerDistributionByCost = willpower_distribution_by_cost,
-            loreDistributionByCost = lore_distribution_by_cost,
-            ratingDistributionByCost = rating_distribution_by_cost,
-            costDistributionByClassification = cost_distribution_by_classification,
-            inkabilityByCost = inkability_by_cost,
+    def cache_key(self, slot_model: SlotModel, boosters_per_player:int, num_players:int, card_evaluations_file: str, retail_set_code: str = None) -> tuple:
+        # the evaluations version is part of the key so a refresh makes old entries unreachable, card data changes invalidate instead
+        return (
+            slot_model.digest,
+            boosters_per_player,
+            num_players,
+            card_evaluations_file,
+            card_evaluations_manager.evaluations_version(card_evaluations_file),
+            retail_set_code,
         )
-        # self.cache[retail_set_code] = format_analysis_response
+
+    def on_card_data_change(self, card_data_change: CardDataChange):
+        if card_data_change.full_reload:
+            self.cache.clear()
+            return
+        invalidated = self.cache.invalidate_where(lambda key, cached_format_analysis: not card_data_change.changed_card_ids.isdisjoint(cached_format_analysis.card_ids))
+        print(f"Invalidated {invalidated} cached format analyses using the {len(card_data_change.changed_card_ids)} changed cards")
+
+    def get_cache_stats(self) -> dict[str, int | float]:
+        return self.cache.stats()
+
+    def analyze(self, slot_model: SlotModel, boosters_per_player:int, num_players:int, card_evaluations_file: str, retail_set_code: str = None) -> FormatAnalysisResponse:
+        key = self.cache_key(slot_model, boosters_per_player, num_players, card_evaluations_file, retail_set_code)
+        cached_format_analysis: CachedFormatAnalysis = self.cache.get(key)
+        if cached_format_analysis is not None:
+            return cached_format_analysis.format_analysis_response
+        data_version = lorcana_api.data_version
+        format_analysis_response = self.generate_format_analysis(slot_model, boosters_per_player, num_players, card_evaluations_file, retail_set_code)
+        # an analysis that raced a card data swap may have read the old cards, it's returned but not cached
+        if data_version == lorcana_api.data_version:
+            card_ids = frozenset(slot_card.printing_id.card_id for slot in slot_model.slots_by_name.values() for slot_card in slot.slot_cards)
+            self.cache.put(key, CachedFormatAnalysis(format_analysis_response, card_ids))
         return format_analysis_response
 
-    def generate_inkability_by_cost(self, count_at_table_by_card_id) -> dict[int, dict[bool, float]]:
-        count_at_table_by_inkability:dict[int, dict[bool, float]] = {}
-        for card_id, count_at_table in count_at_table_by_card_id.items():
-            api_card = lorcana_api.get_api_card(card_id)
-            if api_card.cost not in count_at_table_by_inkability:
-                count_at_table_by_inkability[api_card.cost] = {}
-            if api_card.inkable not in count_at_table_by_inkability[api_card.cost]:
-                count_at_table_by_inkability[api_card.cost][api_card.inkable] = 0
-            count_at_table_by_inkability[api_card.cost][api_card.inkable] += count_at_table
-        return count_at_table_by_inkability
-
-    def generate_cost_distribution_by_classification(self, count_at_table_by_card_id) -> dict[str, dict[int, float]]:
-        count_at_table_by_classification:dict[str, dict[int, float]] = {}
-        for card_id, count_at_table in count_at_table_by_card_id.items():
-            api_card = lorcana_api.get_api_card(card_id)
-            for classification in api_card.classifications:
-                if classification not in count_at_table_by_classification:
-                    count_at_table_by_classification[classification] = {}
-                if api_card.cost not in count_at_table_by_classification[classification]:
-                    count_at_table_by_classification[classification][api_card.cost] = 0
-                count_at_table_by_classification[classification][api_card.cost] += count_at_table
-        return count_at_table_by_classification
-
-    def generate_willpower_distribution_by_cost(self, count_at_table_by_card_id) -> dict[int, dict[int, float]]:
-        count_at_table_by_willpower:dict[int, dict[int, float]] = {}
-        for card_id, count_at_table in count_at_table_by_card_id.items():
-            api_card = lorcana_api.get_api_card(card_id)
-            if 'Character' in api_card.types:
-                if api_card.cost not in count_at_table_by_willpower:
-                    count_at_table_by_willpower[api_card.cost] = {}
-                willpower = api_card.willpower
-                if willpower == None:
-                    print(f"Warning: Card {api_card.full_name} is a Character but has no willpower value.")
-                if willpower not in count_at_table_by_willpower[api_card.cost]:
-                    count_at_table_by_willpower[api_card.cost][willpower] = 0
-                count_at_table_by_willpower[api_card.cost][willpower] += count_at_table
-        return count_at_table_by_willpower
-    
-    def generate_lore_distribution_by_cost(self, count_at_table_by_card_id) -> dict[int, dict[int, float]]:
-        count_at_table_by_lore:dict[int, dict[int, float]] = {}
-        for card_id, count_at_table in count_at_table_by_card_id.items():
-            api_card = lorcana_api.get_api_card(card_id)
-            if 'Character' in api_card.types:
-                if api_card.cost not in count_at_table_by_lore:
-                    count_at_table_by_lore[api_card.cost] = {}
-                lore = api_card.lore
-                if lore == None and expects_no_lore(api_card):
-                    lore = 0
-                elif lore == None:
-                    print(f"Warning: Card {api_card.full_name} is a Character but has no lore value.")
-                if lore not in count_at_table_by_lore[api_card.cost]:
-                    count_at_table_by_lore[api_card.cost][lore] = 0
-                count_at_table_by_lore[api_card.cost][lore] += count_at_table
-        return count_at_table_by_lore
-
-    def generate_strength_distribution_by_cost(self, count_at_table_by_card_id) -> dict[int, dict[int, float]]:
-        count_at_table_by_strength:dict[int, dict[int, float]] = {}
-        for card_id, count_at_table in count_at_table_by_card_id.items():
-            api_card = lorcana_api.get_api_card(card_id)
-            if 'Character' in api_card.types:
-                if api_card.cost not in count_at_table_by_strength:
-                    count_at_table_by_strength[api_card.cost] = {}
-                strength = api_card.strength
-                if strength == None:
-                    if card_id in [
-                        "herculesspectraldemigod",
-                        "squeakscozycaterpillar",
-                        "thomaswide-eyedrecruit",
-                        "flitreflectivehummingbird",
-                        'rapunzelgiftedartist'
-                    ]:
-                        strength = 0 # Rapunzel, Gifted Artist has null strength in the API but actually 0
-                    else:
-                        print(f"Warning: Card {api_card.full_name} is a Character but has no strength value.")
-                        print(api_card.toJSON())
-                        strength = 0
-                if strength not in count_at_table_by_strength[api_card.cost]:
-                    count_at_table_by_strength[api_card.cost][strength] = 0
-                count_at_table_by_strength[api_card.cost][strength] += count_at_table
-        return count_at_table_by_strength
-
-    def generate_rating_distribution_by_cost(self, count_at_table_by_card_id, card_evaluations_file=str, retail_set_code: str = None) -> dict[int, dict[str, float]]:
-        count_at_table_by_rating:dict[int, dict[str, float]] = {}
-        id_to_letter_rating: dict[str, str] = card_evaluations_manager.read_id_to_letter_rating(card_evaluations_file, preferred_set_num=retail_set_code)
-        for card_id, count_at_table in count_at_table_by_card_id.items():
-            api_card = lorcana_api.get_api_card(card_id)
-            if api_card.cost not in count_at_table_by_rating:
-                count_at_table_by_rating[api_card.cost] = {}
-            try:
-                letter_rating = id_to_letter_rating[card_id]
-                if letter_rating not in count_at_table_by_rating[api_card.cost]:
-                    count_at_table_by_rating[api_card.cost][letter_rating] = 0
-                count_at_table_by_rating[api_card.cost][letter_rating] += count_at_table
-            except Exception as e:
-                print(e)
-        return count_at_table_by_rating
-
-    def generate_cost_distribution(self, count_at_table_by_card_id):
-        count_at_table_by_ink_cost:dict[int, float] = {}
-        for card_id, count_at_table in count_at_table_by_card_id.items():
-            api_card = lorcana_api.get_api_card(card_id)
-            count_at_table_by_ink_cost[api_card.cost] = count_at_table_by_ink_cost.get(api_card.cost, 0) + count_at_table
-        return count_at_table_by_ink_cost
+    def generate_format_analysis(self, slot_model: SlotModel, boosters_per_player:int, num_players:int, card_evaluations_file: str, retail_set_code: str = None) -> FormatAnalysisResponse:
+        boosters_at_table = boosters_per_player * num_players
+
+        total_cards_by_slot_name = self.generate_total_cards_by_slot_name(slot_model)
+        count_at_table_by_card_id = self.generate_count_at_table_by_card_id(slot_model, boosters_at_table, total_cards_by_slot_name)
+        context = AnalysisContext(card_evaluations_file=card_evaluations_file, retail_set_code=retail_set_code)
+        distributions = self.accumulate_distributions(count_at_table_by_card_id, context)
+        return FormatAnalysisResponse(**distributions)
 
-    def generate_count_at_table_by_card_type(self, count_at_table_by_card_id):
-        countAtTableByCardType:dict[str, float] = {}
+    def accumulate_distributions(self, count_at_table_by_card_id: dict[str, float], context: AnalysisContext) -> dict[str, object]:
+        accumulators = {response_field: factory(context) for response_field, factory in self.accumulator_factories.items()}
+        accumulator_list = list(accumulators.values())
         for card_id, count_at_table in count_at_table_by_card_id.items():
             api_card = lorcana_api.get_api_card(card_id)
-            for card_type in api_card.types:
-                countAtTableByCardType[card_type] = countAtTableByCardType.get(card_type, 0) + count_at_table
-        return countAtTableByCardType
+            for accumulator in accumulator_list:
+                accumulator.accumulate(card_id, api_card, count_at_table)
+        return {response_field: accumulator.result() for response_field, accumulator in accumulators.items()}
+
+    def analyze_batch(self, slot_models: list[SlotModel], boosters_per_player:int, num_players:int, card_evaluations_file: str, retail_set_code: str = None) -> list[FormatAnalysisResponse]:
+        # vectorized over lorcast_api.card_table, for jobs analyzing many formats at once. Matches analyze up to float rounding.
+        # No job calls it yet, benchmark.py compares it with analyze
+        boosters_at_table = boosters_per_player * num_players
+        card_table: CardTable = lorcana_api.card_table
+        count_at_table_by_card_id_list = []
+        for slot_model in slot_models:
+            total_cards_by_slot_name = self.generate_total_cards_by_slot_name(slot_model)
+            count_at_table_by_card_id_list.append(self.generate_count_at_table_by_card_id(slot_model, boosters_at_table, total_cards_by_slot_name))
+        weights = card_table.weights_for(count_at_table_by_card_id_list)
+        id_to_letter_rating = card_evaluations_manager.read_id_to_letter_rating(card_evaluations_file, preferred_set_num=retail_set_code)
+        return [FormatAnalysisResponse(**distributions) for distributions in card_table.distributions(weights, id_to_letter_rating)]
 
-    def generate_count_at_table_by_card_id(self, draftmancer_file, boosters_at_table, total_cards_by_slot_name):
+    def generate_count_at_table_by_card_id(self, slot_model: SlotModel, boosters_at_table, total_cards_by_slot_name):
         count_at_table_by_card_id: dict[str, float] = {}
-        for slot in draftmancer_file.slots_by_name.values():
+        for slot in slot_model.slots_by_name.values():
             for slot_card in slot.slot_cards:
                 printing_id: PrintingId = slot_card.printing_id
                 num_copies: int = slot_card.num_copies
@@ -175,9 +235,9 @@ class FormatAnalysisManager:
                 count_at_table_by_card_id[card_id] = weight_per_table_for_card_id
         return count_at_table_by_card_id
 
-    def generate_total_cards_by_slot_name(self, draftmancer_file):
+    def generate_total_cards_by_slot_name(self, slot_model: SlotModel):
         total_cards_by_slot_name: dict[str, int] = {}
-        for slot in draftmancer_file.slots_by_name.values():
+        for slot in slot_model.slots_by_name.values():
             for slot_card in slot.slot_cards:
                 num_copies: int = slot_card.num_copies
                 total_cards_by_slot_name[slot.name] = total_cards_by_slot_name.get(slot.name, 0) + num_copies
@@ -68,20 +68,18 @@ def generate_retail_draftmancer_file(card_evaluations_file, set_code:str, settin
     }
 
     printing_ids_to_count: dict[PrintingId, int] = {}
-    api_cards_from_set = lorcana_api.get_cards_from_set(set_code)
-    for api_card in api_cards_from_set:
-        for card_printing in list(filter(lambda p: p.set_code == set_code, api_card.card_printings)):
-            if card_printing.printing_id() in RETAIL_SET_EXCLUDED_PRINTING_IDS:
-                continue
-            rarity = card_printing.rarity
-            color = api_card.color
-            if color is None or color == "None":
-                raise ValueError(f"Failed to find color for card '{api_card.full_name}'")
-            printing_id: PrintingId = card_printing.printing_id()
-            frequency = rarity_to_frequency[rarity]
-            printing_ids_to_count[printing_id] = frequency
-            slots_to_append = calculate_slots_to_append(rarity, color)
-            for slot_name in slots_to_append:
-                slot_card = SlotCard(printing_id, frequency)
-                slot_name_to_slot[slot_name].slot_cards.append(slot_card)
+    for api_card, card_printing in lorcana_api.get_printings_from_set(set_code):
+        if card_printing.printing_id() in RETAIL_SET_EXCLUDED_PRINTING_IDS:
+            continue
+        rarity = card_printing.rarity
+        color = api_card.color
+        if color is None or color == "None":
+            raise ValueError(f"Failed to find color for card '{api_card.full_name}'")
+        printing_id: PrintingId = card_printing.printing_id()
+        frequency = rarity_to_frequency[rarity]
+        printing_ids_to_count[printing_id] = frequency
+        slots_to_append = calculate_slots_to_append(rarity, color)
+        for slot_name in slots_to_append:
+            slot_card = SlotCard(printing_id, frequency)
+            slot_name_to_slot[slot_name].slot_cards.append(slot_card)
     return draftmancer.generate_draftmancer_file(printing_ids_to_count, card_evaluations_file, settings, slot_name_to_slot)
\ No newline at end of file
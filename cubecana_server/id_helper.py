@@ -1,7 +1,48 @@
 import re
+import unicodedata
+from string import ascii_uppercase
+from functools import lru_cache
 
-pattern = re.compile(r"[\W_]+", re.ASCII)
+ID_CACHE_MAX_SIZE = 16384
+BATCH_SEPARATOR = '\x00'
+
+def build_translation(keep: str = '') -> dict[int, str | None]:
+    # lowercases ASCII letters, folds accented Latin letters onto their base letter (ā -> a, é -> e, Ö -> o)
+    # and deletes the other ASCII characters, keep is left as is
+    translation: dict[int, str | None] = {ord(char): None for char in map(chr, range(128)) if not char.isalnum() and char not in keep}
+    translation.update({ord(char): char.lower() for char in ascii_uppercase})
+    for code_point in range(0x00C0, 0x0250):
+        base = unicodedata.normalize('NFKD', chr(code_point))[0]
+        if base.isascii() and base.isalpha():
+            translation[code_point] = base.lower()
+    # frequent in card names / lists, deleted here so those names skip the regex below
+    translation.update({ord(char): None for char in "\u2019\u2018\u201c\u201d\u2010\u2013\u2014\xa0"})
+    return translation
+
+TRANSLATION = build_translation()
+BATCH_TRANSLATION = build_translation(keep=BATCH_SEPARATOR)
+# whatever is left outside ASCII after the translation (e.g. other punctuation, non-Latin letters) is stripped
+non_ascii_pattern = re.compile(r"[^\x00-\x7f]+")
+
+@lru_cache(maxsize=ID_CACHE_MAX_SIZE)
 def to_id(string):
-    string = string.replace('ā', 'a')
-    string = string.replace('é','e')
-    return re.sub(pattern, '', string).lower()
\ No newline at end of file
+    translated = string.translate(TRANSLATION)
+    if translated.isascii():
+        return translated
+    return non_ascii_pattern.sub('', translated)
+
+def fold_non_ascii(match: re.Match) -> str:
+    folded = match.group().translate(TRANSLATION)
+    return ''.join(char for char in folded if char.isascii())
+
+def to_ids(strings: list[str]) -> list[str]:
+    # normalizes the names in one translate over the joined names, for bulk loads
+    if not strings:
+        return []
+    joined = BATCH_SEPARATOR.join(strings)
+    if joined.count(BATCH_SEPARATOR) != len(strings) - 1:
+        return [to_id(string) for string in strings]
+    # the few non-ASCII characters are folded first, translate is much faster over pure ASCII
+    if not joined.isascii():
+        joined = non_ascii_pattern.sub(fold_non_ascii, joined)
+    return joined.translate(BATCH_TRANSLATION).split(BATCH_SEPARATOR)
@@ -26,17 +26,23 @@ class UnidentifiedPrintingsError(LccError):
             user_facing_message += f"\n {unidentified_printing.unidentifiable_input}.\n  Available Printings: {', '.join(unidentified_printing.available_printing_names)}"
         super().__init__(user_facing_message, 404)
 
+def did_you_mean(suggestions: list[str]) -> str:
+    if not suggestions:
+        return ""
+    return f" (did you mean: {' / '.join(suggestions)}?)"
+
 class UnidentifiedCardError(LccError):
-    def __init__(self, unidentified_input:str):
+    def __init__(self, unidentified_input:str, suggestions:list[str] = None):
         self.unidentified_input = unidentified_input
-        user_facing_message = f"Unable to identify card from: {unidentified_input}"
+        self.suggestions = suggestions or []
+        user_facing_message = f"Unable to identify card from: {unidentified_input}{did_you_mean(self.suggestions)}"
         super().__init__(user_facing_message, 404)
 
 class UnidentifiedCardsError(LccError):
     def __init__(self, unidentified_card_errors: list[UnidentifiedCardError]):
         user_facing_message = "Unable to identify cards from the following:"
         for unidentified_card_error in unidentified_card_errors:
-            user_facing_message += f"\n {unidentified_card_error.unidentified_input}"
+            user_facing_message += f"\n {unidentified_card_error.unidentified_input}{did_you_mean(unidentified_card_error.suggestions)}"
         super().__init__(user_facing_message, 404)
    
 class UnauthorizedError(LccError):
@@ -49,4 +55,20 @@ class CubeNotFoundError(LccError):
         
 class RetailSetNotFoundError(LccError):
     def __init__(self, user_facing_message):
-        super().__init__(user_facing_message, 404)
\ No newline at end of file
+        super().__init__(user_facing_message, 404)
+
+class InvalidCursorError(LccError):
+    def __init__(self, user_facing_message):
+        super().__init__(user_facing_message, 400)
+
+class InvalidPaginationError(LccError):
+    def __init__(self, user_facing_message):
+        super().__init__(user_facing_message, 400)
+
+class ServiceUnavailableError(LccError):
+    def __init__(self, user_facing_message):
+        super().__init__(user_facing_message, 503)
+
+class CardSetNotFoundError(LccError):
+    def __init__(self, user_facing_message):
+        super().__init__(user_facing_message, 404)
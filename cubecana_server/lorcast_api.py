@@ -1,16 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from pathlib import Path
+from typing import Callable
+import hashlib
 import json
+import os
 import threading
 
-from .dreamborn_manager import dreamborn_manager
+from .dreamborn_manager import dreamborn_manager, ALL_DREAMBORN_NAMES_FILE_PATH
+from . import card_snapshot
 from . import id_helper
 import requests
+from requests.adapters import HTTPAdapter
 from .card import ApiCard, CardPrinting, PrintingId, toPrintingId
+from .card_table import CardTable
 from .lorcana import ALT_ART_RARITIES
+from .startup import startup
 
 CACHED_API_DATA_FILEPATH = 'inputs/lorcast_api_cache/lorcast_api_data_cache.json'
 CACHED_API_DATA_SET_Q1_FILEPATH = 'inputs/lorcast_api_cache/lorcast_api_data_cache_q1.json'
+CARD_SNAPSHOT_FILEPATH = 'inputs/lorcast_api_cache/lorcast_api_data_cache.snapshot'
+# per set: last fetch, last change, content hash and the ETag / Last-Modified sent back as conditional request headers
+CACHED_API_MANIFEST_FILEPATH = 'inputs/lorcast_api_cache/lorcast_api_manifest.json'
+FROZEN_SET_AGE = timedelta(days=60)
+FROZEN_SET_RECHECK_INTERVAL = timedelta(days=7)
+# point at a local stub server to exercise refreshes without hitting api.lorcast.com
+LORCAST_API_BASE_URL_ENV_VAR = "CUBECANA_LORCAST_API_BASE_URL"
+DEFAULT_LORCAST_API_BASE_URL = 'https://api.lorcast.com/v0'
+DOWNLOAD_MAX_WORKERS = 8
+DOWNLOAD_TIMEOUT_SECONDS = 30
 MAX_CACHE_AGE = timedelta(days=1)
 # MAX_CACHE_AGE = timedelta(minutes=2)
 
@@ -27,11 +46,67 @@ lorcast_to_cubecana_rarity =  {
     "Iconic": "Iconic",
 }
 
+def write_file_atomically(file: Path, write_contents):
+    # written next to the target and renamed over it, so a crash mid-write never leaves a partial or missing file
+    file = Path(file)
+    file.parent.mkdir(parents=True, exist_ok=True)
+    temp_file = file.with_name(file.name + '.tmp')
+    with temp_file.open(mode='w') as file_to_write:
+        write_contents(file_to_write)
+    os.replace(temp_file, file)
+
+@dataclass(frozen=True)
+class CardSet:
+    code: str
+    name: str
+    released_at: str | None
+    release_order: int # 0 for the first released set, sets released the same day keep the order of the card data
+    num_cards: int
+    num_printings: int
+    printings: list[tuple[ApiCard, CardPrinting]] = field(compare=False, repr=False) # in the order of the card data
+
+@dataclass(frozen=True)
+class CardData:
+    """
+    Everything derived from one load of the card data. Swapped in with a single assignment, so a reader
+    holding a CardData never sees the cards of one load next to the table of another.
+    """
+    id_to_api_card: dict[str, ApiCard]
+    printing_id_to_card_printing: dict[PrintingId, CardPrinting]
+    set_code_to_card_set: dict[str, CardSet]
+    card_table: CardTable
+    version: int # bumped every time new card data is swapped in, lets caches notice stale entries
+
+@dataclass(frozen=True)
+class CardDataChange:
+    """Reported to the card data listeners after every swap, so caches can drop only entries using changed cards"""
+    version: int
+    changed_card_ids: frozenset[str] # added, updated or removed cards
+    full_reload: bool # the whole card data was (re)loaded, any card may have changed
+
 class LorcastApi:
     def __init__(self):
-        self.id_to_api_card: dict[str, ApiCard] = {}
-        self.is_updating_api_cache = False
+        self.card_data: CardData = CardData({}, {}, {}, CardTable({}), 0)
+        self.base_url = os.environ.get(LORCAST_API_BASE_URL_ENV_VAR, DEFAULT_LORCAST_API_BASE_URL).rstrip('/')
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=DOWNLOAD_MAX_WORKERS)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.refresh_lock = threading.Lock()
+        self.card_data_listeners: list[Callable[[CardDataChange], None]] = []
         self.timer = None
+
+    @property
+    def id_to_api_card(self) -> dict[str, ApiCard]:
+        return self.card_data.id_to_api_card
+
+    @property
+    def card_table(self) -> CardTable:
+        return self.card_data.card_table
+
+    @property
+    def data_version(self) -> int:
+        return self.card_data.version
     
     def get_lorcast_full_name(self, printing_untyped: dict) -> str:
         if 'version' in printing_untyped:
@@ -42,14 +117,60 @@ class LorcastApi:
         lorcast_full_name = self.get_lorcast_full_name(printing_untyped)
         return id_helper.to_id(lorcast_full_name)
 
-    def download_api_data(self) -> dict[str, dict]:
+    def fetch_json(self, url: str, validators: dict[str, str] = None) -> tuple[object | None, dict[str, str]]:
+        # returns the response json, or None when the server answered 304 Not Modified, and the validators to send next time
+        validators = validators or {}
+        headers = {}
+        if 'etag' in validators:
+            headers['If-None-Match'] = validators['etag']
+        if 'lastModified' in validators:
+            headers['If-Modified-Since'] = validators['lastModified']
+        print(f'Fetching {url}...')
+        res = self.session.get(url=url, headers=headers, timeout=DOWNLOAD_TIMEOUT_SECONDS)
+        if res.status_code == 304:
+            return None, validators
+        res.raise_for_status()
+        new_validators = {}
+        if res.headers.get('ETag'):
+            new_validators['etag'] = res.headers['ETag']
+        if res.headers.get('Last-Modified'):
+            new_validators['lastModified'] = res.headers['Last-Modified']
+        return res.json(), new_validators
+
+    def is_frozen_set(self, manifest_entry: dict, now: datetime) -> bool:
+        # a set that hasn't changed in a long while is only rechecked once in a while instead of every refresh
+        changed_at = datetime.fromisoformat(manifest_entry['changedAt'])
+        fetched_at = datetime.fromisoformat(manifest_entry['fetchedAt'])
+        return now - changed_at > FROZEN_SET_AGE and now - fetched_at < FROZEN_SET_RECHECK_INTERVAL
+
+    def fetch_set(self, code: str, manifest_entry: dict | None, now: datetime) -> tuple[list[dict] | None, dict]:
+        # returns the set's cards, or None when they're unchanged since manifest_entry, and the set's new manifest entry
+        if manifest_entry is not None and self.is_frozen_set(manifest_entry, now):
+            return None, manifest_entry
+        url = f'{self.base_url}/sets/{code}/cards'
+        cards_in_set, validators = self.fetch_json(url, manifest_entry)
+        if cards_in_set is None:
+            return None, {**manifest_entry, 'fetchedAt': now.isoformat()}
+        content_hash = hashlib.sha256(json.dumps(cards_in_set, sort_keys=True).encode('utf-8')).hexdigest()
+        changed_at = now.isoformat()
+        if manifest_entry is not None and manifest_entry.get('contentHash') == content_hash:
+            cards_in_set, changed_at = None, manifest_entry['changedAt']
+        return cards_in_set, {'url': url, **validators, 'contentHash': content_hash, 'fetchedAt': now.isoformat(), 'changedAt': changed_at}
+
+    def download_api_data(self, previous_printings_by_set_code: dict[str, dict[str, dict]] = None, manifest: dict[str, dict] = None) -> tuple[dict[str, dict], dict[str, dict], set[str]]:
+        """
+        Downloads the cards of the new and changed sets concurrently, every other set reuses its printings from
+        previous_printings_by_set_code. The manifest records per set code the last fetch, the content hash and
+        the ETag / Last-Modified sent back as conditional request headers.
+        Returns the printings, the new manifest and the codes of the sets whose cards changed.
+        """
         print("Downloading API cards from API...")
+        previous_printings_by_set_code = previous_printings_by_set_code or {}
+        manifest = manifest or {}
+        now = datetime.now()
         printing_id_str_to_printing_untyped: dict[str, dict] = {}
         # get sets
-        url = f'https://api.lorcast.com/v0/sets'
-        print(f'Fetching {url}...')
-        res = requests.get(url=url)
-        sets_data = res.json()
+        sets_data, _ = self.fetch_json(f'{self.base_url}/sets')
         if sets_data is None:
             raise Exception('Failed to fetch sets no json data')
         if 'results' not in sets_data:
@@ -57,12 +178,22 @@ class LorcastApi:
         sets_results = sets_data['results']
         if sets_results is None:
             raise Exception(f'Failed to fetch sets: results are None')
-        for set in sets_results:
-            code = set['code']
-            url = f'https://api.lorcast.com/v0/sets/{code}/cards'
-            print(f'Fetching {url}...')
-            res = requests.get(url=url)
-            cards_in_set = res.json()
+        set_codes = [set['code'] for set in sets_results]
+
+        # without the set's previous printings there would be nothing to reuse, so those are always fetched in full
+        manifest_entries = [manifest.get(code) if code in previous_printings_by_set_code else None for code in set_codes]
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_MAX_WORKERS, thread_name_prefix="lorcast-download") as executor:
+            set_responses = list(executor.map(self.fetch_set, set_codes, manifest_entries, [now] * len(set_codes)))
+
+        new_manifest: dict[str, dict] = {}
+        changed_set_codes: set[str] = set()
+        # assembled in the order of the sets, like the sequential download did
+        for code, (cards_in_set, manifest_entry) in zip(set_codes, set_responses):
+            new_manifest[code] = manifest_entry
+            if cards_in_set is None:
+                printing_id_str_to_printing_untyped.update(previous_printings_by_set_code[code])
+                continue
+            changed_set_codes.add(code)
             # iterate cards
             for printing_untyped in cards_in_set:
                 printing_id = PrintingId(
@@ -71,7 +202,8 @@ class LorcastApi:
                     set_code=printing_untyped['set']['code']
                 )
                 printing_id_str_to_printing_untyped[printing_id.__str__()] = printing_untyped
-        return printing_id_str_to_printing_untyped
+        print(f"Downloaded {len(changed_set_codes)} new or changed sets, reused {len(set_codes) - len(changed_set_codes)}.")
+        return printing_id_str_to_printing_untyped, new_manifest, changed_set_codes
 
     def get_cannonical_name(self, printing_untyped:dict) -> str:
         card_id = self.id_from_printing_untyped(printing_untyped)
@@ -130,7 +262,9 @@ class LorcastApi:
             collector_id=printing_untyped['collector_number'],
             set_code=printing_untyped['set']['code'],
             rarity=lorcast_to_cubecana_rarity[printing_untyped['rarity']],
-            image_uris=image_uris
+            image_uris=image_uris,
+            set_name=printing_untyped['set'].get('name'),
+            released_at=printing_untyped.get('released_at')
         )
 
     def is_alternate_art(self, printing: CardPrinting) -> bool:
@@ -173,70 +307,212 @@ class LorcastApi:
             printing_id_str_to_printing_untyped = json.load(file_to_read)    
         return printing_id_str_to_printing_untyped
 
+    def generate_printing_id_to_card_printing(self, id_to_api_card: dict[str, ApiCard]) -> dict[PrintingId, CardPrinting]:
+        printing_id_to_card_printing: dict[PrintingId, CardPrinting] = {}
+        for api_card in id_to_api_card.values():
+            for printing in api_card.card_printings:
+                printing_id_to_card_printing.setdefault(printing.printing_id(), printing)
+        return printing_id_to_card_printing
+
+    def generate_set_code_to_card_set(self, id_to_api_card: dict[str, ApiCard]) -> dict[str, CardSet]:
+        set_code_to_printings: dict[str, list[tuple[ApiCard, CardPrinting]]] = {}
+        for api_card in id_to_api_card.values():
+            for printing in api_card.card_printings:
+                set_code_to_printings.setdefault(printing.set_code, []).append((api_card, printing))
+        released_at_by_set_code = {set_code: min((printing.released_at for _, printing in printings if printing.released_at), default=None)
+                                   for set_code, printings in set_code_to_printings.items()}
+        # sets without a release date (e.g. the local Q1 data) go last, sorted is stable for same day releases
+        release_ordered_set_codes = sorted(set_code_to_printings, key=lambda set_code: (released_at_by_set_code[set_code] is None, released_at_by_set_code[set_code] or ''))
+        set_code_to_card_set: dict[str, CardSet] = {}
+        for release_order, set_code in enumerate(release_ordered_set_codes):
+            printings = set_code_to_printings[set_code]
+            set_code_to_card_set[set_code] = CardSet(
+                code=set_code,
+                name=next((printing.set_name for _, printing in printings if printing.set_name), set_code),
+                released_at=released_at_by_set_code[set_code],
+                release_order=release_order,
+                num_cards=len({id(api_card) for api_card, _ in printings}),
+                num_printings=len(printings),
+                printings=printings,
+            )
+        return set_code_to_card_set
+
     def get_card_printing(self, printing_id: PrintingId) -> CardPrinting | None:
-        api_card = self.get_api_card(printing_id.card_id)
+        card_data = self.card_data
+        api_card = card_data.id_to_api_card.get(printing_id.card_id)
         if not api_card:
             return None
-        card_printing = next((printing for printing in api_card.card_printings if printing.printing_id() == printing_id), None)
+        card_printing = card_data.printing_id_to_card_printing.get(printing_id)
         if card_printing == None:
             return api_card.default_printing
         return card_printing
 
+    def find_card_printing(self, printing_id: PrintingId) -> CardPrinting | None:
+        # strict version of get_card_printing, None instead of the default printing when the printing doesn't exist
+        return self.card_data.printing_id_to_card_printing.get(printing_id)
+
     def get_api_card(self, card_id: str) -> ApiCard | None:
         return self.id_to_api_card.get(card_id)
 
     def read_or_fetch_id_to_api_card(self) -> dict[str, ApiCard]:
         return self.id_to_api_card
 
+    def get_card_sets(self) -> list[CardSet]:
+        # in release order
+        return list(self.card_data.set_code_to_card_set.values())
+
+    def get_card_set(self, set_code: str) -> CardSet | None:
+        return self.card_data.set_code_to_card_set.get(set_code)
+
+    def get_printings_from_set(self, set_code: str) -> list[tuple[ApiCard, CardPrinting]]:
+        card_set = self.get_card_set(set_code)
+        return card_set.printings if card_set else []
+
     def get_cards_from_set(self, set_code: str) -> list[ApiCard]:
-        return [api_card for api_card in self.id_to_api_card.values() if any(printing.set_code == set_code for printing in api_card.card_printings)]
+        # distinct cards in the order of the card data, like scanning id_to_api_card would
+        return list({id(api_card): api_card for api_card, _ in self.get_printings_from_set(set_code)}.values())
     
     def refresh_api_data_cache_if_needed(self):
         cached_api_data_file = Path(CACHED_API_DATA_FILEPATH)
 
-        if self.is_updating_api_cache:
+        if not self.refresh_lock.acquire(blocking=False):
             return
+        try:
+            self._refresh_api_data_cache_if_needed(cached_api_data_file)
+        finally:
+            self.refresh_lock.release()
 
+    def _refresh_api_data_cache_if_needed(self, cached_api_data_file: Path):
         if not cached_api_data_file.is_file():
             print(f"API data cache not present on disk. Updating...")
             self.fetch_persist_load_api_cache(cached_api_data_file)
-        elif cached_api_data_file.is_file() and (datetime.now() - datetime.fromtimestamp(cached_api_data_file.stat().st_mtime) > MAX_CACHE_AGE):
-            print(f"API data cache is older than {MAX_CACHE_AGE}. Last updated at {datetime.fromtimestamp(cached_api_data_file.stat().st_mtime)}. Updating...")
+        elif cached_api_data_file.is_file() and (datetime.now() - self.last_refreshed_at(cached_api_data_file) > MAX_CACHE_AGE):
+            print(f"API data cache is older than {MAX_CACHE_AGE}. Last updated at {self.last_refreshed_at(cached_api_data_file)}. Updating...")
             self.fetch_persist_load_api_cache(cached_api_data_file)
         elif len(self.id_to_api_card) == 0:
             self.load_api_cache_from_disk(cached_api_data_file)
 
+    def last_refreshed_at(self, cached_api_data_file: Path) -> datetime:
+        # the manifest is rewritten by every successful refresh, changed or not. The data file's mtime is part of
+        # the card snapshot's fingerprint, so it's only touched when the data actually changes
+        age_files = [file for file in (Path(CACHED_API_MANIFEST_FILEPATH), cached_api_data_file) if file.is_file()]
+        return datetime.fromtimestamp(max(file.stat().st_mtime for file in age_files))
+
     def fetch_persist_load_api_cache(self, cached_api_data_file):
-        self.is_updating_api_cache = True
-        if cached_api_data_file.is_file():
-            cached_api_data_file.unlink() 
-        self.fetch_api_and_persist_to_disk(cached_api_data_file)
-        self.load_api_cache_from_disk(cached_api_data_file)
-        self.is_updating_api_cache = False
-
-    def fetch_api_and_persist_to_disk(self, cached_api_data_file):
-        printing_id_to_printing_untyped = self.fetch_all_api_data()
-        self.cache_api_data_to_disk(cached_api_data_file, printing_id_to_printing_untyped)
-        print(f"Data cache written to disk.")
+        # the current cache file and card data stay in place until the download has fully succeeded
+        try:
+            printing_id_str_to_printing_untyped, changed_card_ids = self.fetch_api_and_persist_to_disk(cached_api_data_file)
+        except Exception as e:
+            if not cached_api_data_file.is_file():
+                raise
+            print(f"Failed to refresh API data cache, keeping the cached card data: {e}")
+            printing_id_str_to_printing_untyped, changed_card_ids = None, set()
+        if len(self.id_to_api_card) == 0:
+            self.load_api_cache_from_disk(cached_api_data_file)
+        elif changed_card_ids:
+            self.apply_card_changes(cached_api_data_file, printing_id_str_to_printing_untyped, changed_card_ids)
+
+    def fetch_api_and_persist_to_disk(self, cached_api_data_file) -> tuple[dict[str, dict], set[str]]:
+        previous_printing_id_str_to_printing_untyped = self.read_cached_printings(cached_api_data_file)
+        previous_printings_by_set_code: dict[str, dict[str, dict]] = {}
+        for printing_id_str, printing_untyped in previous_printing_id_str_to_printing_untyped.items():
+            previous_printings_by_set_code.setdefault(printing_untyped['set']['code'], {})[printing_id_str] = printing_untyped
+        manifest = self.read_manifest() if previous_printings_by_set_code else {}
+        printing_id_str_to_printing_untyped, manifest, changed_set_codes = self.fetch_all_api_data(previous_printings_by_set_code, manifest)
+        changed_card_ids = self.changed_card_ids(previous_printing_id_str_to_printing_untyped, printing_id_str_to_printing_untyped, changed_set_codes)
+        if changed_card_ids:
+            self.cache_api_data_to_disk(cached_api_data_file, printing_id_str_to_printing_untyped)
+            print(f"Data cache written to disk, {len(changed_card_ids)} cards changed.")
+        else:
+            # nothing new, writing the manifest below restarts the cache's age
+            print(f"API data unchanged since the last download.")
+        write_file_atomically(Path(CACHED_API_MANIFEST_FILEPATH), lambda file_to_write: json.dump(manifest, file_to_write, indent=2))
+        return printing_id_str_to_printing_untyped, changed_card_ids
+
+    def changed_card_ids(self, previous_printing_id_str_to_printing_untyped: dict[str, dict], printing_id_str_to_printing_untyped: dict[str, dict], changed_set_codes: set[str]) -> set[str]:
+        # printings that were added or dropped, plus the printings of changed sets whose data differs
+        changed_printing_id_strs = set(previous_printing_id_str_to_printing_untyped.keys() ^ printing_id_str_to_printing_untyped.keys())
+        for printing_id_str, printing_untyped in printing_id_str_to_printing_untyped.items():
+            if printing_untyped['set']['code'] in changed_set_codes and previous_printing_id_str_to_printing_untyped.get(printing_id_str) != printing_untyped:
+                changed_printing_id_strs.add(printing_id_str)
+        return {toPrintingId(printing_id_str).card_id for printing_id_str in changed_printing_id_strs}
+
+    def read_cached_printings(self, cached_api_data_file) -> dict[str, dict]:
+        if not cached_api_data_file.is_file():
+            return {}
+        with cached_api_data_file.open(mode='r') as file_to_read:
+            return json.load(file_to_read)
+
+    def read_manifest(self) -> dict[str, dict]:
+        manifest_file = Path(CACHED_API_MANIFEST_FILEPATH)
+        if not manifest_file.is_file():
+            return {}
+        with manifest_file.open(mode='r') as file_to_read:
+            return json.load(file_to_read)
 
     def cache_api_data_to_disk(self, cached_api_data_file, printing_id_to_printing_untyped):
-        Path(cached_api_data_file).parent.mkdir(parents=True, exist_ok=True)
-        with cached_api_data_file.open(mode='w') as file_to_write:
-            json.dump(printing_id_to_printing_untyped, file_to_write)
+        write_file_atomically(cached_api_data_file, lambda file_to_write: json.dump(printing_id_to_printing_untyped, file_to_write))
 
-    def fetch_all_api_data(self) -> dict[str, dict]:
-        printing_id_to_printing_untyped = self.download_api_data()
+    def fetch_all_api_data(self, previous_printings_by_set_code: dict[str, dict[str, dict]] = None, manifest: dict[str, dict] = None) -> tuple[dict[str, dict], dict[str, dict], set[str]]:
+        printing_id_to_printing_untyped, manifest, changed_set_codes = self.download_api_data(previous_printings_by_set_code, manifest)
         printing_id_to_printing_untyped_q1 = self.load_set_q1_data_from_disk()
         printing_id_to_printing_untyped.update(printing_id_to_printing_untyped_q1) # merge the two dicts
         # self.fix_card_names(name_to_printing_untyped)
-        return printing_id_to_printing_untyped
+        return printing_id_to_printing_untyped, manifest, changed_set_codes
+
+    def card_snapshot_source_files(self, cached_api_data_file) -> list[Path]:
+        # canonical names come from the dreamborn names, so the snapshot is stale when either file changes
+        return [Path(cached_api_data_file), Path(ALL_DREAMBORN_NAMES_FILE_PATH)]
+
+    def write_card_snapshot(self, cached_api_data_file, id_to_api_card: dict[str, ApiCard]):
+        try:
+            card_snapshot.write_snapshot(CARD_SNAPSHOT_FILEPATH, id_to_api_card, self.card_snapshot_source_files(cached_api_data_file))
+        except OSError as e:
+            print(f"Failed to write card snapshot to {CARD_SNAPSHOT_FILEPATH}: {e}")
+
+    def read_id_to_api_card_from_disk(self, cached_api_data_file) -> dict[str, ApiCard]:
+        id_to_api_card = card_snapshot.read_snapshot(CARD_SNAPSHOT_FILEPATH, self.card_snapshot_source_files(cached_api_data_file))
+        if id_to_api_card is not None:
+            return id_to_api_card
+        id_to_api_card = self.generate_id_to_api_card(self.read_cached_printings(cached_api_data_file))
+        self.write_card_snapshot(cached_api_data_file, id_to_api_card)
+        return id_to_api_card
 
     def load_api_cache_from_disk(self, cached_api_data_file):
-        with cached_api_data_file.open(mode='r') as file_to_read:
-            printing_id_str_to_printing_untyped = json.load(file_to_read)
-            id_to_api_card = self.generate_id_to_api_card(printing_id_str_to_printing_untyped)
-            self.id_to_api_card = id_to_api_card
-            print(f"API data cache loaded from disk with {len(self.id_to_api_card)} cards.")
+        id_to_api_card = self.read_id_to_api_card_from_disk(cached_api_data_file)
+        self.swap_card_data(id_to_api_card, CardDataChange(self.card_data.version + 1, frozenset(), full_reload=True))
+        print(f"API data cache loaded from disk with {len(self.id_to_api_card)} cards.")
+
+    def apply_card_changes(self, cached_api_data_file, printing_id_str_to_printing_untyped: dict[str, dict], changed_card_ids: set[str]):
+        # only the changed cards are rebuilt, every other ApiCard carries over from the current card data
+        changed_printings = {printing_id_str: printing_untyped for printing_id_str, printing_untyped in printing_id_str_to_printing_untyped.items()
+                             if toPrintingId(printing_id_str).card_id in changed_card_ids}
+        changed_id_to_api_card = self.generate_id_to_api_card(changed_printings)
+        id_to_api_card = dict(self.id_to_api_card)
+        for card_id in changed_card_ids:
+            if card_id in changed_id_to_api_card:
+                id_to_api_card[card_id] = changed_id_to_api_card[card_id]
+            else:
+                id_to_api_card.pop(card_id, None)
+        self.swap_card_data(id_to_api_card, CardDataChange(self.card_data.version + 1, frozenset(changed_card_ids), full_reload=False))
+        self.write_card_snapshot(cached_api_data_file, id_to_api_card)
+        print(f"API data cache merged {len(changed_card_ids)} changed cards, {len(self.id_to_api_card)} cards.")
+
+    def swap_card_data(self, id_to_api_card: dict[str, ApiCard], card_data_change: CardDataChange):
+        # built in full before the single swap, readers keep using the previous CardData until then
+        self.card_data = CardData(id_to_api_card,
+                                  self.generate_printing_id_to_card_printing(id_to_api_card),
+                                  self.generate_set_code_to_card_set(id_to_api_card),
+                                  CardTable(id_to_api_card),
+                                  card_data_change.version)
+        for listener in list(self.card_data_listeners):
+            try:
+                listener(card_data_change)
+            except Exception as e:
+                print(f"Card data listener failed: {e}")
+
+    def add_card_data_listener(self, listener: Callable[[CardDataChange], None]):
+        self.card_data_listeners.append(listener)
 
     def _handle_timer(self):
         self.refresh_api_data_cache_if_needed()
@@ -277,4 +553,4 @@ class LorcastApi:
     #     print("Fixing card names")
 
 lorcast_api: LorcastApi = LorcastApi()
-lorcast_api.init()
\ No newline at end of file
+startup.register('lorcast_api', lorcast_api.init)
\ No newline at end of file
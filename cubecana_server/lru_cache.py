@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+class LruCache:
+    """
+    Small thread-safe LRU cache with an optional time-to-live, shared by the managers that
+    memoize expensive results in-process. Tracks hits / misses so they can be reported.
+
+    Invalidations bump a generation, a fill that read its value before the invalidation of its key
+    passes the generation it started at to put and is dropped, so it can't write back stale data.
+    """
+    def __init__(self, max_size: int, ttl_seconds: float = None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+        self._generation = 0
+        # key -> generation it was last invalidated at, bounded: fills that started at or before
+        # _forgotten_generation are dropped for every key once older invalidations are forgotten
+        self._invalidated_at: OrderedDict[Hashable, int] = OrderedDict()
+        self._forgotten_generation = 0
+        self._lock = threading.Lock()
+
+    def generation(self) -> int:
+        # read before loading a value to put, see put
+        with self._lock:
+            return self._generation
+
+    def _record_invalidation(self, key: Hashable):
+        self._invalidated_at[key] = self._generation
+        self._invalidated_at.move_to_end(key)
+        while len(self._invalidated_at) > self.max_size:
+            _, self._forgotten_generation = self._invalidated_at.popitem(last=False)
+
+    def _is_stale(self, key: Hashable, read_generation: int) -> bool:
+        return read_generation < self._forgotten_generation or read_generation < self._invalidated_at.get(key, -1)
+
+    def get(self, key: Hashable) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, stored_at = entry
+            if self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, read_generation: int = None) -> bool:
+        # read_generation: the generation() from before value was read, the put is dropped if key was invalidated since
+        with self._lock:
+            if read_generation is not None and self._is_stale(key, read_generation):
+                return False
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            return True
+
+    def update(self, key: Hashable, update_value: Callable[[Any], Any]) -> bool:
+        # replaces a live entry with update_value(value), keeping its age so updates don't extend its time-to-live.
+        # Does nothing if the key isn't cached, an update never brings back an invalidated entry
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            value, stored_at = entry
+            if self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds:
+                return False
+            self._entries[key] = (update_value(value), stored_at)
+            return True
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(key, None)
+            self._record_invalidation(key)
+
+    def invalidate_where(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        with self._lock:
+            stale_keys = [key for key, (value, _) in self._entries.items() if predicate(key, value)]
+            self._generation += 1
+            for key in stale_keys:
+                del self._entries[key]
+                self._record_invalidation(key)
+            return len(stale_keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._invalidated_at.clear()
+            self._forgotten_generation = self._generation
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict[str, int | float]:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxSize': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRate': self.hits / lookups if lookups else 0.0,
+        }
@@ -1,20 +1,17 @@
 import base64
+from functools import cached_property
 from datetime import datetime
 from . import lcc_error
 from . import id_helper
+from .startup import startup
 
 class PixelbornManager:
-    def __init__(self):
-        self.id_to_pixelborn_name = self._load_id_to_pixelborn_name()
-
-    def _load_id_to_pixelborn_name(self):
-        id_to_pixelborn_name = {}
+    # read on first use (or by startup), not when the module is imported
+    @cached_property
+    def id_to_pixelborn_name(self) -> dict[str, str]:
         with open('inputs/pixelborn_all_cards.txt', 'r') as file:
-            for line in file:
-                pixelborn_name = line.strip()
-                id = id_helper.to_id(pixelborn_name)
-                id_to_pixelborn_name[id] = pixelborn_name
-        return id_to_pixelborn_name
+            pixelborn_names = [line.strip() for line in file]
+        return dict(zip(id_helper.to_ids(pixelborn_names), pixelborn_names))
 
     def generate_pixelborn_deck(self, id_to_count):
         pixelborn_deck_decoded = ""
@@ -26,4 +23,5 @@ class PixelbornManager:
         pixelborn_deck_encoded = base64.b64encode(pixelborn_deck_decoded.encode('utf-8')).decode('utf-8')
         return pixelborn_deck_encoded
     
-pixelborn_manager:PixelbornManager = PixelbornManager()
\ No newline at end of file
+pixelborn_manager:PixelbornManager = PixelbornManager()
+startup.register('pixelborn_names', lambda: pixelborn_manager.id_to_pixelborn_name)
\ No newline at end of file
@@ -1,11 +1,23 @@
-from dataclasses import dataclass
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
+from types import FunctionType, ModuleType
 from . import api
 from typing import List
 from . import lcc_error
 from . import draftmancer
+from . import card_evaluations
+from .format_analysis_manager import format_analysis_manager
+from .startup import startup
 
 RETAIL_SETS_DIR_PATH = "inputs/retail_sets"
+# set to 1 to precompute the default analysis of every retail set in the background at startup
+WARM_RETAIL_ANALYSIS_ENV_VAR = "CUBECANA_WARM_RETAIL_ANALYSIS"
+DEFAULT_ANALYSIS_BOOSTERS_PER_PLAYER = 4
+DEFAULT_ANALYSIS_NUM_PLAYERS = 8
 GAME_MODE_SUPER_SEALED = "SUPER_SEALED"
 GAME_MODE_SEALED = "SEALED"
 GAME_MODE_DRAFT = "DRAFT"
@@ -24,10 +36,14 @@ def get_available_game_modes(retail_set_name) -> str:
 class RetailSet:
         id: str
         name: str
-        draftmancer_file_contents: str
+        draftmancer_file: draftmancer.DraftmancerFile = field(compare=False, repr=False)
         ratings_missing: bool = False
         # release_date: # some day - maybe use the APIs?
 
+        @property
+        def draftmancer_file_contents(self) -> str:
+                return self.draftmancer_file.text_contents
+
         def to_retail_set_entry(self) -> api.RetailSetEntry:
                 return api.RetailSetEntry(
                         name=self.name,
@@ -37,18 +53,70 @@ class RetailSet:
                         ratingsMissing=self.ratings_missing,
                 )
 
+def retained_size(root) -> int:
+    # bytes held by root and everything it reaches through containers and instance attributes, each object
+    # counted once. Classes, functions and modules are skipped so shared code isn't counted as data
+    seen: set[int] = set()
+    stack = [root]
+    size = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, (type, ModuleType, FunctionType)):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif hasattr(obj, '__dict__'):
+            stack.append(vars(obj))
+    return size
+
+def retained_size_report(root) -> str:
+    return f", retaining {retained_size(root) / 2**20:.1f} MiB"
+
 class RetailManager:
     def __init__(self):
         self.retail_sets: dict[str, RetailSet] = {}
 
     def init(self):
+        warm_up = os.environ.get(WARM_RETAIL_ANALYSIS_ENV_VAR, '').lower() in ('1', 'true', 'yes')
+        start = time.perf_counter()
         self.load_retail_sets(RETAIL_SETS_DIR_PATH)
+        seconds = time.perf_counter() - start
+        memory_report = retained_size_report(self.retail_sets) if warm_up else ""
+        print(f"Loaded {self.get_set_count()} retail sets in {seconds:.2f}s{memory_report}")
+        if warm_up:
+            self.warm_up_analysis()
+
+    def warm_up_analysis(self) -> threading.Thread:
+        thread = threading.Thread(target=self._warm_up_analysis, name="retail-analysis-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def _warm_up_analysis(self):
+        start = time.perf_counter()
+        format_analysis_responses = []
+        for retail_set in list(self.retail_sets.values()):
+            try:
+                format_analysis_response = format_analysis_manager.analyze(slot_model=retail_set.draftmancer_file.slot_model,
+                                                boosters_per_player=DEFAULT_ANALYSIS_BOOSTERS_PER_PLAYER,
+                                                num_players=DEFAULT_ANALYSIS_NUM_PLAYERS,
+                                                card_evaluations_file=card_evaluations.DEFAULT_RETAIL_CARD_EVALUATIONS_FILE,
+                                                retail_set_code=retail_set.id)
+                format_analysis_responses.append(format_analysis_response)
+            except Exception as e:
+                print(f"Failed to warm up analysis for retail set {retail_set.id}: {e}")
+        seconds = time.perf_counter() - start
+        print(f"Warmed up analysis for {self.get_set_count()} retail sets in {seconds:.2f}s{retained_size_report(format_analysis_responses)}")
 
     def generate_retail_set(self, file: Path) -> RetailSet:
         draftmancer_file:draftmancer.DraftmancerFile = draftmancer.read_draftmancer_file(file)
         set_id = file.stem.rstrip('.draftmancer')
         ratings_missing = bool(getattr(draftmancer_file.draftmancer_settings, 'ratingsMissing', False))
-        return RetailSet(set_id, draftmancer_file.draftmancer_settings.name, draftmancer_file.text_contents, ratings_missing)
+        return RetailSet(set_id, draftmancer_file.draftmancer_settings.name, draftmancer_file, ratings_missing)
 
     def load_retail_sets(self, retail_sets_filepath: str):
         retail_sets_path = Path(retail_sets_filepath)
@@ -78,5 +146,12 @@ class RetailManager:
             raise lcc_error.RetailSetNotFoundError(f"Retail set with id {id} not found")
         return api.RetailSet(id=retail_set.id, name=retail_set.name, draftmancerFile=retail_set.draftmancer_file_contents)
 
+    def get_draftmancer_file(self, id: str) -> draftmancer.DraftmancerFile:
+        retail_set = self.retail_sets.get(id)
+        if retail_set is None:
+            raise lcc_error.RetailSetNotFoundError(f"Retail set with id {id} not found")
+        return retail_set.draftmancer_file
+
 retail_manager: RetailManager = RetailManager()
-retail_manager.init()
\ No newline at end of file
+# the retail sets resolve their cards against the card data
+startup.register('retail_sets', retail_manager.init, depends_on=['lorcast_api'])
\ No newline at end of file
@@ -0,0 +1,29 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# metric name -> milliseconds spent in the current request, sent back in its Server-Timing header.
+# None outside of a request (cli, startup, timers), recording is then a no-op.
+request_timings: ContextVar[dict[str, float] | None] = ContextVar('request_timings', default=None)
+
+def start_request():
+    request_timings.set({})
+
+def record(name: str, seconds: float):
+    timings = request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds * 1000
+
+@contextmanager
+def timed(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+def header_value() -> str | None:
+    timings = request_timings.get()
+    if not timings:
+        return None
+    return ', '.join(f"{name};dur={milliseconds:.2f}" for name, milliseconds in timings.items())
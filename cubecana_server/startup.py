@@ -0,0 +1,138 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_READY = "ready"
+STATUS_FAILED = "failed"
+
+@dataclass
+class StartupComponent:
+    name: str
+    init: Callable[[], None]
+    depends_on: list[str] = field(default_factory=list)
+    status: str = STATUS_PENDING
+    seconds: float | None = None
+    error: str | None = None
+
+class Startup:
+    """
+    Runs the heavy initialization of the module singletons (card data, retail sets, name files, timers)
+    instead of doing it at import. Modules register a component when they're imported, the app starts
+    them on a thread pool in the background and waits for readiness per request, the cli and benchmarks
+    run them synchronously.
+    """
+    def __init__(self):
+        self.components: dict[str, StartupComponent] = {}
+        self.futures: dict[str, Future] = {}
+        self.executor: ThreadPoolExecutor | None = None
+        self.started_at: float | None = None
+        self.ready_event = threading.Event()
+        # set once waiting can't change the outcome: every component finished, or one failed and startup can't get ready
+        self.settled_event = threading.Event()
+        self.lock = threading.Lock()
+
+    def register(self, name: str, init: Callable[[], None], depends_on: list[str] = None):
+        self.components[name] = StartupComponent(name, init, list(depends_on or []))
+
+    def with_dependencies(self, names: list[str]) -> list[str]:
+        # dependencies before dependents, so a component's dependencies are always submitted before it
+        ordered: list[str] = []
+        def visit(name: str, path: tuple[str, ...]):
+            if name in path:
+                raise Exception(f"Startup components have a dependency cycle: {' -> '.join(path + (name,))}")
+            if name in ordered:
+                return
+            if name not in self.components:
+                raise Exception(f"No startup component named {name}")
+            for dependency in self.components[name].depends_on:
+                visit(dependency, path + (name,))
+            ordered.append(name)
+        for name in names:
+            visit(name, ())
+        return ordered
+
+    def start(self, names: list[str] = None) -> list[Future]:
+        with self.lock:
+            ordered = self.with_dependencies(names if names is not None else list(self.components))
+            to_submit = [name for name in ordered if name not in self.futures]
+            if not to_submit:
+                return [self.futures[name] for name in ordered]
+            if self.started_at is None:
+                self.started_at = time.perf_counter()
+            self.ready_event.clear()
+            if not self.has_failed():
+                self.settled_event.clear()
+            # one worker per component, a component waiting on its dependencies can't starve the ones it waits for
+            self.executor = ThreadPoolExecutor(max_workers=len(to_submit), thread_name_prefix="startup")
+            for name in to_submit:
+                self.futures[name] = self.executor.submit(self._run_component, self.components[name])
+            self.executor.shutdown(wait=False)
+            futures = [self.futures[name] for name in ordered]
+        threading.Thread(target=self._await_ready, args=(futures,), name="startup-ready", daemon=True).start()
+        return futures
+
+    def run(self, names: list[str] = None):
+        futures = self.start(names)
+        wait(futures)
+        failed = [component for component in self.components.values() if component.status == STATUS_FAILED]
+        if failed:
+            raise Exception(f"Startup failed for: {', '.join(f'{component.name} ({component.error})' for component in failed)}")
+
+    def _run_component(self, component: StartupComponent):
+        start = time.perf_counter()
+        try:
+            for dependency in component.depends_on:
+                self.futures[dependency].result() # re-raises a dependency's failure, so dependents fail too
+            component.status = STATUS_RUNNING
+            start = time.perf_counter()
+            component.init()
+        except Exception as e:
+            component.status = STATUS_FAILED
+            component.error = str(e)
+            print(f"Startup: {component.name} failed after {time.perf_counter() - start:.2f}s: {e}")
+            self.settled_event.set()
+            raise
+        finally:
+            component.seconds = time.perf_counter() - start
+        component.status = STATUS_READY
+        print(f"Startup: {component.name} ready in {component.seconds:.2f}s")
+
+    def _await_ready(self, futures: list[Future]):
+        wait(futures)
+        if all(self.components[name].status == STATUS_READY for name in self.components if name in self.futures):
+            print(f"Startup: {len(self.futures)} components ready in {time.perf_counter() - self.started_at:.2f}s")
+            self.ready_event.set()
+        # a later start may have submitted more components, those still count
+        if all(future.done() for future in list(self.futures.values())):
+            self.settled_event.set()
+
+    def is_ready(self) -> bool:
+        return self.ready_event.is_set()
+
+    def has_failed(self) -> bool:
+        return any(component.status == STATUS_FAILED for component in self.components.values())
+
+    def wait_until_ready(self, timeout_seconds: float = None) -> bool:
+        # returns as soon as a component fails, startup won't get ready after that
+        self.settled_event.wait(timeout_seconds)
+        return self.is_ready()
+
+    def get_status(self) -> dict:
+        return {
+            'ready': self.is_ready(),
+            'failed': self.has_failed(),
+            'components': {
+                component.name: {
+                    'status': component.status,
+                    'dependsOn': component.depends_on,
+                    'seconds': component.seconds,
+                    'error': component.error,
+                } for component in self.components.values()
+            },
+        }
+
+startup: Startup = Startup()
@@ -0,0 +1,10 @@
+-- Store trendiness instead of computing it for every row on every TRENDING sort, so the sort can use an index.
+-- The server keeps it fresh: counter flushes and edits rewrite it, and an hourly job decays it as days pass.
+ALTER TABLE cubecana_cubes
+    ADD COLUMN trendiness DOUBLE DEFAULT 0;
+
+UPDATE cubecana_cubes
+SET trendiness = COALESCE(popularity / (DATEDIFF(NOW(), FROM_UNIXTIME(last_updated_epoch_seconds)) + 1), 0);
+
+ALTER TABLE cubecana_cubes
+    ADD INDEX trendiness (trendiness);
@@ -0,0 +1,49 @@
+-- Normalized copies of card_id_to_count and tags, written by the server alongside the JSON columns,
+-- so "which cubes contain card X" and tag filters are index lookups instead of scans over every cube.
+-- Existing cubes are backfilled below in the same migration, so tag filters and card lookups see them right away.
+-- Legacy entries keyed by a bare card id get no set / collector id here, python cli.py backfill_cube_cards_and_tags
+-- resolves them to their default printing and can re-sync the tables at any time.
+CREATE TABLE cubecana_cube_cards(
+    pk INT NOT NULL AUTO_INCREMENT,
+    cube_pk INT NOT NULL,
+    card_id varchar(255) NOT NULL,
+    set_code varchar(32),
+    collector_id varchar(32),
+    count INT NOT NULL,
+    PRIMARY KEY(pk),
+    INDEX card_id (card_id),
+    INDEX cube_pk (cube_pk),
+    FOREIGN KEY (cube_pk) REFERENCES cubecana_cubes(pk) ON DELETE CASCADE
+);
+
+CREATE TABLE cubecana_cube_tags(
+    pk INT NOT NULL AUTO_INCREMENT,
+    cube_pk INT NOT NULL,
+    tag varchar(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NOT NULL,
+    PRIMARY KEY(pk),
+    INDEX tag (tag),
+    INDEX cube_pk (cube_pk),
+    FOREIGN KEY (cube_pk) REFERENCES cubecana_cubes(pk) ON DELETE CASCADE
+);
+
+INSERT INTO cubecana_cube_tags (cube_pk, tag)
+SELECT DISTINCT cubecana_cube.pk, cube_tag.tag
+FROM cubecana_cubes cubecana_cube,
+    JSON_TABLE(cubecana_cube.tags, '$[*]' COLUMNS (
+        tag varchar(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci PATH '$'
+    )) AS cube_tag
+WHERE cube_tag.tag IS NOT NULL;
+
+-- card_id_to_count keys are card_id-set_code-collector_id printing ids or legacy bare card ids, anything else is skipped like the server does
+INSERT INTO cubecana_cube_cards (cube_pk, card_id, set_code, collector_id, count)
+SELECT
+    cubecana_cube.pk,
+    SUBSTRING_INDEX(cube_card.printing_id, '-', 1),
+    IF(LOCATE('-', cube_card.printing_id) > 0, SUBSTRING_INDEX(SUBSTRING_INDEX(cube_card.printing_id, '-', 2), '-', -1), NULL),
+    IF(LOCATE('-', cube_card.printing_id) > 0, SUBSTRING_INDEX(cube_card.printing_id, '-', -1), NULL),
+    CAST(JSON_EXTRACT(cubecana_cube.card_id_to_count, CONCAT('$."', cube_card.printing_id, '"')) AS SIGNED)
+FROM cubecana_cubes cubecana_cube,
+    JSON_TABLE(JSON_KEYS(cubecana_cube.card_id_to_count), '$[*]' COLUMNS (
+        printing_id varchar(255) PATH '$'
+    )) AS cube_card
+WHERE CHAR_LENGTH(cube_card.printing_id) - CHAR_LENGTH(REPLACE(cube_card.printing_id, '-', '')) IN (0, 2);
@@ -0,0 +1,34 @@
+import unittest
+from unittest import mock
+from cubecana_server.cube_counter_buffer import CubeCounterBuffer, PAGE_VIEWS, DRAFTS
+
+FIRST_CUBE_ID = b'\x01' * 16
+SECOND_CUBE_ID = b'\x02' * 16
+
+class TestCubeCounterBuffer(unittest.TestCase):
+    def setUp(self):
+        patch = mock.patch('cubecana_server.cube_counter_buffer.cube_dao')
+        self.cube_dao = patch.start()
+        self.addCleanup(patch.stop)
+        self.cube_counter_buffer = CubeCounterBuffer()
+
+    def test_flush_writes_every_cube_in_one_batch(self):
+        self.cube_counter_buffer.increment(FIRST_CUBE_ID, PAGE_VIEWS)
+        self.cube_counter_buffer.increment(FIRST_CUBE_ID, PAGE_VIEWS)
+        self.cube_counter_buffer.increment(SECOND_CUBE_ID, DRAFTS)
+        self.assertEqual(self.cube_counter_buffer.flush(), 2)
+        self.cube_dao.apply_counter_deltas.assert_called_once_with({FIRST_CUBE_ID: {PAGE_VIEWS: 2}, SECOND_CUBE_ID: {DRAFTS: 1}})
+        self.assertEqual(self.cube_counter_buffer.flush(), 0)
+        self.cube_dao.apply_counter_deltas.assert_called_once()
+
+    def test_failed_flush_is_retried_with_new_increments(self):
+        self.cube_dao.apply_counter_deltas.side_effect = [Exception("db down"), None]
+        self.cube_counter_buffer.increment(FIRST_CUBE_ID, PAGE_VIEWS)
+        self.assertEqual(self.cube_counter_buffer.flush(), 0)
+        self.cube_counter_buffer.increment(FIRST_CUBE_ID, PAGE_VIEWS)
+        self.cube_counter_buffer.increment(SECOND_CUBE_ID, DRAFTS)
+        self.assertEqual(self.cube_counter_buffer.flush(), 2)
+        self.cube_dao.apply_counter_deltas.assert_called_with({FIRST_CUBE_ID: {PAGE_VIEWS: 2}, SECOND_CUBE_ID: {DRAFTS: 1}})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+from unittest import mock
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from cubecana_server.cube_dao import cube_dao
+
+SECONDS_PER_DAY = 86400
+NOW_EPOCH_SECONDS = 100 * SECONDS_PER_DAY
+
+def sqlite_engine():
+    # stand-ins for the MySQL date functions trendiness_of uses. now() renders as CURRENT_TIMESTAMP on sqlite,
+    # so datediff counts the days up to a fixed now instead
+    engine = create_engine('sqlite://')
+    @event.listens_for(engine, 'connect')
+    def add_mysql_functions(connection, connection_record):
+        connection.create_function('from_unixtime', 1, lambda epoch_seconds: epoch_seconds)
+        connection.create_function('datediff', 2, lambda now, start: float((NOW_EPOCH_SECONDS - start) // SECONDS_PER_DAY))
+    return engine
+
+class TestRecomputeTrendiness(unittest.TestCase):
+    def setUp(self):
+        engine = sqlite_engine()
+        with engine.begin() as connection:
+            connection.execute(text("CREATE TABLE cubecana_cubes (pk INTEGER PRIMARY KEY, popularity INTEGER, last_updated_epoch_seconds INTEGER, trendiness DOUBLE)"))
+            connection.execute(text("INSERT INTO cubecana_cubes VALUES (:pk, :popularity, :last_updated_epoch_seconds, :trendiness)"), [
+                # updated a day ago and already decayed to popularity / 2
+                {'pk': 1, 'popularity': 10, 'last_updated_epoch_seconds': NOW_EPOCH_SECONDS - SECONDS_PER_DAY, 'trendiness': 5.0},
+                # crossed into its third day since the last recompute
+                {'pk': 2, 'popularity': 12, 'last_updated_epoch_seconds': NOW_EPOCH_SECONDS - 2 * SECONDS_PER_DAY, 'trendiness': 6.0},
+                {'pk': 3, 'popularity': 8, 'last_updated_epoch_seconds': NOW_EPOCH_SECONDS, 'trendiness': None},
+                {'pk': 4, 'popularity': 0, 'last_updated_epoch_seconds': NOW_EPOCH_SECONDS - SECONDS_PER_DAY, 'trendiness': 0.0},
+            ])
+        self.engine = engine
+        patch = mock.patch.object(cube_dao, 'get_session', side_effect=sessionmaker(engine))
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def trendiness_by_pk(self) -> dict[int, float]:
+        with self.engine.connect() as connection:
+            return dict(connection.execute(text("SELECT pk, trendiness FROM cubecana_cubes")).all())
+
+    def test_only_rows_whose_trendiness_changed_are_written(self):
+        self.assertEqual(cube_dao.recompute_trendiness(), 2)
+        self.assertEqual(self.trendiness_by_pk(), {1: 5.0, 2: 4.0, 3: 8.0, 4: 0.0})
+        self.assertEqual(cube_dao.recompute_trendiness(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
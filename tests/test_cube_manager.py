@@ -0,0 +1,119 @@
+import base64
+import json
+import unittest
+import uuid
+from unittest import mock
+from cubecana_server import api
+from cubecana_server.card import toPrintingId
+from cubecana_server.card_list_helper import CardListParseResult
+from cubecana_server.cube_dao import DbCubecanaCube
+from cubecana_server.cube_manager import cube_manager, CubeManager
+from cubecana_server.lcc_error import InvalidCursorError
+from cubecana_server.lorcast_api import CardDataChange
+
+def forge_cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+class TestCubeCursor(unittest.TestCase):
+    def test_round_trip(self):
+        for sort, sort_value in [(api.SortType.TRENDING, 1.5), (api.SortType.RANK, 12), (api.SortType.DATE, 1700000000), (api.SortType.TRENDING, None)]:
+            with self.subTest(sort=sort, sort_value=sort_value):
+                cursor = cube_manager.encode_cursor(sort, (sort_value, 7))
+                self.assertEqual(cube_manager.decode_cursor(cursor, sort), (sort_value, 7))
+
+    def test_malformed_cursor_is_rejected(self):
+        malformed_cursors = [
+            (api.SortType.TRENDING, forge_cursor(["trending", {}, 1])),
+            (api.SortType.TRENDING, forge_cursor(["trending", "1.5", 1])),
+            (api.SortType.TRENDING, forge_cursor(["trending", 1.5, "1"])),
+            (api.SortType.RANK, forge_cursor(["rank", [3], 1])),
+            (api.SortType.DATE, forge_cursor(["date", 1.5, 1])),
+            (api.SortType.DATE, forge_cursor(["date", True, 1])),
+            (api.SortType.TRENDING, forge_cursor(["rank", 3, 1])),
+            (api.SortType.TRENDING, 'not a cursor'),
+        ]
+        for sort, cursor in malformed_cursors:
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(InvalidCursorError):
+                    cube_manager.decode_cursor(cursor, sort)
+
+def db_cube(cube_id: str, card_id_to_count: dict[str, int]) -> DbCubecanaCube:
+    return DbCubecanaCube(id=uuid.UUID(cube_id).bytes, name="Test Cube", card_id_to_count=json.dumps(card_id_to_count), tags=[], link=None,
+                          author="tester", last_updated_epoch_seconds=0, edit_secret="secret", boosters_per_player=4, cards_per_booster=12,
+                          set_card_colors=False, color_balance_packs=False, with_replacement=False, power_band="MAX",
+                          card_list_views=0, page_views=0, drafts=0, featured_card_printing=None, cube_description="")
+
+class FakeCubeDao:
+    """In-memory rows, before_read runs while a row is being read to interleave a concurrent write"""
+    def __init__(self):
+        self.rows: dict[bytes, DbCubecanaCube] = {}
+        self.before_read = None
+
+    def get_cubecana_cube_by_id(self, cube_id: bytes) -> DbCubecanaCube:
+        row = self.rows.get(cube_id)
+        if self.before_read:
+            before_read, self.before_read = self.before_read, None
+            before_read()
+        return row
+
+    def update_cubecana_cube(self, cube_id: bytes, updated_cube: DbCubecanaCube):
+        self.rows[cube_id] = updated_cube
+
+    def delete_cubecana_cube(self, cube_id: bytes):
+        del self.rows[cube_id]
+
+class TestCubeCache(unittest.TestCase):
+    CUBE_ID = str(uuid.uuid4())
+    OLD_CARDS = {"old_card-1-1": 2}
+    NEW_CARDS = {"new_card-2-2": 3}
+
+    def setUp(self):
+        self.cube_dao = FakeCubeDao()
+        self.cube_dao.rows[uuid.UUID(self.CUBE_ID).bytes] = db_cube(self.CUBE_ID, self.OLD_CARDS)
+        patches = [mock.patch('cubecana_server.cube_manager.cube_dao', self.cube_dao),
+                   mock.patch('cubecana_server.cube_manager.cube_counter_buffer')]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.cube_manager = CubeManager()
+
+    def update_cube(self):
+        edit_request = api.EditCubeRequest(id=self.CUBE_ID, name="Test Cube", cardListText="", tags=[], link=None, author="tester",
+                                           featuredCardPrintingId=None, cubeDescription="", cubeSettings=api.CubeSettings(4, 12, "MAX"))
+        printing_id_to_count = {toPrintingId(printing_id): count for printing_id, count in self.NEW_CARDS.items()}
+        self.cube_manager.update_cube(edit_request, CardListParseResult(printing_id_to_count, [], []))
+
+    def card_ids(self, cube) -> set[str]:
+        return {printing_id.card_id for printing_id in cube.printing_id_to_count}
+
+    def test_view_after_update_does_not_write_back_the_old_cube(self):
+        viewed_cube = self.cube_manager.get_cube(self.CUBE_ID)
+        self.update_cube()
+        self.cube_manager.increment_counter(viewed_cube, 'page_views')
+        self.assertEqual(self.card_ids(self.cube_manager.get_cube(self.CUBE_ID)), {"new_card"})
+
+    def test_miss_racing_an_update_is_not_cached(self):
+        self.cube_dao.before_read = self.update_cube
+        self.assertEqual(self.card_ids(self.cube_manager.get_cube(self.CUBE_ID)), {"old_card"})
+        self.assertEqual(self.card_ids(self.cube_manager.get_cube(self.CUBE_ID)), {"new_card"})
+
+    def test_view_after_delete_does_not_bring_the_cube_back(self):
+        viewed_cube = self.cube_manager.get_cube(self.CUBE_ID)
+        self.cube_manager.delete_cube(self.CUBE_ID, "secret")
+        self.cube_manager.increment_counter(viewed_cube, 'page_views')
+        self.assertIsNone(self.cube_manager.get_cube(self.CUBE_ID))
+
+    def test_card_data_change_drops_cached_cubes(self):
+        self.cube_manager.get_cube(self.CUBE_ID)
+        self.cube_dao.rows[uuid.UUID(self.CUBE_ID).bytes] = db_cube(self.CUBE_ID, self.NEW_CARDS)
+        self.cube_manager.on_card_data_change(CardDataChange(1, frozenset(['new_card']), full_reload=False))
+        self.assertEqual(self.card_ids(self.cube_manager.get_cube(self.CUBE_ID)), {"new_card"})
+
+    def test_views_are_counted_on_the_cached_cube(self):
+        self.cube_manager.get_cube(self.CUBE_ID)
+        self.cube_manager.increment_page_views(self.CUBE_ID)
+        self.cube_manager.increment_page_views(self.CUBE_ID)
+        self.assertEqual(self.cube_manager.get_cube(self.CUBE_ID).page_views, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+import uuid
+from unittest import mock
+from cubecana_server.card import toPrintingId
+from cubecana_server.cubealytics import CardPopularityStore
+from cubecana_server.cube_manager import CubeListRecord
+from cubecana_server.cubecana_cube import CubecanaCube
+from cubecana_server.settings import Settings, POWER_BAND_MAX, POWER_BAND_RETAIL
+
+def make_cube(cube_id: str, card_id_to_count: dict[str, int], last_updated_epoch_seconds: int, power_band: str = POWER_BAND_MAX) -> CubecanaCube:
+    return CubecanaCube(name="Test Cube", printing_id_to_count={toPrintingId(f"{card_id}-1-1"): count for card_id, count in card_id_to_count.items()},
+                        tags=[], link=None, author="tester", last_updated_epoch_seconds=last_updated_epoch_seconds, id=cube_id,
+                        edit_secret="secret", settings=Settings(power_band=power_band))
+
+def to_record(cube: CubecanaCube) -> CubeListRecord:
+    return CubeListRecord(cube.id, cube.printing_id_to_count, cube.tags, cube.settings.power_band, cube.last_updated_epoch_seconds)
+
+class FakeCubeManager:
+    """Serves records of cubes, while_reading runs after the first record is read to interleave cube changes"""
+    def __init__(self, cubes: list[CubecanaCube]):
+        self.cubes = cubes
+        self.while_reading = None
+
+    def iter_cube_list_records(self, tags, power_bands):
+        for index in range(len(self.cubes)):
+            if index == 1 and self.while_reading:
+                self.while_reading()
+            if self.cubes[index] is not None:
+                yield to_record(self.cubes[index])
+
+class TestCardPopularityStore(unittest.TestCase):
+    def setUp(self):
+        self.first_cube = make_cube(str(uuid.uuid4()), {'elsa': 2}, 10)
+        self.second_cube = make_cube(str(uuid.uuid4()), {'elsa': 1, 'moana': 3}, 10)
+        self.cube_manager = FakeCubeManager([self.first_cube, self.second_cube])
+        patch = mock.patch('cubecana_server.cubealytics.cube_manager', self.cube_manager)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.store = CardPopularityStore([POWER_BAND_MAX])
+
+    def assert_counts(self, id_to_num_copies_in_cubes: dict[str, int], id_to_num_cubes_containing: dict[str, int], num_cubes: int):
+        report = self.store.generate_card_popularity_report()
+        self.assertEqual(report.id_to_num_copies_in_cubes, id_to_num_copies_in_cubes)
+        self.assertEqual(report.id_to_num_cubes_containing, id_to_num_cubes_containing)
+        self.assertEqual(self.store.num_cubes, num_cubes)
+
+    def test_seed(self):
+        self.assert_counts({'elsa': 3, 'moana': 3}, {'elsa': 2, 'moana': 1}, 2)
+
+    def test_changes_after_seed_apply_as_deltas(self):
+        self.store.seed_if_needed()
+        updated_cube = make_cube(self.second_cube.id, {'moana': 1}, 20)
+        self.store.handle_cube_change(self.second_cube, updated_cube)
+        self.store.handle_cube_change(self.first_cube, make_cube(self.first_cube.id, {'elsa': 2}, 20, POWER_BAND_RETAIL))
+        self.assert_counts({'moana': 1}, {'moana': 1}, 1)
+
+    def test_change_the_seed_already_read_is_not_counted_twice(self):
+        updated_cube = make_cube(self.second_cube.id, {'moana': 1}, 20)
+        def update_second_cube():
+            # committed before the seed reads the second cube, notified while it's still seeding
+            self.cube_manager.cubes[1] = updated_cube
+            self.store.handle_cube_change(self.second_cube, updated_cube)
+        self.cube_manager.while_reading = update_second_cube
+        self.assert_counts({'elsa': 2, 'moana': 1}, {'elsa': 1, 'moana': 1}, 2)
+
+    def test_change_after_the_seed_read_the_cube_is_applied(self):
+        updated_cube = make_cube(self.first_cube.id, {'moana': 1}, 20)
+        def update_first_cube():
+            self.cube_manager.cubes[0] = updated_cube
+            self.store.handle_cube_change(self.first_cube, updated_cube)
+        self.cube_manager.while_reading = update_first_cube
+        self.assert_counts({'elsa': 1, 'moana': 4}, {'elsa': 1, 'moana': 2}, 2)
+
+    def test_cube_created_and_deleted_during_seed(self):
+        created_cube = make_cube(str(uuid.uuid4()), {'stitch': 1}, 20)
+        def create_and_delete():
+            self.store.handle_cube_change(None, created_cube)
+            self.store.handle_cube_change(created_cube, None)
+        self.cube_manager.while_reading = create_and_delete
+        self.assert_counts({'elsa': 3, 'moana': 3}, {'elsa': 2, 'moana': 1}, 2)
+
+    def test_delete_the_seed_already_missed_is_not_subtracted(self):
+        def delete_second_cube():
+            self.cube_manager.cubes[1] = None
+            self.store.handle_cube_change(self.second_cube, None)
+        self.cube_manager.while_reading = delete_second_cube
+        self.assert_counts({'elsa': 2}, {'elsa': 1}, 1)
+
+if __name__ == '__main__':
+    unittest.main()
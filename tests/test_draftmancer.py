@@ -0,0 +1,28 @@
+import unittest
+from pathlib import Path
+from cubecana_server import draftmancer
+from cubecana_server.startup import startup
+
+RETAIL_SETS_DIR_PATH = 'inputs/retail_sets'
+
+class TestRetailDraftmancerText(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        startup.run(['lorcast_api'])
+
+    def test_every_slot_line_names_a_custom_card(self):
+        for retail_set_file in sorted(Path(RETAIL_SETS_DIR_PATH).glob('*.draftmancer.txt')):
+            with self.subTest(retail_set=retail_set_file.name):
+                text = draftmancer.read_draftmancer_file(str(retail_set_file)).text_contents
+                served = draftmancer.read_draftmancer_file_as_string(text)
+                custom_card_printings = {(custom_card['name'], custom_card['set'], custom_card['collector_number'])
+                                         for custom_card in served.printing_id_to_custom_card.values()}
+                for line in text.split('\n'):
+                    if not line or not line[0].isdigit():
+                        continue
+                    name_and_set, _, collector_number = line.split(' ', 1)[1].rpartition(' ')
+                    name, _, set_code = name_and_set.rpartition(' ')
+                    self.assertIn((name, set_code[1:-1], collector_number), custom_card_printings, line)
+
+if __name__ == '__main__':
+    unittest.main()
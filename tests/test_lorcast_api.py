@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+from cubecana_server import card_snapshot
+from cubecana_server import lorcast_api
+from cubecana_server.lorcast_api import LorcastApi
+
+CACHED_API_DATA_FILEPATH = 'inputs/lorcast_api_cache/lorcast_api_data_cache.json'
+
+class TestCardSnapshot(unittest.TestCase):
+    def setUp(self):
+        temp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, temp_dir, ignore_errors=True)
+        self.cached_api_data_file = temp_dir / 'lorcast_api_data_cache.json'
+        shutil.copyfile(CACHED_API_DATA_FILEPATH, self.cached_api_data_file)
+        self.snapshot_file = temp_dir / 'lorcast_api_data_cache.snapshot'
+        patches = [mock.patch.object(lorcast_api, 'CARD_SNAPSHOT_FILEPATH', str(self.snapshot_file)),
+                   mock.patch.object(lorcast_api, 'CACHED_API_MANIFEST_FILEPATH', str(temp_dir / 'lorcast_api_manifest.json'))]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.lorcast_api = LorcastApi()
+
+    def read_snapshot(self):
+        return card_snapshot.read_snapshot(self.snapshot_file, self.lorcast_api.card_snapshot_source_files(self.cached_api_data_file))
+
+    def test_snapshot_round_trips_the_card_data(self):
+        self.lorcast_api.load_api_cache_from_disk(self.cached_api_data_file)
+        id_to_api_card = self.read_snapshot()
+        self.assertEqual(id_to_api_card.keys(), self.lorcast_api.id_to_api_card.keys())
+        for card_id, api_card in id_to_api_card.items():
+            self.assertEqual(api_card.__dict__, self.lorcast_api.id_to_api_card[card_id].__dict__)
+
+    def test_unchanged_refresh_keeps_the_snapshot_valid(self):
+        # a day old cache, refreshed to identical data
+        os.utime(self.cached_api_data_file, (0, 0))
+        self.lorcast_api.load_api_cache_from_disk(self.cached_api_data_file)
+        self.assertIsNotNone(self.read_snapshot())
+        printings = self.lorcast_api.read_cached_printings(self.cached_api_data_file)
+        with mock.patch.object(self.lorcast_api, 'fetch_all_api_data', return_value=(printings, {}, set())) as fetch_all_api_data:
+            self.lorcast_api._refresh_api_data_cache_if_needed(self.cached_api_data_file)
+            self.lorcast_api._refresh_api_data_cache_if_needed(self.cached_api_data_file)
+        self.assertEqual(fetch_all_api_data.call_count, 1)
+        self.assertIsNotNone(self.read_snapshot())
+
+if __name__ == '__main__':
+    unittest.main()
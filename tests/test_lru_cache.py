@@ -0,0 +1,59 @@
+import unittest
+from unittest import mock
+from cubecana_server.lru_cache import LruCache
+
+class TestLruCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LruCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+
+    def test_entries_expire_after_ttl(self):
+        with mock.patch('cubecana_server.lru_cache.time.monotonic', return_value=100.0) as monotonic:
+            cache = LruCache(4, ttl_seconds=10)
+            cache.put('a', 1)
+            monotonic.return_value = 111.0
+            self.assertIsNone(cache.get('a'))
+
+    def test_update_keeps_the_entry_age(self):
+        with mock.patch('cubecana_server.lru_cache.time.monotonic', return_value=100.0) as monotonic:
+            cache = LruCache(4, ttl_seconds=10)
+            cache.put('a', 1)
+            monotonic.return_value = 109.0
+            self.assertTrue(cache.update('a', lambda value: value + 1))
+            monotonic.return_value = 111.0
+            self.assertIsNone(cache.get('a'))
+
+    def test_update_does_not_recreate_a_missing_entry(self):
+        cache = LruCache(4)
+        self.assertFalse(cache.update('a', lambda value: value + 1))
+        self.assertIsNone(cache.get('a'))
+
+    def test_put_read_before_an_invalidation_is_dropped(self):
+        cache = LruCache(4)
+        read_generation = cache.generation()
+        cache.invalidate('a')
+        self.assertFalse(cache.put('a', 'stale', read_generation))
+        self.assertIsNone(cache.get('a'))
+        self.assertTrue(cache.put('b', 'fresh', read_generation))
+        self.assertTrue(cache.put('a', 'fresh', cache.generation()))
+
+    def test_forgotten_invalidations_drop_older_puts(self):
+        cache = LruCache(1)
+        read_generation = cache.generation()
+        cache.invalidate('a')
+        cache.invalidate('b')
+        self.assertFalse(cache.put('a', 'stale', read_generation))
+
+    def test_clear_drops_puts_read_before_it(self):
+        cache = LruCache(4)
+        read_generation = cache.generation()
+        cache.clear()
+        self.assertFalse(cache.put('a', 'stale', read_generation))
+
+if __name__ == '__main__':
+    unittest.main()